@@ -3,10 +3,18 @@ from __future__ import annotations
 import pendulum
 from airflow.decorators import dag, task
 
-# With PYTHONPATH=/opt/airflow set in docker-compose, this should work directly.
-from niftron.ingestion import main as ingestion_main
-from niftron.processing import main as processing_main
-from niftron.analysis import main as analysis_main
+# With PYTHONPATH=/opt/airflow set in docker-compose, niftron imports directly.
+# The scheduler re-parses this file every few seconds, so pipeline modules
+# (pandas, sklearn, yfinance, ...) are only imported inside the tasks.
+
+def _run_stage(task_id: str, module: str):
+    """Runs a pipeline module's run() with its timings logged as JSON under the task id."""
+    import importlib
+    from niftron.core.metrics import bind_context, span
+
+    bind_context(dag_id="niftron_daily_pipeline", task_id=task_id)
+    with span(f"task.{task_id}"):
+        importlib.import_module(module).run()
 
 @dag(
     dag_id="niftron_daily_pipeline",
@@ -22,16 +30,20 @@ from niftron.analysis import main as analysis_main
 def niftron_daily_pipeline():
     @task()
     def ingest_data():
-        ingestion_main.run()
+        _run_stage("ingest_data", "niftron.ingestion.main")
 
     @task()
     def process_features():
-        processing_main.run()
+        _run_stage("process_features", "niftron.processing.main")
 
     @task()
     def analyze_and_rank():
-        analysis_main.run()
+        _run_stage("analyze_and_rank", "niftron.analysis.main")
+
+    @task()
+    def refresh_backtest():
+        _run_stage("refresh_backtest", "niftron.analysis.backtest")
 
-    ingest_data() >> process_features() >> analyze_and_rank()
+    ingest_data() >> process_features() >> analyze_and_rank() >> refresh_backtest()
 
 niftron_daily_pipeline()
\ No newline at end of file
@@ -101,4 +101,75 @@ INSERT INTO stocks (symbol, company_name) VALUES
     ('ULTRACEMCO', 'UltraTech Cement Ltd.'),
     ('UPL', 'UPL Ltd.'),
     ('WIPRO', 'Wipro Ltd.')
-ON CONFLICT (symbol) DO NOTHING; 
\ No newline at end of file
+ON CONFLICT (symbol) DO NOTHING; 
+
+-- Persisted indicator state used by incremental feature processing.
+-- Buffers are stored oldest first; rolling_state holds the running-sum
+-- accumulators of each rolling window (SMA-50/200, RSI gain/loss means).
+CREATE TABLE IF NOT EXISTS feature_state (
+    stock_id INTEGER PRIMARY KEY REFERENCES stocks(stock_id),
+    last_date DATE NOT NULL,
+    closes DOUBLE PRECISION[] NOT NULL,
+    gains DOUBLE PRECISION[] NOT NULL,
+    losses DOUBLE PRECISION[] NOT NULL,
+    rolling_state JSONB NOT NULL,
+    ema_12 DOUBLE PRECISION NOT NULL,
+    ema_26 DOUBLE PRECISION NOT NULL,
+    macd_signal DOUBLE PRECISION NOT NULL,
+    full_recompute_at DATE NOT NULL
+);
+
+-- Precomputed backtest outputs. A run is identified by the model file hash,
+-- the features watermark (MAX(date) in features) and the out-of-sample start;
+-- the API only reads these. New trading days are appended to the run of the
+-- current model; running_state carries each strategy's equity, peak and max
+-- drawdown so appends never rescan the whole series.
+CREATE TABLE IF NOT EXISTS backtest_runs (
+    run_id SERIAL PRIMARY KEY,
+    model_hash CHAR(64) NOT NULL,
+    data_watermark DATE NOT NULL,
+    oos_start DATE NOT NULL,
+    running_state JSONB,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    UNIQUE (model_hash, data_watermark, oos_start)
+);
+
+-- Daily portfolio returns of each strategy for one backtest run.
+CREATE TABLE IF NOT EXISTS backtest_returns (
+    run_id INTEGER NOT NULL REFERENCES backtest_runs(run_id) ON DELETE CASCADE,
+    date DATE NOT NULL,
+    lem_return DOUBLE PRECISION NOT NULL,
+    she_return DOUBLE PRECISION NOT NULL,
+    benchmark_return DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (run_id, date)
+);
+
+-- Background jobs submitted through the API (e.g. run-analysis). At most one
+-- job per kind may be queued or running; a duplicate submission joins it.
+-- heartbeat_at is bumped while a job runs so one whose worker died can be
+-- detected and failed.
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id UUID PRIMARY KEY,
+    kind VARCHAR(50) NOT NULL,
+    state VARCHAR(20) NOT NULL DEFAULT 'queued',
+    submitted_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    started_at TIMESTAMPTZ,
+    heartbeat_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ,
+    worker VARCHAR(100),
+    error TEXT
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_one_active_per_kind
+    ON jobs (kind) WHERE state IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS jobs_queued ON jobs (submitted_at) WHERE state = 'queued';
+
+-- The earliest date each price or feature upsert wrote, logged in the same
+-- transaction. The training dataset cache compares change_ids to tell newly
+-- appended days from revised history without hashing the tables.
+CREATE TABLE IF NOT EXISTS data_changes (
+    change_id BIGSERIAL PRIMARY KEY,
+    table_name VARCHAR(50) NOT NULL,
+    changed_from DATE NOT NULL,
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
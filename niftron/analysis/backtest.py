@@ -1,73 +1,197 @@
+import datetime
 import pandas as pd
-import joblib
-import os
-from cachetools import cached, TTLCache
+from typing import NamedTuple
 from niftron.ml_model.data_prep import load_and_prepare_data
-from niftron.ml_model.predict import generate_lem_score
-from niftron.analysis.performance import calculate_performance_metrics
-simulation_cache = TTLCache(maxsize=1, ttl=43200)
-cache = TTLCache(maxsize=1, ttl=43200)
+from niftron.ml_model.predict import generate_lem_score, current_model_hash, load_scorer
+from niftron.analysis.performance import calculate_performance_metrics, update_running_stats
+from niftron.analysis.simulation import benchmark_returns, calculate_she_score, simulate
+from niftron.core.cache import SingleFlightCache
+from niftron.core.config import settings
+from niftron.core.jobs import run_job, submit_job
+from niftron.core.metrics import span
+from niftron.core.profiling import profiled
+from niftron.data_access.backtests import (
+    append_backtest_returns, get_features_watermark, get_latest_backtest_run,
+    load_backtest_returns, save_backtest_run
+)
 
+OOS_START = datetime.date(2023, 1, 1)
+# Calendar days loaded before the first appended date so crossovers see the previous bar.
+APPEND_WARMUP_DAYS = 14
+STRATEGIES = {'lem': 'lem_return', 'she': 'she_return', 'benchmark': 'benchmark_return'}
 
+# Which stored run is current: re-checked against the DB after the TTL, served
+# stale while one thread does so. A run's returns only change when its
+# watermark does, so they are cached by (run_id, watermark) for much longer.
+latest_run_cache = SingleFlightCache(
+    'backtest_latest_run', ttl=settings.BACKTEST_CACHE_TTL_SECONDS,
+    stale_ttl=settings.BACKTEST_CACHE_STALE_SECONDS, maxsize=4,
+)
+run_returns_cache = SingleFlightCache('backtest_run_returns', ttl=settings.BACKTEST_CACHE_STALE_SECONDS, maxsize=2)
 
-def calculate_she_score(signals_df: pd.DataFrame) -> pd.DataFrame:
-    weights = {'trend': 0.4, 'momentum': 0.3, 'macd': 0.3}
-    norm_trend = (signals_df['trend_signal'] + 1) * 50
-    score = (norm_trend * weights['trend'] + signals_df['momentum_score'] * weights['momentum'] + signals_df['macd_score'] * weights['macd'])
-    return pd.DataFrame({'she_score': score}, index=signals_df.index)
 
-def run_simulation_loop(oos_data: pd.DataFrame, score_column: str, portfolio_size: int = 5) -> pd.Series:
-    daily_returns = {}
-    unique_dates = sorted(oos_data.index.get_level_values('date').unique())
+class StoredRun(NamedTuple):
+    key: tuple
+    returns: pd.DataFrame
+    running_state: dict
+    # True when the run belongs to another model than the current one,
+    # served while the current model's run is being computed.
+    stale: bool = False
 
-    for date in unique_dates:
-        day_data = oos_data.loc[date]
-        if not isinstance(day_data, pd.DataFrame) or len(day_data) < portfolio_size:
-            daily_returns[date] = 0
-            continue
-        top_stocks = day_data.nlargest(portfolio_size, score_column)
-        day_return = top_stocks['daily_return'].mean()
-        daily_returns[date] = day_return
-    return pd.Series(daily_returns).fillna(0)
+class BacktestUnavailable(RuntimeError):
+    """No backtest has been stored yet; one is being computed in the background."""
 
 
-# --- MAIN FUNCTION FOR API (NOW CACHED) ---
-
-# --- ADD THIS DECORATOR ---
-@cached(simulation_cache)
-def run_all_simulations():
+def compute_simulations(oos_start: datetime.date = OOS_START, after_date: datetime.date = None) -> pd.DataFrame:
     """
-    Runs all simulations and returns the raw daily returns for each strategy.
-    This is the core expensive function that is now cached.
+    Runs the simulations and returns the daily returns of each strategy as
+    columns 'lem_return', 'she_return' and 'benchmark_return'.
+
+    With after_date, only trading days after it are loaded and simulated;
+    past days never change for a fixed model, so they can be appended.
     """
-    print("--- SIMULATION CACHE MISS: Running all backtest simulations... ---")
-    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
-    model_path = os.path.join(project_root, 'niftron', 'ml_model', 'lem_model.joblib')
-    
-    lem_model = joblib.load(model_path)
-    full_dataset = load_and_prepare_data()
-    test_period_start = pd.to_datetime('2023-01-01')
-    oos_data = full_dataset[full_dataset.index >= test_period_start].copy()
+    print(f"--- Running backtest simulations{f' after {after_date}' if after_date else ''}... ---")
+    lem_model = load_scorer()
+    with span('backtest.load_data', append=after_date is not None) as timer:
+        if after_date is None:
+            full_dataset = load_and_prepare_data()
+            test_period_start = pd.to_datetime(oos_start)
+            oos_data = full_dataset[full_dataset.index >= test_period_start].copy()
+        else:
+            full_dataset = load_and_prepare_data(start_date=after_date - datetime.timedelta(days=APPEND_WARMUP_DAYS))
+            first_day = max(pd.to_datetime(oos_start), pd.to_datetime(after_date) + pd.Timedelta(days=1))
+            oos_data = full_dataset[full_dataset.index >= first_day].copy()
+        timer.rows = len(oos_data)
+    if oos_data.empty:
+        return pd.DataFrame(columns=list(STRATEGIES.values()), dtype='float64')
 
     she_scores = calculate_she_score(oos_data)
-    lem_scores = generate_lem_score(lem_model, oos_data)
+    with span('backtest.lem_inference') as timer:
+        lem_scores = generate_lem_score(lem_model, oos_data)
+        timer.rows = len(oos_data)
     oos_data = pd.concat([oos_data, she_scores, lem_scores], axis=1)
 
-    lem_returns = run_simulation_loop(oos_data, 'lem_score')
-    she_returns = run_simulation_loop(oos_data, 'she_score')
-    benchmark_returns = oos_data.groupby('date')['daily_return'].mean().fillna(0)
-    
-    return lem_returns, she_returns, benchmark_returns
+    with span('backtest.simulation') as timer:
+        daily_returns = simulate(oos_data, ['lem_score', 'she_score'])
+        timer.rows = len(oos_data)
+    return pd.DataFrame({
+        'lem_return': daily_returns['lem_score'],
+        'she_return': daily_returns['she_score'],
+        'benchmark_return': benchmark_returns(oos_data),
+    })
+
+def advance_running_state(running_state: dict, returns_df: pd.DataFrame) -> dict:
+    """Advances each strategy's equity, peak and max drawdown by new daily returns."""
+    return {
+        name: update_running_stats((running_state or {}).get(name), returns_df[column])
+        for name, column in STRATEGIES.items()
+    }
+
+def refresh_backtest_results(force: bool = False) -> int:
+    """
+    Brings the stored backtest up to date. Meant for the pipeline, after
+    analysis, so API requests only ever read stored results.
+
+    A new model (or force) rebuilds the run from scratch; a newer features
+    watermark for the same model only simulates and appends the new days.
+
+    Returns:
+        int: The run_id that is current after the refresh.
+    """
+    model_hash = current_model_hash()
+    watermark = get_features_watermark()
+    latest = get_latest_backtest_run(model_hash, OOS_START)
+    if not force and latest and latest['data_watermark'] == watermark:
+        print(f"Backtest run {latest['run_id']} is up to date (watermark {watermark}).")
+        return latest['run_id']
+
+    if force or latest is None or latest['last_date'] is None:
+        returns_df = compute_simulations(OOS_START)
+        with span('backtest.db_write', mode='rebuild') as timer:
+            run_id = save_backtest_run(model_hash, watermark, OOS_START, returns_df,
+                                       advance_running_state({}, returns_df))
+            timer.rows = len(returns_df)
+        print(f"Stored backtest run {run_id} ({len(returns_df)} days, watermark {watermark}).")
+        return run_id
+
+    run_id = latest['run_id']
+    returns_df = compute_simulations(OOS_START, after_date=latest['last_date'])
+    with span('backtest.db_write', mode='append') as timer:
+        appended = append_backtest_returns(run_id, watermark, returns_df,
+                                           advance_running_state(latest['running_state'], returns_df))
+        timer.rows = appended
+    print(f"Appended {appended} days to backtest run {run_id} (watermark {watermark}).")
+    return run_id
+
+# --- MAIN FUNCTION FOR API (READS STORED RESULTS) ---
+
+def _find_current_run() -> dict:
+    model_hash = current_model_hash()
+    latest = get_latest_backtest_run(model_hash, OOS_START)
+    if latest is not None:
+        return {**latest, 'stale': False}
+
+    # Never simulated inside a request: queue the refresh (joined if one is
+    # already queued or running) and serve the newest run of any model meanwhile.
+    job, created = submit_job('refresh_backtest')
+    print(f"--- No stored backtest for this model; {'queued' if created else 'joined'} job {job['job_id']}. ---")
+    latest = get_latest_backtest_run(None, OOS_START)
+    if latest is None:
+        raise BacktestUnavailable("No backtest has been stored yet; it is being computed.")
+    return {**latest, 'stale': True}
+
+def load_current_run() -> StoredRun:
+    """
+    Returns the latest stored backtest run for the current model. Nothing is
+    simulated here: without a run for this model, a refresh job is queued and
+    the newest stored run of another model is returned marked stale, or
+    BacktestUnavailable raised if none was ever stored.
+    """
+    # Keyed by the model hash so a swapped model file is picked up at once.
+    latest = latest_run_cache.get(current_model_hash(), _find_current_run)
+    # A run is extended in place, so its watermark is part of the key.
+    key = (latest['run_id'], latest['data_watermark'])
+    returns_df = run_returns_cache.get(key, lambda: load_backtest_returns(latest['run_id']))
+    return StoredRun(key, returns_df, latest['running_state'], latest['stale'])
+
+def refresh_backtest_job() -> None:
+    """Job handler for 'refresh_backtest': refreshes, then drops this process's stale view."""
+    refresh_backtest_results()
+    latest_run_cache.invalidate()
+
+def run_all_simulations():
+    """Returns the raw daily returns (lem, she, benchmark) of the current stored run."""
+    returns_df = load_current_run().returns
+    return returns_df['lem_return'], returns_df['she_return'], returns_df['benchmark_return']
 
 # --- UPDATED FUNCTION FOR PERFORMANCE ENDPOINT ---
 def get_backtest_results() -> dict:
     """
-    Calculates performance metrics based on the cached simulation results.
+    Calculates performance metrics based on the stored simulation results.
+    'stale' is True while they come from another model's run.
+    """
+    _, returns_df, running_state, stale = load_current_run()
+    lem_returns, she_returns, benchmark_returns = (
+        returns_df['lem_return'], returns_df['she_return'], returns_df['benchmark_return']
+    )
+
+    lem_metrics = calculate_performance_metrics(lem_returns, benchmark_returns, running_state.get('lem'))
+    she_metrics = calculate_performance_metrics(she_returns, benchmark_returns, running_state.get('she'))
+    benchmark_metrics = calculate_performance_metrics(benchmark_returns, benchmark_returns, running_state.get('benchmark'))
+
+    return { "lem": lem_metrics, "she": she_metrics, "benchmark": benchmark_metrics, "stale": stale }
+
+@profiled('backtest_refresh')
+def run():
+    """
+    Entry point for Airflow to refresh the stored backtest after analysis,
+    as a 'refresh_backtest' job so it never overlaps one queued by the API.
     """
-    lem_returns, she_returns, benchmark_returns = run_all_simulations()
+    print("Starting Niftron Backtest Refresh...")
+    with span('backtest'):
+        run_job('refresh_backtest')
+    print("Niftron Backtest Refresh Finished.")
 
-    lem_metrics = calculate_performance_metrics(lem_returns, benchmark_returns)
-    she_metrics = calculate_performance_metrics(she_returns, benchmark_returns)
-    benchmark_metrics = calculate_performance_metrics(benchmark_returns, benchmark_returns)
-    
-    return { "lem": lem_metrics, "she": she_metrics, "benchmark": benchmark_metrics }
+if __name__ == "__main__":
+    import sys
+    profiled('backtest_refresh')(refresh_backtest_results)(force="--force" in sys.argv)
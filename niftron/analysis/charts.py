@@ -0,0 +1,93 @@
+# niftron/analysis/charts.py
+
+import datetime
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Chart.js series, in display order: (returns column, label, colour).
+CHART_SERIES = [
+    ('lem_return', 'Learned Ensemble (LEM)', '#3b82f6'),
+    ('she_return', 'Simple Heuristic (SHE)', '#10b981'),
+    ('benchmark_return', 'NIFTY 50 Benchmark', '#6b7280'),
+]
+
+
+def equity_curves(returns: pd.DataFrame) -> pd.DataFrame:
+    """Growth of 1 unit invested at the first date, per strategy."""
+    return (1 + returns).cumprod()
+
+def drawdown_curves(returns: pd.DataFrame) -> pd.DataFrame:
+    """Percentage below the running peak equity, per strategy (0 at new highs)."""
+    cumulative = equity_curves(returns)
+    return (cumulative / cumulative.cummax() - 1) * 100
+
+def lttb_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling of an evenly spaced series.
+
+    Keeps the first and last points and, from each of n_out - 2 buckets in
+    between, the point forming the largest triangle with the previously kept
+    point and the average of the next bucket, which preserves peaks, troughs
+    and the overall shape far better than taking every k-th point.
+
+    Returns:
+        np.ndarray: Sorted positions of the kept points.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    y = np.asarray(y, dtype='float64')
+    x = np.arange(n, dtype='float64')
+    every = (n - 2) / (n_out - 2)
+    kept = np.empty(n_out, dtype='int64')
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        avg_start = int(np.floor((i + 1) * every)) + 1
+        avg_end = min(int(np.floor((i + 2) * every)) + 1, n)
+        avg_x = x[avg_start:avg_end].mean()
+        avg_y = y[avg_start:avg_end].mean()
+
+        start = int(np.floor(i * every)) + 1
+        end = int(np.floor((i + 1) * every)) + 1
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        kept[i + 1] = a
+    return kept
+
+def downsample(curves: pd.DataFrame, max_points: Optional[int]) -> pd.DataFrame:
+    """
+    Reduces curves sharing one x-axis to at most max_points rows. Each
+    column gets an equal share of the budget and the rows picked by LTTB
+    for any column are kept, so every series keeps its own shape.
+    """
+    if not max_points or len(curves) <= max_points:
+        return curves
+    budget = max(3, max_points // max(1, curves.shape[1]))
+    kept = np.unique(np.concatenate([lttb_indices(curves[col].to_numpy(), budget) for col in curves]))
+    return curves.iloc[kept]
+
+def build_chart(returns: pd.DataFrame, kind: str = 'equity', start: datetime.date = None,
+                end: datetime.date = None, max_points: int = None) -> dict:
+    """
+    Chart.js data for the equity or drawdown curves of a stored run.
+
+    With start/end, only returns inside the range are used, so the curves
+    start at 1 (equity) or 0 (drawdown) on the first day shown.
+    """
+    if kind not in ('equity', 'drawdown'):
+        raise ValueError(f"Unknown chart kind '{kind}'.")
+    window = returns.loc[pd.Timestamp(start) if start else None:pd.Timestamp(end) if end else None]
+    columns = [column for column, _, _ in CHART_SERIES]
+    window = window[columns]
+    curves = equity_curves(window) if kind == 'equity' else drawdown_curves(window)
+    curves = downsample(curves, max_points)
+
+    datasets: List[dict] = [
+        {"label": label, "data": curves[column].to_numpy(), "borderColor": colour,
+         "tension": 0.1, "pointRadius": 0, "borderWidth": 2}
+        for column, label, colour in CHART_SERIES
+    ]
+    return {"labels": curves.index.strftime('%Y-%m-%d').tolist(), "datasets": datasets}
@@ -1,22 +1,19 @@
 # src/niftron/analysis/main.py
 
+import numpy as np
 import pandas as pd
-import traceback
 import json
-import joblib
-import os
 
+from niftron.core.bulk import copy_upsert
 from niftron.core.db import get_db_connection
+from niftron.core.jobs import run_job
+from niftron.core.metrics import span
+from niftron.core.profiling import profiled
+from niftron.core.parallel import run_sharded
+from niftron.data_access.features import get_latest_features
+from niftron.data_access.recommendations import RECOMMENDATIONS_CHANNEL
 from niftron.analysis.strategies import trend_strategy, momentum_strategy, macd_strategy
-
-project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
-model_path = os.path.join(project_root, 'niftron', 'ml_model', 'lem_model.joblib')
-try:
-    lem_model = joblib.load(model_path)
-    print("LEM model loaded successfully for analysis.")
-except FileNotFoundError:
-    lem_model = None
-    print("WARNING: lem_model.joblib not found. LEM scores will not be calculated.")
+from niftron.ml_model.predict import load_scorer, reload_model
 
 STRATEGY_WEIGHTS = {
     'trend': 0.40,
@@ -24,133 +21,121 @@ STRATEGY_WEIGHTS = {
     'macd': 0.30
 }
 
-def get_all_features():
-    """Fetches all features for all stocks from the database."""
-    print("Fetching all features from the database...")
-    query = """
-        SELECT 
-            s.stock_id, 
-            s.symbol,
-            f.date,
-            f.sma_50,
-            f.sma_200,
-            f.rsi_14,
-            f.macd_value,
-            f.macd_signal
-        FROM features f
-        JOIN stocks s ON s.stock_id = f.stock_id
-        ORDER BY s.symbol, f.date ASC;
-    """
-    # --- END OF FIX ---
+# The latest day can be scored from this many trailing bars per stock.
+ANALYSIS_LOOKBACK = max(strategy.LOOKBACK for strategy in (trend_strategy, momentum_strategy, macd_strategy))
 
+def get_stocks():
+    """Fetches (stock_id, symbol) for every stock, ordered by symbol."""
     with get_db_connection() as conn:
-        df = pd.read_sql(query, conn)
-    print(f"Successfully fetched {len(df)} total feature records.")
-    return df
+        with conn.cursor() as cur:
+            cur.execute("SELECT stock_id, symbol FROM stocks;")
+            return sorted(cur.fetchall(), key=lambda stock: stock[1])
 
-def run_analysis_and_rank():
+LEM_FEATURES = ['trend_signal', 'momentum_score', 'macd_score']
+
+def score_latest(all_features_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Runs every strategy over the stacked features of all stocks at once and
+    scores each stock's latest day with both models (SHE and LEM).
+
+    Args:
+        all_features_df (pd.DataFrame): Feature rows of many stocks, sorted by
+                                        date within each symbol.
+
+    Returns:
+        pd.DataFrame: One row per stock with its latest-day signals and scores.
+    """
+    print("\nRunning analysis strategies for all stocks...")
+    # No strategy looks further back than ANALYSIS_LOOKBACK bars.
+    df = all_features_df.groupby('symbol', sort=False).tail(ANALYSIS_LOOKBACK)
+
+    # --- Generate Base Signals ---
+    with span('analysis.strategy_scoring') as timer:
+        timer.rows = len(df)
+        signals = pd.concat([
+            trend_strategy.generate_signals(df, group_by='symbol'),
+            momentum_strategy.generate_signals(df, group_by='symbol'),
+            macd_strategy.generate_signals(df, group_by='symbol'),
+        ], axis=1)
+
+    is_last_day = ~df['symbol'].duplicated(keep='last').to_numpy()
+    latest = pd.concat([
+        df.loc[is_last_day, ['stock_id', 'symbol', 'date']],
+        signals.loc[is_last_day],
+    ], axis=1).reset_index(drop=True)
+
+    # --- Calculate SHE Score (Heuristic) ---
+    norm_trend = (latest['trend_signal'] + 1) * 50
+    latest['she_score'] = (norm_trend * STRATEGY_WEIGHTS['trend'] +
+                           latest['momentum_score'] * STRATEGY_WEIGHTS['momentum'] +
+                           latest['macd_score'] * STRATEGY_WEIGHTS['macd'])
+
+    # --- Calculate LEM Score (Machine Learning) ---
+    latest['lem_score'] = 0.0
+    # The compiled lookup table when available (same scores, no sklearn), else the model.
+    lem_model = load_scorer()
+    if lem_model is None:
+        print("WARNING: lem_model.joblib not found. LEM scores will not be calculated.")
+    elif not latest.empty:
+        with span('analysis.lem_inference') as timer:
+            # One batched call; predict_proba gives [prob_of_0, prob_of_1], we want the latter
+            latest['lem_score'] = lem_model.predict_proba(latest[LEM_FEATURES])[:, 1] * 100
+            timer.rows = len(latest)
+
+    return latest
+
+def top_k(scores, k: int):
+    """Positions of the k highest scores, best first, without a full sort."""
+    scores = np.asarray(scores, dtype='float64')
+    k = min(k, len(scores))
+    if k == 0:
+        return np.array([], dtype='int64')
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+def analyze_shard(stocks) -> pd.DataFrame:
+    """Loads and scores one shard of [(stock_id, symbol), ...] in a worker process."""
+    with span('analysis.load_features', stocks=len(stocks)) as timer:
+        features_df = get_latest_features(ANALYSIS_LOOKBACK, [stock_id for stock_id, _ in stocks])
+        timer.rows = len(features_df)
+    return score_latest(features_df)
+
+def run_analysis_and_rank(workers=None):
     """
     Runs all analysis, calculates scores for BOTH models, ensembles the results,
     ranks stocks for each model, and stores the top 5 of each.
-    """
-    all_features_df = get_all_features()
-    if all_features_df.empty:
-        print("No features found. Run processing module first.")
-        return
 
-    grouped = all_features_df.groupby('symbol')
-    latest_results = []
-
-    print("\nRunning analysis strategies for each stock...")
-    for symbol, features_df in grouped:
-        try:
-            df = features_df.set_index('date').sort_index()
-            if df.empty:
-                continue
-
-            # --- Generate Base Signals ---
-            trend_signals = trend_strategy.generate_signals(df)
-            momentum_signals = momentum_strategy.generate_signals(df)
-            macd_signals = macd_strategy.generate_signals(df)
-            
-            combined = pd.concat([trend_signals, momentum_signals, macd_signals], axis=1)
-            if combined.empty:
-                continue
-                
-            last_day = combined.iloc[-1]
-            
-            # --- Calculate SHE Score (Heuristic) ---
-            she_weights = {'trend': 0.40, 'momentum': 0.30, 'macd': 0.30}
-            norm_trend = (last_day['trend_signal'] + 1) * 50
-            she_score = (norm_trend * she_weights['trend'] + 
-                         last_day['momentum_score'] * she_weights['momentum'] + 
-                         last_day['macd_score'] * she_weights['macd'])
-            
-            # --- Calculate LEM Score (Machine Learning) ---
-            lem_score = 0
-            if lem_model:
-                features_for_lem = pd.DataFrame({
-                    'trend_signal': [last_day['trend_signal']],
-                    'momentum_score': [last_day['momentum_score']],
-                    'macd_score': [last_day['macd_score']]
-                })
-                # predict_proba gives [prob_of_0, prob_of_1], we want the latter
-                lem_probability = lem_model.predict_proba(features_for_lem)[0][1]
-                lem_score = lem_probability * 100 # Scale to 0-100
-
-            latest_results.append({
-                'stock_id': features_df['stock_id'].iloc[0],
-                'symbol': symbol,
-                'date': last_day.name,
-                'she_score': she_score,
-                'lem_score': lem_score,
-                'raw_scores': {
-                    'trend_signal': last_day['trend_signal'],
-                    'momentum_score': last_day['momentum_score'],
-                    'macd_score': last_day['macd_score']
-                }
-            })
-        except Exception:
-            print(f"--- Error processing {symbol} ---")
-            traceback.print_exc()
-
-    if not latest_results:
+    Stocks are scored in shards on a process pool (settings.PIPELINE_WORKERS);
+    ranking and storage happen here once every shard has reported back.
+    """
+    stocks = get_stocks()
+    # Long-lived callers (API, job workers) score with the registry's current model.
+    reload_model()
+    # Load the scorer before forking so shard workers inherit it instead of each loading it.
+    load_scorer()
+    sharded = run_sharded(analyze_shard, stocks, workers=workers, label="analysis shards")
+    for error in sharded.errors:
+        print(f"--- Skipped {len(error.items)} stocks from failed shard {error.index + 1} ---")
+
+    results = [shard for shard in sharded.results if not shard.empty]
+    if not results:
         print("Could not generate any results.")
         return
-
-    results_df = pd.DataFrame(latest_results)
+    results_df = pd.concat(results, ignore_index=True)
 
     # --- Rank and select Top 5 for EACH model ---
-    top_5_she = results_df.sort_values(by='she_score', ascending=False).head(5)
-    top_5_lem = results_df.sort_values(by='lem_score', ascending=False).head(5)
-
     recommendations_to_store = []
-    
-    # Prepare SHE recommendations
-    rank_counter = 1
-    for _, row in top_5_she.iterrows():
-        recommendations_to_store.append({
-            'date': row['date'],
-            'rank': rank_counter,
-            'stock_id': row['stock_id'],
-            'score': row['she_score'],
-            'model_type': 'SHE',
-            'algorithm_scores': row['raw_scores']
-        })
-        rank_counter += 1
-        
-    # Prepare LEM recommendations
-    rank_counter = 1 # Reset the counter for the second model
-    for _, row in top_5_lem.iterrows():
-        recommendations_to_store.append({
-            'date': row['date'],
-            'rank': rank_counter,
-            'stock_id': row['stock_id'],
-            'score': row['lem_score'],
-            'model_type': 'LEM',
-            'algorithm_scores': row['raw_scores']
-        })
-        rank_counter += 1
+    for model_type, score_column in (('SHE', 'she_score'), ('LEM', 'lem_score')):
+        top = results_df.iloc[top_k(results_df[score_column].to_numpy(), 5)]
+        for rank, row in enumerate(top.itertuples(index=False), start=1):
+            recommendations_to_store.append({
+                'date': row.date,
+                'rank': rank,
+                'stock_id': row.stock_id,
+                'score': getattr(row, score_column),
+                'model_type': model_type,
+                'algorithm_scores': {column: float(getattr(row, column)) for column in LEM_FEATURES}
+            })
 
     store_recommendations(pd.DataFrame(recommendations_to_store))
 
@@ -158,30 +143,41 @@ def run_analysis_and_rank():
 def store_recommendations(reco_df):
     """Saves the top recommendations for both models to the database."""
     print("\nStoring top 5 recommendations for SHE and LEM models...")
-    
-    with get_db_connection() as conn:
+
+    rows = pd.DataFrame({
+        'date': reco_df['date'].to_numpy(),
+        'rank': reco_df['rank'].to_numpy(),
+        'stock_id': reco_df['stock_id'].to_numpy().astype('int64'),
+        'score': reco_df['score'].to_numpy().astype('float64'),
+        'model_type': reco_df['model_type'].to_numpy(),
+        'algorithm_scores': [json.dumps(scores) for scores in reco_df['algorithm_scores']],
+    })
+
+    with get_db_connection() as conn, span('analysis.db_write') as timer:
+        timer.rows = len(rows)
         with conn.cursor() as cur:
             # Clear previous recommendations for the same day
             delete_query = "DELETE FROM recommendations WHERE date = %s;"
             cur.execute(delete_query, (reco_df['date'].iloc[0],))
 
-            # Insert new recommendations
-            insert_query = """
-                INSERT INTO recommendations (date, rank, stock_id, score, model_type, algorithm_scores)
-                VALUES (%s, %s, %s, %s, %s, %s);
-            """
-            insert_data = [
-                (row['date'], row['rank'], int(row['stock_id']), float(row['score']), row['model_type'], json.dumps(row['algorithm_scores']))
-                for _, row in reco_df.iterrows()
-            ]
-            cur.executemany(insert_query, insert_data)
+        # Insert new recommendations
+        copy_upsert(conn, rows, 'recommendations', list(rows.columns))
+        with conn.cursor() as cur:
+            # Delivered on commit; API workers drop their cached snapshot.
+            cur.execute("SELECT pg_notify(%s, %s);", (RECOMMENDATIONS_CHANNEL, str(reco_df['date'].iloc[0])))
         conn.commit()
     print("Successfully stored recommendations.")
 
+@profiled('analysis')
 def run():
-    """Entry point for Airflow to trigger the analysis and ranking process."""
+    """
+    Entry point for Airflow to trigger the analysis and ranking process. It
+    runs as a 'run_analysis' job, so it never overlaps one submitted through
+    the API.
+    """
     print("Starting Niftron Analysis and Ranking...")
-    run_analysis_and_rank()
+    with span('analysis'):
+        run_job('run_analysis')
     print("Niftron Analysis and Ranking Finished.")
 
 if __name__ == "__main__":
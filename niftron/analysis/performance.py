@@ -5,13 +5,48 @@ import pandas as pd
 
 TRADING_DAYS_PER_YEAR = 252
 
-def calculate_performance_metrics(daily_returns: pd.Series, benchmark_daily_returns: pd.Series) -> dict:
+def update_running_stats(stats: dict, daily_returns) -> dict:
+    """
+    Advances a strategy's running equity (cumulative product of 1 + return),
+    peak equity and max drawdown by new daily returns, oldest first.
+
+    The result equals recomputing the cumulative product, expanding peak and
+    drawdown over the whole series, without rescanning it.
+
+    Args:
+        stats (dict): A previous result, or None/{} for an empty series.
+        daily_returns: The new daily returns.
+
+    Returns:
+        dict: {'equity', 'peak', 'max_drawdown'}; peak and max_drawdown are
+              None until the first return has been seen.
+    """
+    stats = stats or {}
+    equity = stats.get('equity', 1.0)
+    peak = stats.get('peak')
+    max_drawdown = stats.get('max_drawdown')
+    for r in np.asarray(daily_returns, dtype='float64'):
+        equity *= 1 + r
+        peak = equity if peak is None else max(peak, equity)
+        drawdown = (equity - peak) / peak
+        max_drawdown = drawdown if max_drawdown is None else min(max_drawdown, drawdown)
+    return {
+        'equity': float(equity),
+        'peak': None if peak is None else float(peak),
+        'max_drawdown': None if max_drawdown is None else float(max_drawdown),
+    }
+
+def calculate_performance_metrics(daily_returns: pd.Series, benchmark_daily_returns: pd.Series,
+                                  running_stats: dict = None) -> dict:
     """
     Calculates a comprehensive set of performance metrics for a strategy.
 
     Args:
         daily_returns (pd.Series): A pandas Series of daily returns for the strategy.
         benchmark_daily_returns (pd.Series): A pandas Series of daily returns for the benchmark.
+        running_stats (dict, optional): update_running_stats() over the same
+                                        series; reuses its max drawdown instead
+                                        of recomputing the drawdown curve.
 
     Returns:
         dict: A dictionary containing all the calculated performance metrics.
@@ -27,10 +62,13 @@ def calculate_performance_metrics(daily_returns: pd.Series, benchmark_daily_retu
     annualized_volatility = daily_returns.std() * np.sqrt(TRADING_DAYS_PER_YEAR)
     
     # Calculate Drawdown
-    cumulative_returns = (1 + daily_returns).cumprod()
-    peak = cumulative_returns.expanding(min_periods=1).max()
-    drawdown = (cumulative_returns - peak) / peak
-    max_drawdown = drawdown.min()
+    if running_stats and running_stats.get('max_drawdown') is not None:
+        max_drawdown = running_stats['max_drawdown']
+    else:
+        cumulative_returns = (1 + daily_returns).cumprod()
+        peak = cumulative_returns.expanding(min_periods=1).max()
+        drawdown = (cumulative_returns - peak) / peak
+        max_drawdown = drawdown.min()
 
     # --- Risk-Adjusted Return Metrics ---
     sharpe_ratio = (cagr / annualized_volatility) if annualized_volatility != 0 else 0
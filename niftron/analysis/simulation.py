@@ -0,0 +1,129 @@
+# niftron/analysis/simulation.py
+
+from typing import Dict, Iterable, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+SHE_WEIGHTS = {'trend': 0.4, 'momentum': 0.3, 'macd': 0.3}
+
+
+class SimulationMatrices(NamedTuple):
+    """Backtest inputs pivoted to (date x stock) arrays; NaN where a stock has no row."""
+    dates: pd.DatetimeIndex
+    symbols: np.ndarray
+    scores: Dict[str, np.ndarray]
+    returns: np.ndarray
+
+
+def calculate_she_score(signals_df: pd.DataFrame, weights: dict = None) -> pd.DataFrame:
+    """Calculates the Simple Heuristic Ensemble score."""
+    weights = weights or SHE_WEIGHTS
+    norm_trend = (signals_df['trend_signal'] + 1) * 50
+    score = (norm_trend * weights['trend'] + signals_df['momentum_score'] * weights['momentum'] + signals_df['macd_score'] * weights['macd'])
+    return pd.DataFrame({'she_score': score}, index=signals_df.index)
+
+def build_matrices(oos_data: pd.DataFrame, score_columns: Iterable[str]) -> SimulationMatrices:
+    """
+    Pivots a prepared dataset (date index, one row per stock and day, with a
+    'symbol' and a 'daily_return' column) into date x stock matrices.
+
+    Stocks keep their order of first appearance, which is the order the
+    per-day loop saw them in and therefore decides ties between equal scores.
+    """
+    date_codes, dates = pd.factorize(oos_data.index.get_level_values('date'), sort=True)
+    stock_codes, symbols = pd.factorize(oos_data['symbol'])
+    shape = (len(dates), len(symbols))
+
+    def _pivot(values) -> np.ndarray:
+        matrix = np.full(shape, np.nan)
+        matrix[date_codes, stock_codes] = np.asarray(values, dtype='float64')
+        return matrix
+
+    return SimulationMatrices(
+        dates=pd.DatetimeIndex(dates),
+        symbols=np.asarray(symbols),
+        scores={column: _pivot(oos_data[column]) for column in score_columns},
+        returns=_pivot(oos_data['daily_return']),
+    )
+
+def _pick_top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Column positions of each row's top k scores, best first.
+
+    Reproduces DataFrame.nlargest(keep='first'): ties at the cut-off go to
+    the earlier stock and equal scores keep stock order. Every row must have
+    at least k non-NaN scores.
+    """
+    n_stocks = scores.shape[1]
+    s = np.where(np.isnan(scores), -np.inf, scores)
+
+    # The k-th largest score of each day, then everything strictly above it
+    # plus as many of the equal scores as still fit, in stock order.
+    kth = np.partition(s, n_stocks - k, axis=1)[:, n_stocks - k][:, None]
+    above = s > kth
+    at_cutoff = s == kth
+    fits = np.cumsum(at_cutoff, axis=1) <= (k - above.sum(axis=1))[:, None]
+    chosen = above | (at_cutoff & fits)
+
+    rows, cols = np.nonzero(chosen)
+    cols = cols.reshape(-1, k)
+    order = np.argsort(-s[rows, cols.ravel()].reshape(-1, k), axis=1, kind='stable')
+    return np.take_along_axis(cols, order, axis=1)
+
+def top_k_returns(scores: np.ndarray, returns: np.ndarray, portfolio_size: int = 5,
+                  rebalance_period: int = 1) -> np.ndarray:
+    """
+    Equal-weight return of a top `portfolio_size` portfolio picked by score.
+
+    The portfolio is re-picked every `rebalance_period` days and held in
+    between; on holding days, stocks without a bar are left out of the mean.
+    A pick day with fewer than `portfolio_size` stocks stays in cash (0)
+    until the next rebalance. With daily rebalancing the result matches
+    DataFrame.nlargest(...)['daily_return'].mean() bit for bit.
+    """
+    n_dates = scores.shape[0]
+    daily = np.zeros(n_dates)
+    k = portfolio_size
+    period = max(1, rebalance_period)
+    pick_days = np.arange(0, n_dates, period)
+    pick_days = pick_days[np.count_nonzero(~np.isnan(scores[pick_days]), axis=1) >= k]
+    if k < 1 or len(pick_days) == 0:
+        return daily
+
+    picks = _pick_top_k(scores[pick_days], k)
+    for offset in range(period):
+        days = pick_days + offset
+        in_range = days < n_dates
+        held = returns[days[in_range][:, None], picks[in_range]]
+        held_count = np.count_nonzero(~np.isnan(held), axis=1)
+        # Row-wise sums of a fresh C-contiguous array use the same pairwise
+        # summation as Series.mean(), so daily rebalancing matches it exactly.
+        held_sum = np.nansum(held, axis=1)
+        daily[days[in_range]] = np.where(held_count > 0, held_sum / np.maximum(held_count, 1), 0.0)
+    return daily
+
+def simulate(oos_data: pd.DataFrame, score_columns: Iterable[str], portfolio_size: int = 5,
+             rebalance_period: int = 1) -> pd.DataFrame:
+    """
+    Simulates a top-K portfolio for every score column at once.
+
+    Returns:
+        pd.DataFrame: Daily portfolio returns, one column per score column.
+    """
+    score_columns = list(score_columns)
+    matrices = build_matrices(oos_data, score_columns)
+    return pd.DataFrame(
+        {column: top_k_returns(matrices.scores[column], matrices.returns, portfolio_size, rebalance_period)
+         for column in score_columns},
+        index=matrices.dates,
+    )
+
+def run_simulation_loop(oos_data: pd.DataFrame, score_column: str, portfolio_size: int = 5,
+                        rebalance_period: int = 1) -> pd.Series:
+    """Daily portfolio returns of a single score column (see simulate)."""
+    return simulate(oos_data, [score_column], portfolio_size, rebalance_period)[score_column]
+
+def benchmark_returns(oos_data: pd.DataFrame) -> pd.Series:
+    """Equal-weight return of every stock available on each day."""
+    return oos_data.groupby('date')['daily_return'].mean().fillna(0)
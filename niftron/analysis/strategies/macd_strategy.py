@@ -1,39 +1,47 @@
 # src/niftron/analysis/strategies/macd_strategy.py
 
+import numpy as np
 import pandas as pd
 
-def generate_signals(features_df):
+# Trailing bars needed to score the latest day: today and the previous day for the MACD crossover.
+LOOKBACK = 2
+
+def generate_signals(features_df, group_by=None):
     """
     Generates a signal based on the MACD crossover.
 
     Args:
         features_df (pd.DataFrame): DataFrame with features, indexed by date.
                                     Must contain 'macd_value' and 'macd_signal'.
+        group_by (str, optional): Column identifying each stock when several
+                                  stocks are stacked in one frame (sorted by
+                                  date within each stock). The previous-day
+                                  comparison then never crosses stocks.
 
     Returns:
         pd.DataFrame: A DataFrame with a 'macd_signal_strength' column.
                       Score is 100 for a bullish cross, 0 for a bearish cross.
     """
-    df = features_df.copy()
-
     # Rename columns for clarity
-    df.rename(columns={'macd_value': 'macd', 'macd_signal': 'macds'}, inplace=True)
+    df = features_df[['macd_value', 'macd_signal']].set_axis(['macd', 'macds'], axis=1)
+    if group_by is None:
+        previous = df.shift(1)
+    else:
+        previous = df.groupby(features_df[group_by], sort=False).shift(1)
 
     # Bullish signal: MACD crosses ABOVE its signal line.
     condition_currently_bullish = df['macd'] > df['macds']
-    condition_previously_bearish = df['macd'].shift(1) < df['macds'].shift(1)
-    df['bullish_cross'] = condition_currently_bullish & condition_previously_bearish
+    condition_previously_bearish = previous['macd'] < previous['macds']
+    bullish_cross = (condition_currently_bullish & condition_previously_bearish).to_numpy()
 
     # Bearish signal: MACD crosses BELOW its signal line.
-    condition_currently_bearish = df['macd'] < df['macds']
-    condition_previously_bullish = df['macd'].shift(1) > df['macds'].shift(1)
-    df['bearish_cross'] = condition_currently_bearish & condition_previously_bullish
+    # (Not scored yet; see below.)
     
     # We'll create a simple score: 100 for a fresh bullish signal, 0 otherwise.
     # More advanced logic could provide scores for "sustained" bullishness.
-    df['macd_score'] = 0
-    df.loc[df['bullish_cross'], 'macd_score'] = 100
+    macd_score = np.zeros(len(features_df), dtype='int64')
+    macd_score[bullish_cross] = 100
     # We could assign a negative score for bearish, but for a "buy" recommender,
     # we are mainly interested in positive signals.
 
-    return df[['macd_score']]
\ No newline at end of file
+    return pd.DataFrame({'macd_score': macd_score}, index=features_df.index)
@@ -3,7 +3,10 @@
 import pandas as pd
 import numpy as np
 
-def generate_signals(features_df):
+# Trailing bars needed to score the latest day: only the latest RSI value.
+LOOKBACK = 1
+
+def generate_signals(features_df, group_by=None):
     """
     Generates a momentum score based on the RSI.
     The score is normalized to be between 0 and 100, where higher is more bullish.
@@ -11,12 +14,12 @@ def generate_signals(features_df):
     Args:
         features_df (pd.DataFrame): DataFrame with features, indexed by date.
                                     Must contain an 'rsi_14' column.
+        group_by (str, optional): Accepted for symmetry with the crossover
+                                  strategies; the score only uses the current day.
 
     Returns:
         pd.DataFrame: The input DataFrame with a new 'momentum_score' column.
     """
-    df = features_df.copy()
-    
     # RSI Scoring Logic:
     # - RSI < 30 is typically considered oversold (strong buy signal).
     # - RSI > 70 is typically considered overbought (strong sell signal).
@@ -26,6 +29,4 @@ def generate_signals(features_df):
     # A high RSI (e.g., 80) should result in a low score (e.g., 20).
     
     # Simple inversion: score = 100 - RSI
-    df['momentum_score'] = 100 - df['rsi_14']
-
-    return df[['momentum_score']]
\ No newline at end of file
+    return pd.DataFrame({'momentum_score': 100 - features_df['rsi_14']}, index=features_df.index)
@@ -0,0 +1,123 @@
+# niftron/analysis/sweep.py
+
+import itertools
+import os
+import tempfile
+from functools import partial
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+import numpy as np
+import pandas as pd
+
+from niftron.analysis.performance import calculate_performance_metrics
+from niftron.analysis.simulation import SHE_WEIGHTS, benchmark_returns, build_matrices, top_k_returns
+from niftron.core.config import settings
+from niftron.core.parallel import run_sharded
+
+# Arrays written once by the parent and memory-mapped read-only by every worker.
+SWEEP_ARRAYS = ['dates', 'trend_signal', 'momentum_score', 'macd_score', 'lem_score', 'returns', 'benchmark']
+SIGNAL_COLUMNS = ['trend_signal', 'momentum_score', 'macd_score']
+# Scores that are read straight from a matrix; 'she' is rebuilt from the signals per variant.
+SCORE_ARRAYS = {'lem': 'lem_score', 'trend': 'trend_signal', 'momentum': 'momentum_score', 'macd': 'macd_score'}
+
+# Per-process cache of opened matrices, keyed by directory.
+_opened: Dict[str, Dict[str, np.ndarray]] = {}
+
+
+class SweepParams(NamedTuple):
+    """
+    One backtest variant. score is 'she', 'lem', 'trend', 'momentum' or 'macd';
+    she_weights is (trend, momentum, macd) and only applies to 'she'.
+    """
+    score: str
+    portfolio_size: int
+    rebalance_period: int
+    oos_start: str
+    she_weights: Tuple[float, float, float] = None
+
+
+def build_grid(portfolio_sizes: Iterable[int] = (5,), rebalance_periods: Iterable[int] = (1,),
+               oos_starts: Iterable[str] = ('2023-01-01',),
+               she_weights: Iterable[Tuple[float, float, float]] = None,
+               scores: Iterable[str] = ('she', 'lem')) -> List[SweepParams]:
+    """Every combination of the given values; SHE weights are only crossed with the SHE score."""
+    if she_weights is None:
+        she_weights = [(SHE_WEIGHTS['trend'], SHE_WEIGHTS['momentum'], SHE_WEIGHTS['macd'])]
+    grid = []
+    for score, size, period, start in itertools.product(scores, portfolio_sizes, rebalance_periods, oos_starts):
+        for weights in (she_weights if score == 'she' else [None]):
+            grid.append(SweepParams(score, int(size), int(period), str(start), tuple(weights) if weights else None))
+    return grid
+
+def save_sweep_matrices(dataset: pd.DataFrame, directory: str) -> None:
+    """
+    Pivots a prepared dataset (with a 'lem_score' column) into date x stock
+    matrices and writes them as .npy files that workers memory-map.
+    """
+    matrices = build_matrices(dataset, SIGNAL_COLUMNS + ['lem_score'])
+    arrays = dict(matrices.scores)
+    arrays['dates'] = matrices.dates.to_numpy(dtype='datetime64[ns]')
+    arrays['returns'] = matrices.returns
+    arrays['benchmark'] = benchmark_returns(dataset).reindex(matrices.dates).to_numpy(dtype='float64')
+    for name in SWEEP_ARRAYS:
+        np.save(os.path.join(directory, f'{name}.npy'), arrays[name])
+
+def _open_matrices(directory: str) -> Dict[str, np.ndarray]:
+    if directory not in _opened:
+        _opened[directory] = {
+            name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+            for name in SWEEP_ARRAYS
+        }
+    return _opened[directory]
+
+def _score_matrix(arrays: Dict[str, np.ndarray], params: SweepParams, start: int) -> np.ndarray:
+    if params.score != 'she':
+        return arrays[SCORE_ARRAYS[params.score]][start:]
+    w_trend, w_momentum, w_macd = params.she_weights
+    # Same arithmetic as calculate_she_score, element by element.
+    norm_trend = (arrays['trend_signal'][start:] + 1) * 50
+    return (norm_trend * w_trend + arrays['momentum_score'][start:] * w_momentum
+            + arrays['macd_score'][start:] * w_macd)
+
+def evaluate(params: SweepParams, directory: str) -> dict:
+    """Runs one variant against the memory-mapped matrices and returns a tidy result row."""
+    arrays = _open_matrices(directory)
+    start = int(np.searchsorted(arrays['dates'], np.datetime64(pd.Timestamp(params.oos_start), 'ns')))
+    index = pd.DatetimeIndex(np.asarray(arrays['dates'][start:]))
+
+    daily = top_k_returns(_score_matrix(arrays, params, start), arrays['returns'][start:],
+                          params.portfolio_size, params.rebalance_period)
+    metrics = calculate_performance_metrics(
+        pd.Series(daily, index=index),
+        pd.Series(np.asarray(arrays['benchmark'][start:]), index=index),
+    )
+    row = params._asdict()
+    row['she_weights'] = ','.join(str(w) for w in params.she_weights) if params.she_weights else None
+    row['n_days'] = len(index)
+    row.update({name: float(value) for name, value in metrics.items()})
+    return row
+
+def _evaluate_shard(params_list: List[SweepParams], directory: str) -> List[dict]:
+    return [evaluate(params, directory) for params in params_list]
+
+def run_sweep(dataset: pd.DataFrame, grid: List[SweepParams], workers: int = None) -> pd.DataFrame:
+    """
+    Evaluates every variant in the grid on a process pool.
+
+    The dataset is pivoted and written to disk once; workers memory-map the
+    same read-only files instead of receiving a pickled copy per task.
+
+    Returns:
+        pd.DataFrame: One row per variant with its parameters and the
+                      calculate_performance_metrics outputs.
+    """
+    with tempfile.TemporaryDirectory(prefix='niftron-sweep-') as directory:
+        save_sweep_matrices(dataset, directory)
+        n_shards = max(1, min(len(grid), 4 * (workers or settings.PIPELINE_WORKERS)))
+        sharded = run_sharded(partial(_evaluate_shard, directory=directory), grid,
+                              workers=workers, shards=n_shards, label="sweep shards")
+        _opened.pop(directory, None)
+    if sharded.errors:
+        raise RuntimeError(f"{len(sharded.errors)} sweep shard(s) failed.")
+    print(f"Evaluated {len(grid)} variants in {sharded.seconds:.1f}s.")
+    return pd.DataFrame([row for shard in sharded.results for row in shard])
@@ -0,0 +1,82 @@
+# niftron/api/instrumentation.py
+
+import time
+
+from niftron.core.cache import all_cache_stats
+from niftron.core.metrics import registry
+
+HTTP_REQUEST_SECONDS = registry.histogram(
+    'niftron_http_request_duration_seconds', 'API request latency by route template.',
+    ['method', 'route', 'status'],
+)
+
+# Extra caches to report beside the SingleFlightCaches, as name -> stats callable.
+_extra_cache_stats = {}
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware timing every HTTP request. Requests are labelled by
+    route template (/api/v1/jobs/{job_id}), never by the raw path, so the
+    number of series stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = {'code': 500}
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get('route')
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                method=scope['method'],
+                route=getattr(route, 'path', 'unmatched'),
+                status=str(status['code']),
+            )
+
+def register_cache(name: str, stats) -> None:
+    """Reports a cache that is not a SingleFlightCache (stats() -> {'hits', 'misses', ...})."""
+    _extra_cache_stats[name] = stats
+
+def collect_cache_metrics():
+    """Hit/miss counters, hit ratio and size of every in-process cache, at scrape time."""
+    stats = all_cache_stats()
+    for name, get_stats in _extra_cache_stats.items():
+        stats[name] = get_stats()
+
+    families = {
+        'niftron_cache_hits_total': ('counter', 'Cache lookups answered from memory (fresh or stale).'),
+        'niftron_cache_misses_total': ('counter', 'Cache lookups that had to load.'),
+        'niftron_cache_hit_ratio': ('gauge', 'Hits / lookups since the process started.'),
+        'niftron_cache_size': ('gauge', 'Entries currently held.'),
+        'niftron_cache_load_seconds_avg': ('gauge', 'Average loader latency.'),
+    }
+    samples = {name: [] for name in families}
+    for cache, values in sorted(stats.items()):
+        labels = {'cache': cache}
+        hits = values.get('hits', 0) + values.get('stale_hits', 0)
+        misses = values.get('misses', values.get('builds', 0))
+        lookups = hits + misses
+        samples['niftron_cache_hits_total'].append((labels, hits))
+        samples['niftron_cache_misses_total'].append((labels, misses))
+        samples['niftron_cache_hit_ratio'].append((labels, hits / lookups if lookups else 0.0))
+        if 'size' in values:
+            samples['niftron_cache_size'].append((labels, values['size']))
+        if 'load_seconds_avg' in values:
+            samples['niftron_cache_load_seconds_avg'].append((labels, values['load_seconds_avg']))
+    return [(name, kind, doc, samples[name]) for name, (kind, doc) in families.items()]
+
+registry.register_collector(collect_cache_metrics)
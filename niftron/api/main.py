@@ -1,19 +1,30 @@
 # niftron/api/main.py
 
-from fastapi import FastAPI, HTTPException
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel, Field
 import datetime
-from typing import List, Dict, Any
-from cachetools import cached, TTLCache
+import uuid
+from typing import List, Dict, Any, Optional
 from fastapi.middleware.cors import CORSMiddleware
-from niftron.analysis.backtest import get_backtest_results
-from niftron.core.db import get_db_connection
-from niftron.analysis.main import run_analysis_and_rank
-from niftron.analysis import backtest
-import pandas as pd
-from niftron.chatbot import generate_ai_response
+from niftron.core.cache import SingleFlightCache, all_cache_stats
+from niftron.core.async_db import close_async_pool, listen_forever, open_async_pool
+from niftron.core.config import settings
+from niftron.core.db import close_pool, get_db_connection, init_pool
+from niftron.core.jobs import dispatch_queued_jobs, submit_job
+from niftron.data_access.jobs import get_job
+from niftron.chatbot import generate_ai_response_async
 from pydantic import BaseModel
-from niftron.data_access.recommendations import get_latest_recommendations_from_db
+from niftron.data_access.recommendations import RECOMMENDATIONS_CHANNEL, get_latest_recommendations_async
+from niftron.api.snapshot import SnapshotCache, etag_matches
+from niftron.api.payloads import compress_payload, select_encoding
+from niftron.api.instrumentation import MetricsMiddleware, register_cache
+from niftron.core.metrics import registry as metrics_registry
+from niftron.ml_model.predict import active_version, load_scorer, reload_model
+from niftron.ml_model.registry import pointer_stamp
+from niftron.core.services import services
 
 class ChatRequest(BaseModel):
     message: str
@@ -29,16 +40,146 @@ class Recommendation(BaseModel):
     score: float = Field(..., description="The final ensembled score.")
     algorithm_scores: Dict[str, Any] = Field(..., description="Scores from individual algorithms.")
 
+class JobResponse(BaseModel):
+    """State and timings of a background job."""
+    job_id: uuid.UUID
+    kind: str
+    state: str = Field(..., description="queued, running, succeeded or failed.")
+    submitted_at: datetime.datetime
+    started_at: Optional[datetime.datetime] = None
+    heartbeat_at: Optional[datetime.datetime] = None
+    finished_at: Optional[datetime.datetime] = None
+    worker: Optional[str] = None
+    error: Optional[str] = None
+    duration_seconds: Optional[float] = None
+
+    @classmethod
+    def from_row(cls, job: dict) -> "JobResponse":
+        duration = None
+        if job['started_at'] and job['finished_at']:
+            duration = (job['finished_at'] - job['started_at']).total_seconds()
+        return cls(**job, duration_seconds=duration)
+
+class JobSubmission(JobResponse):
+    deduplicated: bool = Field(..., description="True when an already active job was joined.")
+
+class ModelVersionResponse(BaseModel):
+    """The LEM version an API worker scores with."""
+    version: Optional[str] = None
+    content_hash: Optional[str] = None
+    metadata: Dict[str, Any] = Field(default_factory=dict, description="Training window, parameters, CV score, ...")
+    loaded: bool = Field(..., description="Whether this worker has loaded the model (or its lookup table) yet.")
+
+    @classmethod
+    def current(cls) -> "ModelVersionResponse":
+        version = active_version()
+        loaded = services.status()['lem_scorer']['loaded']
+        if version is None:
+            return cls(loaded=loaded)
+        return cls(version=version.version, content_hash=version.content_hash, metadata=version.metadata, loaded=loaded)
+
+class ModelReloadResponse(BaseModel):
+    previous_version: Optional[str] = None
+    current: ModelVersionResponse
+    changed: bool
+    analysis_job_id: Optional[uuid.UUID] = Field(None, description="Analysis re-run with the new model, if one was queued.")
+
 class RecommendationResponse(BaseModel):
     """Defines the structure for the final API response with both model results."""
     date: datetime.date
     she_recommendations: List[Recommendation]
     lem_recommendations: List[Recommendation]
     
+async def build_recommendations_body():
+    """Serializes the latest recommendations once; None when there are none."""
+    date, lem_recs, she_recs = await get_latest_recommendations_async()
+    if not date:
+        return None
+    response = RecommendationResponse(date=date, lem_recommendations=lem_recs, she_recommendations=she_recs)
+    return response.model_dump_json().encode()
+
+# Served as-is until the pipeline NOTIFYs that new recommendations were stored.
+recommendations_snapshot = SnapshotCache(
+    'recommendations', build_recommendations_body,
+    max_age=settings.RECOMMENDATIONS_SNAPSHOT_MAX_AGE_SECONDS,
+)
+
+def apply_model_reload() -> ModelReloadResponse:
+    """
+    Swaps in the registry's current model if it changed. Stored backtests and
+    chart payloads are keyed by the model hash and its run, so they switch
+    over by themselves; entries of the old model are dropped, and the analysis
+    is re-run so stored recommendations carry the new model's scores.
+    """
+    previous, latest, changed = reload_model()
+    job_id = None
+    if changed:
+        from niftron.analysis import backtest
+        load_scorer()
+        backtest.latest_run_cache.invalidate()
+        chart_cache.invalidate()
+        if settings.MODEL_RELOAD_RESCORE:
+            job, _ = submit_job('run_analysis')
+            job_id = job['job_id']
+    return ModelReloadResponse(previous_version=previous.version if previous else None,
+                               current=ModelVersionResponse.current(), changed=changed, analysis_job_id=job_id)
+
+async def watch_model(interval: float):
+    """Reloads the model whenever the registry's CURRENT pointer moves. Runs until cancelled."""
+    stamp = await asyncio.to_thread(pointer_stamp)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            latest = await asyncio.to_thread(pointer_stamp)
+            if latest != stamp:
+                stamp = latest
+                await asyncio.to_thread(apply_model_reload)
+        except Exception as e:
+            print(f"!!! Model reload check failed: {e!r} !!!")
+
 # --- FastAPI Application ---
 
-app = FastAPI(title="Niftron API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Opens the database pools once per worker and closes them at shutdown.
+    Each worker also LISTENs for new recommendations to drop its snapshot,
+    and watches the model registry to hot-swap the LEM.
+    """
+    init_pool()
+    await open_async_pool()
+    try:
+        # Jobs queued before a restart would otherwise wait for the queue timeout.
+        resumed = await asyncio.to_thread(dispatch_queued_jobs)
+        if resumed:
+            print(f"Dispatched {resumed} job(s) left queued before startup.")
+    except Exception as e:
+        print(f"!!! Could not dispatch queued jobs: {e!r} !!!")
+    listener = asyncio.create_task(listen_forever(
+        RECOMMENDATIONS_CHANNEL,
+        on_notify=lambda date: recommendations_snapshot.invalidate(f"new recommendations for {date}"),
+        # Anything stored while we were not listening would otherwise go unseen.
+        on_reconnect=recommendations_snapshot.invalidate,
+    ))
+    tasks = [listener]
+    if settings.MODEL_WATCH_SECONDS > 0:
+        tasks.append(asyncio.create_task(watch_model(settings.MODEL_WATCH_SECONDS)))
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await close_async_pool()
+        close_pool()
+
+app = FastAPI(title="Niftron API", version="1.0.0", lifespan=lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
+app.add_middleware(MetricsMiddleware)
+register_cache(recommendations_snapshot.name, lambda: dict(recommendations_snapshot.stats))
 
 
 # --- ADD THIS ENTIRE BLOCK ---
@@ -57,84 +198,156 @@ app.add_middleware(
 # --- Your existing endpoints ---
 # No changes needed to the functions below this line.
 @app.get("/api/v1/recommendations", response_model=RecommendationResponse)
-def get_latest_recommendations():
+async def get_latest_recommendations(request: Request):
+    """
+    Returns the latest recommendations from a pre-serialized snapshot.
+    Clients that send back the ETag get a 304 until new ones are stored.
+    """
     try:
-        date, lem_recs, she_recs = get_latest_recommendations_from_db()
-        if not date: raise HTTPException(status_code=404, detail="No recommendations found.")
-        return RecommendationResponse(date=date, lem_recommendations=lem_recs, she_recommendations=she_recs)
+        snapshot = await recommendations_snapshot.get()
     except Exception as e: raise HTTPException(status_code=500, detail=f"Internal server error: {e}")
+    if snapshot is None: raise HTTPException(status_code=404, detail="No recommendations found.")
 
-@app.post("/api/v1/chat", response_model=ChatResponse)
-def handle_chat_message(request: ChatRequest):
-    ai_reply = generate_ai_response(request.message)
-    return ChatResponse(reply=ai_reply)
+    # no-cache: clients may store the body but must revalidate it every time.
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), snapshot.etag):
+        recommendations_snapshot.stats['not_modified'] += 1
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
+
+# Returned while the first backtest is still being computed.
+BACKTEST_RETRY_AFTER_SECONDS = 60
+
+def backtest_unavailable(e: Exception) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e),
+                         headers={"Retry-After": str(BACKTEST_RETRY_AFTER_SECONDS)})
 
 @app.get("/api/v1/performance", response_model=Dict[str, Any])
 def get_performance_metrics():
     """
-    Runs the full backtest simulation and returns key performance metrics
-    for the LEM, SHE, and Benchmark strategies.
+    Returns key performance metrics for the LEM, SHE, and Benchmark
+    strategies from the stored backtest run. Without a run for the current
+    model, one is computed in the background; meanwhile the previous model's
+    run is served with "stale": true, or 503 if none exists yet.
     """
-    print("API endpoint /api/v1/performance hit. Running backtest...")
-    results = get_backtest_results()
-    print("Backtest complete. Returning results.")
-    return results
-
-# in niftron/api/main.py
+    # Backtest and chart code pulls in pandas; it is imported on first use.
+    from niftron.analysis import backtest
+    try:
+        return backtest.get_backtest_results()
+    except backtest.BacktestUnavailable as e:
+        raise backtest_unavailable(e)
 
-# Create a new cache specifically for chart data
-chart_cache = TTLCache(maxsize=10, ttl=43200) # 12-hour TTL
+# Serialized, compressed chart payloads, keyed by the stored backtest run
+# they were built from and the query, so a new run never serves an old chart.
+chart_cache = SingleFlightCache('chart_payloads', ttl=43200, maxsize=256) # 12-hour TTL
 
+def chart_response(request: Request, kind: str, start: Optional[datetime.date],
+                   end: Optional[datetime.date], max_points: int) -> Response:
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end.")
+    from niftron.analysis import backtest
+    from niftron.analysis.charts import build_chart
+    try:
+        run = backtest.load_current_run()
+    except backtest.BacktestUnavailable as e:
+        raise backtest_unavailable(e)
+    payload = chart_cache.get(
+        (run.key, kind, start, end, max_points),
+        lambda: compress_payload(build_chart(run.returns, kind, start, end, max_points)),
+    )
+    headers = {"ETag": payload.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if run.stale:
+        headers["X-Backtest-Stale"] = "true"
+    if etag_matches(request.headers.get("if-none-match"), payload.etag):
+        return Response(status_code=304, headers=headers)
+    content, encoding = select_encoding(payload, request.headers.get("accept-encoding"))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=content, media_type="application/json", headers=headers)
 
 @app.get("/api/v1/charts/equity-curve")
-def get_equity_curve_data():
+def get_equity_curve_data(
+    request: Request,
+    start: Optional[datetime.date] = Query(None, description="First date shown (inclusive)."),
+    end: Optional[datetime.date] = Query(None, description="Last date shown (inclusive)."),
+    max_points: int = Query(1000, ge=10, le=20000, description="Upper bound on points per series (LTTB-downsampled)."),
+):
     """
-    Calculates and returns data for the equity curve chart, formatted for Chart.js.
+    Returns the equity curves (growth of 1) of each strategy, formatted for
+    Chart.js. With a date range, curves start at 1 on the first day shown.
     """
-    # 1. Get the cached daily returns
-    lem_daily_returns, she_daily_returns, benchmark_daily_returns = backtest.run_all_simulations()
-
-    # 2. Calculate cumulative returns
-    returns_df = pd.DataFrame({
-        'LEM': lem_daily_returns,
-        'SHE': she_daily_returns,
-        'Benchmark': benchmark_daily_returns
-    })
-    cumulative_df = (1 + returns_df).cumprod()
-
-    # 3. Format for Chart.js
-    chart_data = {
-        "labels": cumulative_df.index.strftime('%Y-%m-%d').tolist(),
-        "datasets": [
-            { "label": "Learned Ensemble (LEM)", "data": cumulative_df['LEM'].tolist(), "borderColor": "#3b82f6", "tension": 0.1, "pointRadius": 0, "borderWidth": 2 },
-            { "label": "Simple Heuristic (SHE)", "data": cumulative_df['SHE'].tolist(), "borderColor": "#10b981", "tension": 0.1, "pointRadius": 0, "borderWidth": 2 },
-            { "label": "NIFTY 50 Benchmark", "data": cumulative_df['Benchmark'].tolist(), "borderColor": "#6b7280", "tension": 0.1, "pointRadius": 0, "borderWidth": 2 },
-        ]
-    }
-    return chart_data
-
-@app.post("/api/v1/run-analysis", status_code=200)
+    return chart_response(request, 'equity', start, end, max_points)
+
+@app.get("/api/v1/charts/drawdown")
+def get_drawdown_curve_data(
+    request: Request,
+    start: Optional[datetime.date] = Query(None, description="First date shown (inclusive)."),
+    end: Optional[datetime.date] = Query(None, description="Last date shown (inclusive)."),
+    max_points: int = Query(1000, ge=10, le=20000, description="Upper bound on points per series (LTTB-downsampled)."),
+):
+    """Returns each strategy's drawdown from peak equity in percent, formatted for Chart.js."""
+    return chart_response(request, 'drawdown', start, end, max_points)
+
+@app.get("/api/v1/cache/stats")
+def get_cache_stats():
+    """Hit/miss/refresh counters and load latency of every in-process cache."""
+    stats = all_cache_stats()
+    stats[recommendations_snapshot.name] = dict(recommendations_snapshot.stats)
+    return stats
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Prometheus scrape endpoint: request latency, cache hit ratios and stage timings."""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.post("/api/v1/run-analysis", status_code=202, response_model=JobSubmission)
 def trigger_run_analysis():
     """
-    Triggers the daily analysis pipeline to re-calculate and store the latest recommendations.
-    This is an asynchronous task on the server. The endpoint will return immediately.
+    Queues the daily analysis pipeline and returns its job immediately; poll
+    GET /api/v1/jobs/{job_id} for progress. Only one analysis runs at a time,
+    so submitting while one is queued or running returns that job instead.
+    New recommendations reach the snapshot through the pipeline's NOTIFY.
     """
     try:
-        print("API endpoint /api/v1/run-analysis hit. Triggering analysis.")
-        # In a production system, you would run this as a background task.
-        # For our case, running it directly is fine.
-        run_analysis_and_rank()
-        return {"message": "Analysis pipeline triggered successfully. New recommendations are being generated."}
+        job, created = submit_job('run_analysis')
     except Exception as e:
-        print(f"Error during analysis run: {e}")
-        raise HTTPException(status_code=500, detail="An error occurred while running the analysis.")
+        print(f"Error submitting analysis job: {e}")
+        raise HTTPException(status_code=500, detail="An error occurred while submitting the analysis.")
+    print(f"API endpoint /api/v1/run-analysis hit. {'Queued' if created else 'Joined'} job {job['job_id']}.")
+    return JobSubmission(**JobResponse.from_row(job).model_dump(), deduplicated=not created)
+
+@app.get("/api/v1/jobs/{job_id}", response_model=JobResponse)
+def get_job_status(job_id: uuid.UUID):
+    """Reports the state, timings and error (if any) of a background job."""
+    job = get_job(str(job_id))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return JobResponse.from_row(job)
+
+
+@app.get("/api/v1/model", response_model=ModelVersionResponse)
+def get_model_version():
+    """The LEM version this worker scores with, and its training metadata."""
+    return ModelVersionResponse.current()
 
+@app.post("/api/v1/model/reload", response_model=ModelReloadResponse)
+def trigger_model_reload():
+    """
+    Re-reads the model registry's CURRENT pointer and hot-swaps the model if
+    it moved (workers also check every MODEL_WATCH_SECONDS). Only reaches the
+    worker that serves the request.
+    """
+    try:
+        return apply_model_reload()
+    except Exception as e:
+        print(f"Error reloading the model: {e}")
+        raise HTTPException(status_code=500, detail="An error occurred while reloading the model.")
 
 @app.post("/api/v1/chat", response_model=ChatResponse)
-def handle_chat_message(request: ChatRequest):
+async def handle_chat_message(request: ChatRequest):
     """Receives a user message and returns a response from the AI chatbot."""
     print(f"Chat endpoint hit with message: '{request.message}'")
-    ai_reply = generate_ai_response(request.message)
+    ai_reply = await generate_ai_response_async(request.message)
     return ChatResponse(reply=ai_reply)
 
 @app.get("/")
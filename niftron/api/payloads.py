@@ -0,0 +1,75 @@
+# niftron/api/payloads.py
+
+import gzip
+import hashlib
+import json
+from typing import NamedTuple, Optional
+
+# Both are optional speed-ups: without orjson the stdlib encoder is used,
+# without brotli clients get gzip.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class CompressedPayload(NamedTuple):
+    """A JSON body serialized once, with pre-compressed variants and a strong ETag."""
+    body: bytes
+    gzip: bytes
+    br: Optional[bytes]
+    etag: str
+
+
+def _default(value):
+    # numpy arrays and scalars, duck-typed so the API starts without numpy.
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def encode_json(obj) -> bytes:
+    """Serializes obj (numpy arrays included) to compact JSON bytes; NaN becomes null."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    # Only used without orjson: map NaN to null like orjson does.
+    def clean(value):
+        value = value.tolist() if hasattr(value, 'tolist') else value
+        if isinstance(value, float) and value != value:
+            return None
+        if isinstance(value, dict):
+            return {k: clean(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [clean(v) for v in value]
+        return value
+    return json.dumps(clean(obj), separators=(',', ':')).encode()
+
+def compress_payload(obj) -> CompressedPayload:
+    body = encode_json(obj)
+    return CompressedPayload(
+        body=body,
+        gzip=gzip.compress(body, compresslevel=6),
+        br=brotli.compress(body, quality=9) if brotli is not None else None,
+        etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+    )
+
+def _accepted(accept_encoding: str) -> set:
+    accepted = set()
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if params.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+def select_encoding(payload: CompressedPayload, accept_encoding: str) -> tuple:
+    """Returns (content, content_encoding or None) for the client's Accept-Encoding."""
+    accepted = _accepted(accept_encoding)
+    if payload.br is not None and 'br' in accepted:
+        return payload.br, 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return payload.gzip, 'gzip'
+    return payload.body, None
@@ -0,0 +1,76 @@
+# niftron/api/snapshot.py
+
+import asyncio
+import hashlib
+import time
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+
+class Snapshot(NamedTuple):
+    body: bytes
+    etag: str
+    built_at: float
+
+
+class SnapshotCache:
+    """
+    Holds one pre-serialized JSON response body and its strong ETag.
+
+    The body is rebuilt by `builder` on the first request after invalidate()
+    (or after `max_age` seconds, in case an invalidation was missed);
+    concurrent requests wait for that single rebuild. A builder returning
+    None means there is nothing to serve and is not cached.
+    """
+
+    def __init__(self, name: str, builder: Callable[[], Awaitable[Optional[bytes]]], max_age: float):
+        self.name = name
+        self.builder = builder
+        self.max_age = max_age
+        self._snapshot: Optional[Snapshot] = None
+        # Bumped by invalidate() so a build that raced with it is not kept.
+        self._generation = 0
+        self._lock = asyncio.Lock()
+        self.stats = {'hits': 0, 'builds': 0, 'invalidations': 0, 'not_modified': 0}
+
+    def _fresh(self) -> Optional[Snapshot]:
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - snapshot.built_at < self.max_age:
+            return snapshot
+        return None
+
+    async def get(self) -> Optional[Snapshot]:
+        snapshot = self._fresh()
+        if snapshot is not None:
+            self.stats['hits'] += 1
+            return snapshot
+        async with self._lock:
+            snapshot = self._fresh()
+            if snapshot is not None:
+                self.stats['hits'] += 1
+                return snapshot
+            generation = self._generation
+            body = await self.builder()
+            self.stats['builds'] += 1
+            if body is None:
+                return None
+            snapshot = Snapshot(body, f'"{hashlib.sha256(body).hexdigest()[:32]}"', time.monotonic())
+            if generation == self._generation:
+                self._snapshot = snapshot
+            return snapshot
+
+    def invalidate(self, reason: str = None) -> None:
+        self._generation += 1
+        self._snapshot = None
+        self.stats['invalidations'] += 1
+        if reason:
+            print(f"Snapshot '{self.name}' invalidated ({reason}).")
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag, per RFC 9110."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(','))
+    return any(tag.removeprefix('W/') == etag for tag in candidates)
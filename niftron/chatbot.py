@@ -1,18 +1,25 @@
 # niftron/chatbot.py
+import asyncio
 import os
 import re
 import json
-import google.generativeai as genai
-from niftron.data_access.recommendations import get_latest_recommendations_from_db
+from niftron.data_access.recommendations import get_latest_recommendations_from_db, get_latest_recommendations_async
 from niftron.core.db import get_db_connection
+from niftron.core.services import services
 
-# --- (Gemini configuration is the same) ---
-try:
-    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-    model = genai.GenerativeModel('gemini-2.5-flash')
-except Exception as e:
-    print(f"ERROR: Could not configure Gemini API. Check GEMINI_API_KEY. Error: {e}")
-    model = None
+def _configure_gemini():
+    """Configures the Gemini client; None if it cannot be set up."""
+    # Imported here: the SDK takes over half a second to import and is only
+    # needed once someone actually chats.
+    try:
+        import google.generativeai as genai
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        return genai.GenerativeModel('gemini-2.5-flash')
+    except Exception as e:
+        print(f"ERROR: Could not configure Gemini API. Check GEMINI_API_KEY. Error: {e}")
+        return None
+
+services.register('gemini', _configure_gemini)
 
 def get_detailed_scores_for_symbol(symbol: str, date):
     """Fetches the specific algorithm scores for a given stock symbol on a given date."""
@@ -38,50 +45,57 @@ def get_detailed_scores_for_symbol(symbol: str, date):
                 return result[0]
     return None
 
+def build_context(user_query: str, date, lem_recs, she_recs) -> str:
+    """
+    Builds the prompt context from the latest recommendations, adding
+    detailed scores if a recommended stock symbol is mentioned.
+    """
+    if not date: return "No recommendation data available."
+
+    # --- General Context ---
+    context = f"Today's Date: {date.strftime('%Y-%m-%d')}\n"
+    context += "--- Top 5 ML Model (LEM) Recommendations ---\n"
+    for rec in lem_recs:
+        context += f"- Rank {rec['rank']}: {rec['symbol']}, Score: {rec['score']:.2f}\n"
+    
+    # --- NEW: Dynamic Context Injection ---
+    # Find any stock symbols mentioned in the user's query
+    mentioned_symbols = re.findall(r'\b([A-Z&]+)\b', user_query.upper())
+    if mentioned_symbols:
+        symbol = mentioned_symbols[0] # Focus on the first symbol found
+        
+        # Check if this symbol is in our recommendations
+        all_recs = {rec['symbol']: rec for rec in lem_recs + she_recs}
+        if symbol in all_recs:
+            detailed_scores = all_recs[symbol].get('algorithm_scores')
+            if detailed_scores:
+                context += f"\n--- Detailed Scores for {symbol} ---\n"
+                context += f"- Trend Signal: {detailed_scores.get('trend_signal', 'N/A')}\n"
+                context += f"- Momentum Score: {detailed_scores.get('momentum_score', 'N/A')}\n"
+                context += f"- MACD Score: {detailed_scores.get('macd_score', 'N/A')}\n"
+                context += "(Note: Trend is -1, 0, or 1. Momentum and MACD are 0-100)."
+    
+    return context
+
 def get_context_for_prompt(user_query: str):
     """
     Gathers general context, and if a stock symbol is mentioned,
     fetches detailed context for that specific stock.
     """
     try:
-        date, lem_recs, she_recs = get_latest_recommendations_from_db()
-        if not date: return "No recommendation data available."
+        return build_context(user_query, *get_latest_recommendations_from_db())
+    except Exception:
+        return "Could not fetch recommendation data."
 
-        # --- General Context ---
-        context = f"Today's Date: {date.strftime('%Y-%m-%d')}\n"
-        context += "--- Top 5 ML Model (LEM) Recommendations ---\n"
-        for rec in lem_recs:
-            context += f"- Rank {rec['rank']}: {rec['symbol']}, Score: {rec['score']:.2f}\n"
-        
-        # --- NEW: Dynamic Context Injection ---
-        # Find any stock symbols mentioned in the user's query
-        mentioned_symbols = re.findall(r'\b([A-Z&]+)\b', user_query.upper())
-        if mentioned_symbols:
-            symbol = mentioned_symbols[0] # Focus on the first symbol found
-            
-            # Check if this symbol is in our recommendations
-            all_recs = {rec['symbol']: rec for rec in lem_recs + she_recs}
-            if symbol in all_recs:
-                detailed_scores = all_recs[symbol].get('algorithm_scores')
-                if detailed_scores:
-                    context += f"\n--- Detailed Scores for {symbol} ---\n"
-                    context += f"- Trend Signal: {detailed_scores.get('trend_signal', 'N/A')}\n"
-                    context += f"- Momentum Score: {detailed_scores.get('momentum_score', 'N/A')}\n"
-                    context += f"- MACD Score: {detailed_scores.get('macd_score', 'N/A')}\n"
-                    context += "(Note: Trend is -1, 0, or 1. Momentum and MACD are 0-100)."
-        
-        return context
+async def get_context_for_prompt_async(user_query: str):
+    """Async variant of get_context_for_prompt, reading through the async pool."""
+    try:
+        return build_context(user_query, *(await get_latest_recommendations_async()))
     except Exception:
         return "Could not fetch recommendation data."
 
-def generate_ai_response(user_query: str):
-    if not model:
-        return "Error: The AI model is not configured correctly on the server."
-    
-    # The context is now generated based on the user's query
-    context = get_context_for_prompt(user_query)
-    
-    system_prompt = f"""
+def build_system_prompt(context: str) -> str:
+    return f"""
     You are NIFTRON, a helpful and concise AI financial analyst for an Indian stock market app.
     Your main goal is to answer user questions based *only* on the context provided below.
     - When asked about a specific stock, use the "Detailed Scores" to explain WHY it was recommended (e.g., "It has a strong momentum score").
@@ -91,8 +105,32 @@ def generate_ai_response(user_query: str):
     CONTEXT:
     {context}
     """
+
+def generate_ai_response(user_query: str):
+    model = services.get('gemini')
+    if not model:
+        return "Error: The AI model is not configured correctly on the server."
+    
+    # The context is now generated based on the user's query
+    context = get_context_for_prompt(user_query)
+    system_prompt = build_system_prompt(context)
     try:
         response = model.generate_content(system_prompt + "\n\nUser Question: " + user_query)
         return response.text
     except Exception as e:
-        return f"An error occurred while communicating with the AI model: {e}"
\ No newline at end of file
+        return f"An error occurred while communicating with the AI model: {e}"
+
+async def generate_ai_response_async(user_query: str):
+    """Async variant of generate_ai_response; neither the DB read nor the model call blocks a thread."""
+    # The first call imports and configures the SDK; keep that off the event loop.
+    model = await asyncio.to_thread(services.get, 'gemini')
+    if not model:
+        return "Error: The AI model is not configured correctly on the server."
+
+    context = await get_context_for_prompt_async(user_query)
+    system_prompt = build_system_prompt(context)
+    try:
+        response = await model.generate_content_async(system_prompt + "\n\nUser Question: " + user_query)
+        return response.text
+    except Exception as e:
+        return f"An error occurred while communicating with the AI model: {e}"
@@ -0,0 +1,85 @@
+# niftron/core/async_db.py
+
+import asyncio
+from contextlib import asynccontextmanager
+
+from .config import settings
+
+_async_pool = None
+
+
+async def open_async_pool(min_size: int = None, max_size: int = None, statement_timeout_ms: int = None):
+    """Opens the process-wide async connection pool (call once at app startup)."""
+    global _async_pool
+    if _async_pool is not None:
+        return _async_pool
+    # psycopg (v3) is only needed by the API; pipeline code sticks to psycopg2
+    # and never pays for importing it.
+    try:
+        from psycopg_pool import AsyncConnectionPool
+    except ImportError:
+        raise RuntimeError("Async database access needs the 'psycopg[binary]' and 'psycopg_pool' packages.")
+
+    timeout = settings.DB_STATEMENT_TIMEOUT_MS if statement_timeout_ms is None else statement_timeout_ms
+    pool = AsyncConnectionPool(
+        settings.DATABASE_URL,
+        min_size=settings.DB_POOL_MIN_SIZE if min_size is None else min_size,
+        max_size=settings.DB_POOL_MAX_SIZE if max_size is None else max_size,
+        timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+        max_idle=settings.DB_POOL_HEALTHCHECK_SECONDS * 10,
+        # Validates each connection as it is handed out.
+        check=AsyncConnectionPool.check_connection,
+        kwargs={'options': f"-c statement_timeout={int(timeout)}"} if timeout else None,
+        open=False,
+    )
+    await pool.open()
+    _async_pool = pool
+    print(f"Async database pool opened (min={pool.min_size}, max={pool.max_size}).")
+    return pool
+
+async def close_async_pool():
+    global _async_pool
+    if _async_pool is None:
+        return
+    await _async_pool.close()
+    _async_pool = None
+    print("Async database pool closed.")
+
+def async_pool_is_open() -> bool:
+    return _async_pool is not None
+
+@asynccontextmanager
+async def get_async_db_connection():
+    """
+    Borrows a connection from the async pool. The transaction is committed
+    when the block exits cleanly and rolled back on error.
+    """
+    if _async_pool is None:
+        raise RuntimeError("The async database pool is not open; call open_async_pool() first.")
+    async with _async_pool.connection() as conn:
+        yield conn
+
+async def listen_forever(channel: str, on_notify, on_reconnect=None, retry_seconds: float = 5.0):
+    """
+    LISTENs on a Postgres channel on a dedicated autocommit connection and
+    calls on_notify(payload) for every NOTIFY. Runs until cancelled.
+
+    Notifications sent while the connection was down are lost, so after
+    every (re)connect on_reconnect() is called to let callers resync.
+    """
+    from psycopg import AsyncConnection, sql
+
+    while True:
+        try:
+            async with await AsyncConnection.connect(settings.DATABASE_URL, autocommit=True) as conn:
+                await conn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(channel)))
+                print(f"Listening for '{channel}' notifications.")
+                if on_reconnect:
+                    on_reconnect()
+                async for notify in conn.notifies():
+                    on_notify(notify.payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"!!! Lost the '{channel}' listener ({e!r}); retrying in {retry_seconds}s !!!")
+            await asyncio.sleep(retry_seconds)
@@ -0,0 +1,82 @@
+# niftron/core/bulk.py
+
+import io
+from typing import List, Optional
+
+import pandas as pd
+from psycopg2 import sql
+
+
+def frame_to_csv_buffer(df: pd.DataFrame) -> io.StringIO:
+    """
+    Serializes a DataFrame into an in-memory CSV buffer suitable for COPY.
+    NaN/None become empty unquoted fields, which COPY reads as NULL.
+    """
+    buf = io.StringIO()
+    df.to_csv(buf, index=False, header=False, na_rep='')
+    buf.seek(0)
+    return buf
+
+def copy_upsert(conn, df: pd.DataFrame, table: str, columns: List[str],
+                conflict_columns: Optional[List[str]] = None,
+                update_columns: Optional[List[str]] = None) -> int:
+    """
+    Bulk-writes a DataFrame with COPY FROM STDIN into a temporary staging
+    table and merges it into `table` with a single INSERT ... SELECT.
+
+    Args:
+        conn: An open psycopg2 connection. The caller owns the transaction
+              and must commit; the staging table is dropped on commit.
+        df (pd.DataFrame): Rows to write. Only `columns` are sent, in that order.
+        table (str): Target table name.
+        columns (list): Target column names, matching df columns.
+        conflict_columns (list, optional): Unique key for ON CONFLICT. When
+              omitted, rows are inserted without a conflict clause.
+        update_columns (list, optional): Columns overwritten on conflict.
+              When omitted, conflicting rows are left untouched (DO NOTHING).
+
+    Returns:
+        int: The number of rows inserted or updated.
+    """
+    if df.empty:
+        return 0
+
+    stage = sql.Identifier(f"_stage_{table}")
+    target = sql.Identifier(table)
+    cols = sql.SQL(', ').join(sql.Identifier(c) for c in columns)
+
+    merge = sql.SQL("INSERT INTO {target} ({cols}) SELECT {cols} FROM {stage}").format(
+        target=target, cols=cols, stage=stage
+    )
+    if conflict_columns:
+        conflict = sql.SQL(', ').join(sql.Identifier(c) for c in conflict_columns)
+        if update_columns:
+            updates = sql.SQL(', ').join(
+                sql.SQL("{col} = EXCLUDED.{col}").format(col=sql.Identifier(c)) for c in update_columns
+            )
+            merge += sql.SQL(" ON CONFLICT ({conflict}) DO UPDATE SET {updates}").format(
+                conflict=conflict, updates=updates
+            )
+        else:
+            merge += sql.SQL(" ON CONFLICT ({conflict}) DO NOTHING").format(conflict=conflict)
+
+    with conn.cursor() as cur:
+        # The staging table copies the target's column types but none of its
+        # constraints or defaults, so COPY never trips over serial keys.
+        cur.execute(sql.SQL("DROP TABLE IF EXISTS {stage}").format(stage=stage))
+        cur.execute(sql.SQL(
+            "CREATE TEMP TABLE {stage} ON COMMIT DROP AS SELECT {cols} FROM {target} WITH NO DATA"
+        ).format(stage=stage, cols=cols, target=target))
+        cur.copy_expert(
+            sql.SQL("COPY {stage} ({cols}) FROM STDIN WITH (FORMAT csv)").format(stage=stage, cols=cols),
+            frame_to_csv_buffer(df[columns]),
+        )
+        cur.execute(merge)
+        return cur.rowcount
+
+def date_column(index: pd.Index) -> pd.DatetimeIndex:
+    """Normalizes a (possibly tz-aware) datetime index to naive midnight dates."""
+    dates = pd.DatetimeIndex(index)
+    if dates.tz is not None:
+        dates = dates.tz_localize(None)
+    return dates.normalize()
@@ -0,0 +1,207 @@
+# niftron/core/cache.py
+
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, Hashable, Optional
+
+_MISSING = object()
+
+# Every cache created in this process, by name, for stats reporting.
+_registry: Dict[str, "SingleFlightCache"] = {}
+_registry_lock = threading.Lock()
+
+
+class _Entry:
+    __slots__ = ('value', 'loaded_at')
+
+    def __init__(self, value, loaded_at: float):
+        self.value = value
+        self.loaded_at = loaded_at
+
+
+class _KeyLock:
+    """A per-key load lock, kept only while some caller holds or waits for it."""
+    __slots__ = ('lock', 'users')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = 0
+
+
+class SingleFlightCache:
+    """
+    A thread-safe in-memory cache for expensive loads.
+
+    - Single flight: concurrent misses on the same key wait for one loader
+      call instead of all running it.
+    - Stale-while-revalidate: for `stale_ttl` seconds after an entry expires,
+      callers get the old value immediately while one background thread
+      reloads it.
+    - Stats: hits, misses, stale hits, refreshes, errors and load latency.
+
+    Entries are evicted least-recently-used beyond `maxsize`.
+    """
+
+    def __init__(self, name: str, ttl: float, stale_ttl: float = 0, maxsize: int = 128):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._key_locks: Dict[Hashable, _KeyLock] = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0, 'misses': 0, 'stale_hits': 0, 'refreshes': 0, 'errors': 0,
+            'load_count': 0, 'load_seconds_total': 0.0, 'load_seconds_max': 0.0,
+        }
+        with _registry_lock:
+            _registry[name] = self
+
+    # --- Lookup ---
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Returns the cached value for key, calling loader() at most once per expiry."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = now - entry.loaded_at
+                if age < self.ttl:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return entry.value
+                if age < self.ttl + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    self._stats['stale_hits'] += 1
+                    start_refresh = key not in self._refreshing
+                    if start_refresh:
+                        self._refreshing.add(key)
+                        key_lock = self._acquire_key_lock(key)
+                    stale_value = entry.value
+                else:
+                    entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                key_lock = self._acquire_key_lock(key)
+
+        if entry is not None:
+            if start_refresh:
+                threading.Thread(
+                    target=self._refresh, args=(key, loader, key_lock),
+                    name=f"cache-refresh-{self.name}", daemon=True,
+                ).start()
+            return stale_value
+
+        # Single flight: the first caller loads, the rest wait for its result.
+        try:
+            with key_lock.lock:
+                value = self._peek(key)
+                if value is not _MISSING:
+                    return value
+                return self._load(key, loader)
+        finally:
+            self._release_key_lock(key, key_lock)
+
+    def cached(self, key: Callable[..., Hashable] = None):
+        """Decorator form; key(*args, **kwargs) defaults to the call arguments."""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                cache_key = key(*args, **kwargs) if key else (args, tuple(sorted(kwargs.items())))
+                return self.get(cache_key, lambda: func(*args, **kwargs))
+            wrapper.cache = self
+            return wrapper
+        return decorator
+
+    def invalidate(self, key: Hashable = _MISSING) -> None:
+        """
+        Drops one key, or every entry when no key is given. Key locks need no
+        pruning: they only exist while a load of their key is in flight.
+        """
+        with self._lock:
+            if key is _MISSING:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+            stats['loads_in_flight'] = len(self._key_locks)
+        lookups = stats['hits'] + stats['stale_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['stale_hits']) / lookups if lookups else 0.0
+        stats['load_seconds_avg'] = stats['load_seconds_total'] / stats['load_count'] if stats['load_count'] else 0.0
+        return stats
+
+    # --- Internals ---
+
+    def _acquire_key_lock(self, key: Hashable) -> _KeyLock:
+        # Called with self._lock held; every caller must release it again.
+        key_lock = self._key_locks.get(key)
+        if key_lock is None:
+            key_lock = self._key_locks[key] = _KeyLock()
+        key_lock.users += 1
+        return key_lock
+
+    def _release_key_lock(self, key: Hashable, key_lock: _KeyLock) -> None:
+        # The last user drops it, so locks never outlive their loads and a key
+        # never has two locks at once (which would let it load twice).
+        with self._lock:
+            key_lock.users -= 1
+            if key_lock.users == 0:
+                del self._key_locks[key]
+
+    def _peek(self, key: Hashable) -> Any:
+        # A value some other thread loaded while we waited for the key lock.
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry.loaded_at < self.ttl:
+                return entry.value
+        return _MISSING
+
+    def _load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        started = time.perf_counter()
+        try:
+            value = loader()
+        except Exception:
+            with self._lock:
+                self._stats['errors'] += 1
+            raise
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._entries[key] = _Entry(value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            self._stats['load_count'] += 1
+            self._stats['load_seconds_total'] += elapsed
+            self._stats['load_seconds_max'] = max(self._stats['load_seconds_max'], elapsed)
+        return value
+
+    def _refresh(self, key: Hashable, loader: Callable[[], Any], key_lock: _KeyLock) -> None:
+        try:
+            with key_lock.lock:
+                self._load(key, loader)
+            with self._lock:
+                self._stats['refreshes'] += 1
+        except Exception as e:
+            print(f"!!! Background refresh of cache '{self.name}' failed; serving stale value: {e!r} !!!")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+            self._release_key_lock(key, key_lock)
+
+
+def get_cache(name: str) -> Optional[SingleFlightCache]:
+    with _registry_lock:
+        return _registry.get(name)
+
+def all_cache_stats() -> Dict[str, dict]:
+    """Stats of every cache in this process, by name."""
+    with _registry_lock:
+        caches = list(_registry.values())
+    return {cache.name: cache.stats() for cache in caches}
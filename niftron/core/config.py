@@ -10,6 +10,93 @@ class Settings:
     # Provide a default value for settings that might not be in the .env file
     MARKET_SUFFIX: str = os.getenv("MARKET_SUFFIX", ".NS")
 
+    # --- Ingestion ---
+    # "incremental" only fetches bars after each stock's latest stored date,
+    # "full" re-downloads the whole backfill period for every stock.
+    INGESTION_MODE: str = os.getenv("INGESTION_MODE", "incremental")
+    INGESTION_BACKFILL_PERIOD: str = os.getenv("INGESTION_BACKFILL_PERIOD", "5y")
+    # Calendar days re-fetched before the high-water mark to pick up revisions.
+    INGESTION_OVERLAP_DAYS: int = int(os.getenv("INGESTION_OVERLAP_DAYS", "5"))
+    # A stock whose latest bar is older than this is treated as gappy and fully backfilled.
+    INGESTION_MAX_GAP_DAYS: int = int(os.getenv("INGESTION_MAX_GAP_DAYS", "30"))
+    # Where bars come from: "yfinance" or "local" (a directory of CSV/Parquet files).
+    MARKET_DATA_SOURCE: str = os.getenv("MARKET_DATA_SOURCE", "yfinance")
+    MARKET_DATA_DIR: str = os.getenv("MARKET_DATA_DIR", "")
+    INGESTION_MAX_WORKERS: int = int(os.getenv("INGESTION_MAX_WORKERS", "4"))
+    INGESTION_RATE_PER_SEC: float = float(os.getenv("INGESTION_RATE_PER_SEC", "2"))
+    INGESTION_BURST: int = int(os.getenv("INGESTION_BURST", "4"))
+    INGESTION_MAX_RETRIES: int = int(os.getenv("INGESTION_MAX_RETRIES", "3"))
+    INGESTION_BACKOFF_SECONDS: float = float(os.getenv("INGESTION_BACKOFF_SECONDS", "1"))
+    # Tickers per request for sources that support multi-ticker downloads.
+    INGESTION_BATCH_SIZE: int = int(os.getenv("INGESTION_BATCH_SIZE", "25"))
+
+    # --- Feature processing ---
+    # "incremental" advances persisted indicator state by the new bars only,
+    # "full" recomputes every stock from its whole price history.
+    FEATURES_MODE: str = os.getenv("FEATURES_MODE", "incremental")
+    # Stocks are fully recomputed at least this often to correct drift from revised prices.
+    FEATURES_FULL_RECOMPUTE_DAYS: int = int(os.getenv("FEATURES_FULL_RECOMPUTE_DAYS", "7"))
+
+    # --- Training dataset cache ---
+    # "incremental" appends newly arrived dates to the cached prepared dataset,
+    # "full" rebuilds it whenever the data changes, "off" always reads the database.
+    DATASET_CACHE_MODE: str = os.getenv("DATASET_CACHE_MODE", "incremental")
+    # Defaults to .dataset_cache/ in the project root.
+    DATASET_CACHE_DIR: str = os.getenv("DATASET_CACHE_DIR", "")
+    # An incrementally grown cache is rebuilt from scratch at least this often.
+    DATASET_CACHE_FULL_REBUILD_DAYS: int = int(os.getenv("DATASET_CACHE_FULL_REBUILD_DAYS", "7"))
+
+    # --- Model registry ---
+    # Versioned LEM artifacts and the CURRENT pointer; defaults to
+    # niftron/ml_model/registry/. docker-compose points the API and Airflow
+    # containers at one shared volume, so both see every promoted version.
+    MODEL_REGISTRY_DIR: str = os.getenv("MODEL_REGISTRY_DIR", "")
+    # How often each API worker checks the CURRENT pointer (0 disables; POST
+    # /api/v1/model/reload always works).
+    MODEL_WATCH_SECONDS: float = float(os.getenv("MODEL_WATCH_SECONDS", "30"))
+    # Re-run the analysis when the API swaps in a new model, so stored
+    # recommendations are scored by it.
+    MODEL_RELOAD_RESCORE: bool = os.getenv("MODEL_RELOAD_RESCORE", "true").lower() in ("1", "true", "yes")
+
+    # --- Parallel execution ---
+    # Worker processes for per-stock stages (processing, analysis, data prep).
+    PIPELINE_WORKERS: int = int(os.getenv("PIPELINE_WORKERS", str(os.cpu_count() or 1)))
+
+    # --- Database pooling (API) ---
+    DB_POOL_MIN_SIZE: int = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+    DB_POOL_MAX_SIZE: int = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+    # How long a request waits for a free pooled connection.
+    DB_POOL_TIMEOUT_SECONDS: float = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+    # Pooled connections idle longer than this are pinged before reuse.
+    DB_POOL_HEALTHCHECK_SECONDS: float = float(os.getenv("DB_POOL_HEALTHCHECK_SECONDS", "30"))
+    # Applied to pooled connections only; pipeline jobs connect without it.
+    DB_STATEMENT_TIMEOUT_MS: int = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+
+    # --- Observability ---
+    # Stage timings are logged as one JSON object per line ("json") or, for
+    # local runs, as readable key=value lines ("console").
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")
+
+    # --- Background jobs ---
+    # "inprocess" runs API-submitted jobs on a thread of the API worker (with
+    # sharded stages serial, as the server must not fork), "queue" leaves
+    # them in the jobs table for scripts/run_job_worker.py.
+    JOB_EXECUTOR: str = os.getenv("JOB_EXECUTOR", "inprocess")
+    JOB_HEARTBEAT_SECONDS: float = float(os.getenv("JOB_HEARTBEAT_SECONDS", "15"))
+    # A running job without a heartbeat for this long is marked failed.
+    JOB_STALE_SECONDS: float = float(os.getenv("JOB_STALE_SECONDS", "120"))
+    # A job still queued after this long (no worker running) is marked failed.
+    JOB_QUEUE_TIMEOUT_SECONDS: float = float(os.getenv("JOB_QUEUE_TIMEOUT_SECONDS", "3600"))
+
+    # --- API caching ---
+    # How long the API trusts its view of the latest stored backtest run, and
+    # how long after that it keeps serving it while one refresh runs.
+    BACKTEST_CACHE_TTL_SECONDS: float = float(os.getenv("BACKTEST_CACHE_TTL_SECONDS", "300"))
+    BACKTEST_CACHE_STALE_SECONDS: float = float(os.getenv("BACKTEST_CACHE_STALE_SECONDS", "43200"))
+    # The recommendations snapshot is dropped on every NOTIFY from the
+    # pipeline; this bounds its age should a notification be missed.
+    RECOMMENDATIONS_SNAPSHOT_MAX_AGE_SECONDS: float = float(os.getenv("RECOMMENDATIONS_SNAPSHOT_MAX_AGE_SECONDS", "3600"))
+
 settings = Settings()
 
 
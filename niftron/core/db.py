@@ -1,15 +1,128 @@
 # niftron/core/db.py
 
+import os
+import threading
+import time
+
 import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError, ThreadedConnectionPool
 from .config import settings
 from contextlib import contextmanager
 
+_pool = None
+_pool_slots = None
+# id(conn) -> monotonic time the connection was last known healthy.
+_last_checked = {}
+_pool_lock = threading.Lock()
+
+
+def _connect_kwargs(statement_timeout_ms: int = None) -> dict:
+    kwargs = {}
+    if statement_timeout_ms:
+        kwargs['options'] = f"-c statement_timeout={int(statement_timeout_ms)}"
+    return kwargs
+
+def init_pool(min_size: int = None, max_size: int = None, statement_timeout_ms: int = None) -> ThreadedConnectionPool:
+    """
+    Opens the process-wide connection pool. Once open, get_db_connection()
+    borrows from it instead of connecting per call. Meant for long-running
+    processes such as the API; call close_pool() at shutdown.
+    """
+    global _pool, _pool_slots
+    with _pool_lock:
+        if _pool is not None:
+            return _pool
+        min_size = settings.DB_POOL_MIN_SIZE if min_size is None else min_size
+        max_size = settings.DB_POOL_MAX_SIZE if max_size is None else max_size
+        timeout = settings.DB_STATEMENT_TIMEOUT_MS if statement_timeout_ms is None else statement_timeout_ms
+        _pool = ThreadedConnectionPool(min_size, max_size, settings.DATABASE_URL, **_connect_kwargs(timeout))
+        # ThreadedConnectionPool raises when exhausted; the semaphore makes callers wait instead.
+        _pool_slots = threading.BoundedSemaphore(max_size)
+        print(f"Database pool opened (min={min_size}, max={max_size}, statement_timeout={timeout}ms).")
+        return _pool
+
+def close_pool():
+    """Closes every pooled connection. get_db_connection() falls back to direct connections."""
+    global _pool, _pool_slots
+    with _pool_lock:
+        if _pool is None:
+            return
+        _pool.closeall()
+        _pool, _pool_slots = None, None
+        _last_checked.clear()
+        print("Database pool closed.")
+
+def _forget_pool_in_child():
+    # A forked worker (e.g. a run_sharded process) shares the parent's sockets;
+    # closing them here would end the parent's sessions, so just drop them.
+    global _pool, _pool_slots
+    _pool, _pool_slots = None, None
+    _last_checked.clear()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_pool_in_child)
+
+def _is_healthy(conn) -> bool:
+    if conn.closed:
+        return False
+    last = _last_checked.get(id(conn))
+    if last is not None and time.monotonic() - last < settings.DB_POOL_HEALTHCHECK_SECONDS:
+        return True
+    # Idle for a while: the server or a proxy may have dropped it.
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")
+        conn.rollback()
+    except psycopg2.Error:
+        return False
+    _last_checked[id(conn)] = time.monotonic()
+    return True
+
+@contextmanager
+def _pooled_connection(pool: ThreadedConnectionPool, slots: threading.BoundedSemaphore):
+    if not slots.acquire(timeout=settings.DB_POOL_TIMEOUT_SECONDS):
+        raise PoolError("Timed out waiting for a pooled database connection.")
+    conn = None
+    try:
+        conn = pool.getconn()
+        if not _is_healthy(conn):
+            _last_checked.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+            conn = pool.getconn()
+            _last_checked[id(conn)] = time.monotonic()
+        yield conn
+    finally:
+        if conn is not None:
+            broken = bool(conn.closed)
+            if not broken and conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                # Never hand the next borrower an open or failed transaction.
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            if broken:
+                _last_checked.pop(id(conn), None)
+            pool.putconn(conn, close=broken)
+        slots.release()
+
 @contextmanager
 def get_db_connection():
     """
     Provides a database connection using a context manager.
-    Ensures the connection is closed after use.
+    Borrows from the pool when init_pool() has been called, otherwise opens
+    a new connection. Ensures the connection is released after use.
     """
+    pool, slots = _pool, _pool_slots
+    if pool is not None:
+        try:
+            with _pooled_connection(pool, slots) as conn:
+                yield conn
+        except Exception as e:
+            print(f"Database connection error: {e}")
+            raise
+        return
+
     conn = None
     try:
         conn = psycopg2.connect(settings.DATABASE_URL)
@@ -20,4 +133,3 @@ def get_db_connection():
     finally:
         if conn:
             conn.close()
-
@@ -0,0 +1,205 @@
+# niftron/core/jobs.py
+
+import importlib
+import os
+import socket
+import threading
+import time
+import traceback
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from niftron.core.config import settings
+from niftron.core.metrics import span
+from niftron.core.parallel import serial_shards
+from niftron.data_access.jobs import (
+    ACTIVE_STATES, claim_job, claim_next_job, create_or_join_job, fail_stale_jobs, finish_job,
+    get_job, get_queued_jobs, heartbeat_job
+)
+
+# kind -> "module:function" run by whichever executor picks the job up.
+# Imported lazily so submitting a job never loads the pipeline code.
+JOB_HANDLERS: Dict[str, str] = {
+    'run_analysis': 'niftron.analysis.main:run_analysis_and_rank',
+    'refresh_backtest': 'niftron.analysis.backtest:refresh_backtest_job',
+}
+
+
+def _resolve_handler(kind: str) -> Callable[[], None]:
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"No handler registered for job kind '{kind}'.")
+    module_name, func_name = JOB_HANDLERS[kind].split(':')
+    return getattr(importlib.import_module(module_name), func_name)
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def expire_jobs() -> None:
+    """Fails dead running jobs and long-unclaimed queued ones (see fail_stale_jobs)."""
+    failed = fail_stale_jobs(settings.JOB_STALE_SECONDS, settings.JOB_QUEUE_TIMEOUT_SECONDS)
+    if failed:
+        print(f"Marked {failed} stale job(s) as failed.")
+
+def execute_job(job: dict) -> None:
+    """
+    Runs an already-claimed job, heartbeating while it runs, and records
+    whether it succeeded. Errors are stored on the job, never raised.
+    """
+    job_id, kind = job['job_id'], job['kind']
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(settings.JOB_HEARTBEAT_SECONDS):
+            try:
+                heartbeat_job(job_id)
+            except Exception as e:
+                print(f"!!! Heartbeat for job {job_id} failed: {e!r} !!!")
+
+    heartbeat = threading.Thread(target=beat, name=f"job-heartbeat-{job_id}", daemon=True)
+    heartbeat.start()
+    print(f"Job {job_id} ({kind}) started on {worker_name()}.")
+    started = time.perf_counter()
+    error = None
+    try:
+        with span(f'job.{kind}', job_id=str(job_id)):
+            _resolve_handler(kind)()
+    except Exception:
+        error = traceback.format_exc()
+        print(f"!!! Job {job_id} ({kind}) failed !!!\n{error}")
+    finally:
+        stop.set()
+        heartbeat.join()
+    finish_job(job_id, error)
+    print(f"Job {job_id} ({kind}) finished in {time.perf_counter() - started:.1f}s.")
+
+
+class JobExecutor(ABC):
+    """Decides where a newly queued job runs."""
+    name = "base"
+
+    @abstractmethod
+    def dispatch(self, job: dict) -> None:
+        """Called once for every job that submit_job() newly queued."""
+
+
+class InProcessExecutor(JobExecutor):
+    """
+    Runs jobs on a single background thread of the submitting process.
+    That process is usually a live API worker, which must not fork, so
+    sharded stages run serially; use the queue executor for parallel jobs.
+    """
+    name = "inprocess"
+
+    def __init__(self):
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="niftron-job")
+
+    def dispatch(self, job: dict) -> None:
+        self._pool.submit(self._run, job)
+
+    @staticmethod
+    def _run(job: dict) -> None:
+        if claim_job(job['job_id'], worker_name()):
+            with serial_shards():
+                execute_job(job)
+
+
+class QueueExecutor(JobExecutor):
+    """Leaves jobs queued in the database for scripts/run_job_worker.py to claim."""
+    name = "queue"
+
+    def dispatch(self, job: dict) -> None:
+        pass
+
+
+EXECUTORS = {executor.name: executor for executor in (InProcessExecutor, QueueExecutor)}
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor(name: str = None) -> JobExecutor:
+    """The process-wide executor (settings.JOB_EXECUTOR)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None or (name and _executor.name != name):
+            name = name or settings.JOB_EXECUTOR
+            if name not in EXECUTORS:
+                raise ValueError(f"Unknown job executor '{name}'. Choose from: {', '.join(EXECUTORS)}")
+            _executor = EXECUTORS[name]()
+        return _executor
+
+def submit_job(kind: str) -> tuple:
+    """
+    Queues a job of this kind, or joins the one already queued or running.
+
+    Returns:
+        (job, created): the job row as a dict, and whether it is new.
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind '{kind}'.")
+    # A job whose worker died would otherwise block its kind forever.
+    expire_jobs()
+    job, created = create_or_join_job(kind)
+    if created:
+        get_executor().dispatch(job)
+    return job, created
+
+def dispatch_queued_jobs() -> int:
+    """
+    Hands jobs left queued (e.g. by an API restart before its thread claimed
+    them) to this process's executor. Called at API startup; claiming is
+    atomic, so several workers doing this at once run each job once.
+    """
+    expire_jobs()
+    executor = get_executor()
+    if isinstance(executor, QueueExecutor):
+        return 0
+    jobs = get_queued_jobs(list(JOB_HANDLERS))
+    for job in jobs:
+        executor.dispatch(job)
+    return len(jobs)
+
+def run_job(kind: str, poll_seconds: float = 5.0) -> dict:
+    """
+    Runs a job of this kind in the calling process, through the jobs table,
+    so pipeline runs (Airflow) and API-submitted jobs never run at once.
+    A job already running elsewhere may predate the caller's data, so it is
+    waited for and a new one is run after it.
+
+    Returns:
+        dict: The finished job row. Raises RuntimeError if it failed.
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind '{kind}'.")
+    name = worker_name()
+    while True:
+        expire_jobs()
+        job, _ = create_or_join_job(kind)
+        if claim_job(job['job_id'], name):
+            execute_job(job)
+            break
+        print(f"Waiting for {kind} job {job['job_id']} running on {job['worker']}...")
+        while job is not None and job['state'] in ACTIVE_STATES:
+            time.sleep(poll_seconds)
+            expire_jobs()
+            job = get_job(str(job['job_id']))
+
+    job = get_job(str(job['job_id']))
+    if job['state'] != 'succeeded':
+        raise RuntimeError(f"Job {job['job_id']} ({kind}) {job['state']}: {job['error']}")
+    return job
+
+def run_worker(kinds: List[str] = None, poll_seconds: float = 5.0, once: bool = False) -> None:
+    """Claims and runs queued jobs until interrupted (or the queue is empty, with once)."""
+    kinds = kinds or list(JOB_HANDLERS)
+    name = worker_name()
+    print(f"Job worker {name} polling for: {', '.join(kinds)}")
+    while True:
+        expire_jobs()
+        job = claim_next_job(kinds, name)
+        if job is not None:
+            execute_job(job)
+            continue
+        if once:
+            return
+        time.sleep(poll_seconds)
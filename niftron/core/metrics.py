@@ -0,0 +1,272 @@
+# niftron/core/metrics.py
+
+import bisect
+import contextvars
+import datetime
+import json
+import math
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from niftron.core.config import settings
+
+# structlog is optional: without it the same events are printed as JSON lines.
+try:
+    import structlog
+except ImportError:
+    structlog = None
+
+# Seconds; wide enough for both API requests and whole pipeline stages.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    """A monotonically increasing total per label set."""
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    """Bucketed observations (e.g. latencies) per label set, Prometheus-style."""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [per-bucket counts (+Inf last), sum, count]
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = {key: ([*state[0]], state[1], state[2]) for key, state in self._values.items()}
+        lines = []
+        for key, (counts, total, count) in sorted(values.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, math.inf), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+# A collector returns extra metric families at scrape time:
+# [(name, kind, documentation, [(labels, value), ...]), ...]
+Collector = Callable[[], List[Tuple[str, str, str, List[Tuple[dict, float]]]]]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Collector] = []
+        self._lock = threading.Lock()
+
+    def _add(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collector: Collector) -> None:
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics, collectors = list(self._metrics.values()), list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                print(f"!!! Metrics collector {collector.__name__} failed: {e!r} !!!")
+                continue
+            for name, kind, documentation, samples in families:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for labels, value in samples)
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    'niftron_stage_duration_seconds', 'Wall time of pipeline stages and their sub-steps.', ['stage', 'status'],
+)
+STAGE_ROWS = registry.counter('niftron_stage_rows_total', 'Rows handled by pipeline stages.', ['stage'])
+
+
+# --- Structured logging ---
+
+_context: contextvars.ContextVar = contextvars.ContextVar('niftron_log_context', default={})
+_logging_configured = False
+
+
+def configure_logging() -> None:
+    """Sets structlog up to print one JSON object per event (settings.LOG_FORMAT='console' for humans)."""
+    global _logging_configured
+    if _logging_configured or structlog is None:
+        _logging_configured = True
+        return
+    renderer = structlog.dev.ConsoleRenderer() if settings.LOG_FORMAT == 'console' else structlog.processors.JSONRenderer()
+    structlog.configure(
+        processors=[
+            structlog.contextvars.merge_contextvars,
+            structlog.processors.add_log_level,
+            structlog.processors.TimeStamper(fmt='iso', utc=True),
+            renderer,
+        ],
+        # One write() per event, so lines from forked shard workers never interleave.
+        logger_factory=structlog.WriteLoggerFactory(),
+        cache_logger_on_first_use=True,
+    )
+    _logging_configured = True
+
+def bind_context(**fields) -> None:
+    """Adds fields (e.g. the Airflow task) to every event logged afterwards in this context."""
+    _context.set({**_context.get(), **fields})
+    if structlog is not None:
+        structlog.contextvars.bind_contextvars(**fields)
+
+def log_event(event: str, level: str = 'info', **fields) -> None:
+    configure_logging()
+    if structlog is not None:
+        getattr(structlog.get_logger('niftron'), level)(event, **fields)
+        return
+    record = {
+        **_context.get(), **fields, 'event': event, 'level': level,
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+    sys.stdout.write(json.dumps(record, default=str) + '\n')
+    sys.stdout.flush()
+
+
+# --- Spans ---
+
+class Span:
+    """A running stage timer; set `rows` (or call add_rows) to get throughput."""
+    __slots__ = ('stage', 'fields', 'rows')
+
+    def __init__(self, stage: str, fields: dict):
+        self.stage = stage
+        self.fields = fields
+        self.rows: Optional[int] = None
+
+    def add_rows(self, rows: int) -> None:
+        self.rows = (self.rows or 0) + int(rows)
+
+    def set(self, **fields) -> None:
+        self.fields.update(fields)
+
+
+@contextmanager
+def span(stage: str, **fields):
+    """
+    Times a pipeline stage or sub-step. On exit the duration goes into the
+    niftron_stage_duration_seconds histogram, rows into niftron_stage_rows_total,
+    and one structured 'stage' event is logged with the duration, rows,
+    rows/sec and any fields (e.g. symbol=...).
+    """
+    current = Span(stage, dict(fields))
+    started = time.perf_counter()
+    status = 'ok'
+    try:
+        yield current
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage, status=status)
+        extra = {}
+        if current.rows is not None:
+            STAGE_ROWS.inc(current.rows, stage=stage)
+            extra['rows'] = current.rows
+            extra['rows_per_sec'] = round(current.rows / elapsed, 1) if elapsed > 0 else None
+        log_event('stage', level='info' if status == 'ok' else 'error', stage=stage, status=status,
+                  duration_ms=round(elapsed * 1000, 2), **extra, **current.fields)
+
+def timed(stage: str):
+    """Decorator form of span() for a whole function."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,120 @@
+# niftron/core/parallel.py
+
+import multiprocessing
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Any, Callable, List, NamedTuple, Sequence
+
+from niftron.core.config import settings
+
+
+class ShardError(NamedTuple):
+    """A shard whose worker raised; `error` is the formatted traceback."""
+    index: int
+    items: list
+    error: str
+
+
+class ShardedRun(NamedTuple):
+    results: List[Any]
+    errors: List[ShardError]
+    seconds: float
+
+
+def make_shards(items: Sequence, n_shards: int) -> List[list]:
+    """Splits items into at most n_shards contiguous, near-equal shards."""
+    items = list(items)
+    n_shards = max(1, min(n_shards, len(items)))
+    size, extra = divmod(len(items), n_shards)
+    shards, start = [], 0
+    for i in range(n_shards):
+        end = start + size + (1 if i < extra else 0)
+        shards.append(items[start:end])
+        start = end
+    return [shard for shard in shards if shard]
+
+def _call_shard(func: Callable, index: int, shard: list):
+    # Runs inside the worker. Exceptions are turned into strings here so a
+    # failing shard never poisons the pool with an unpicklable error.
+    try:
+        return index, func(shard), None
+    except Exception:
+        return index, None, traceback.format_exc()
+
+_local = threading.local()
+
+@contextmanager
+def serial_shards():
+    """
+    Runs every run_sharded call made by this thread in the calling process.
+    For pipeline code run inside a server (e.g. an API job thread), where
+    forking would copy its event loop, pools and held locks into children.
+    """
+    previous = getattr(_local, 'serial', False)
+    _local.serial = True
+    try:
+        yield
+    finally:
+        _local.serial = previous
+
+def _can_fork_workers() -> bool:
+    # Daemonic processes (e.g. some Celery worker children) may not start
+    # their own child processes.
+    return not multiprocessing.current_process().daemon
+
+def run_sharded(func: Callable[[list], Any], items: Sequence, workers: int = None,
+                shards: int = None, label: str = "shards") -> ShardedRun:
+    """
+    Runs func over the item universe split into shards on a process pool.
+
+    func receives one shard (a list of items) and should open its own
+    database connection and return a compact result. Results come back in
+    shard order; failures are collected instead of aborting the run.
+
+    Args:
+        func: A module-level function (it must be picklable).
+        items: The universe to split, e.g. [(stock_id, symbol), ...].
+        workers (int, optional): Pool size. Defaults to settings.PIPELINE_WORKERS.
+              With 1 worker, or under serial_shards(), shards run in the
+              calling process.
+        shards (int, optional): Number of shards. Defaults to the worker count.
+        label (str): Name used in progress messages.
+
+    Returns:
+        ShardedRun: (results, errors, seconds).
+    """
+    workers = workers or settings.PIPELINE_WORKERS
+    if workers > 1 and not _can_fork_workers():
+        print("Running in a daemonic process; executing shards serially.")
+        workers = 1
+    if workers > 1 and getattr(_local, 'serial', False):
+        print("Running inside a server thread; executing shards serially.")
+        workers = 1
+    shard_list = make_shards(items, shards or workers)
+    started = time.perf_counter()
+    results = [None] * len(shard_list)
+    errors = []
+
+    def _collect(index, result, error, done):
+        if error is not None:
+            errors.append(ShardError(index, shard_list[index], error))
+            print(f"!!! {label} {index + 1}/{len(shard_list)} failed !!!\n{error}")
+        else:
+            results[index] = result
+        print(f"[{done}/{len(shard_list)} {label} done, {time.perf_counter() - started:.1f}s]")
+
+    if workers <= 1 or len(shard_list) <= 1:
+        for i, shard in enumerate(shard_list):
+            _collect(*_call_shard(func, i, shard), done=i + 1)
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(shard_list))) as pool:
+            futures = [pool.submit(_call_shard, func, i, shard) for i, shard in enumerate(shard_list)]
+            for done, future in enumerate(as_completed(futures), start=1):
+                _collect(*future.result(), done=done)
+
+    failed = {error.index for error in errors}
+    ok_results = [result for i, result in enumerate(results) if i not in failed]
+    return ShardedRun(ok_results, errors, time.perf_counter() - started)
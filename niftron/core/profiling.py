@@ -0,0 +1,138 @@
+# niftron/core/profiling.py
+
+import cProfile
+import datetime
+import io
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+
+# Read straight from the environment rather than through core.config, so
+# profiling also works for synthetic runs that have no DATABASE_URL.
+PROFILE_ENV = "NIFTRON_PROFILE"
+PROFILE_DIR_ENV = "NIFTRON_PROFILE_DIR"
+PROFILE_TOP_ENV = "NIFTRON_PROFILE_TOP"
+# Stack depth recorded per allocation; deeper is more useful and slower.
+PROFILE_FRAMES_ENV = "NIFTRON_PROFILE_TRACEMALLOC_FRAMES"
+
+_active = False
+
+
+def profiling_enabled() -> bool:
+    """True when NIFTRON_PROFILE is set (1/true/yes) or the command line has --profile."""
+    return os.getenv(PROFILE_ENV, "").lower() in ("1", "true", "yes") or "--profile" in sys.argv
+
+def _artifact_dir(stage: str, directory: str = None) -> str:
+    base = directory or os.getenv(PROFILE_DIR_ENV) or "profiles"
+    stamp = datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+    path = os.path.join(base, f"{stage}-{stamp}-{os.getpid()}")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def _top_functions(stats: pstats.Stats, top: int) -> list:
+    rows = []
+    for (filename, line, function), (_, calls, tottime, cumtime, _) in stats.stats.items():
+        rows.append({
+            'function': f"{function} ({os.path.basename(filename)}:{line})",
+            'calls': calls, 'tottime': tottime, 'cumtime': cumtime,
+        })
+    rows.sort(key=lambda row: row['cumtime'], reverse=True)
+    return rows[:top]
+
+def _write_reports(path: str, stage: str, profiler: cProfile.Profile, snapshot, peak_bytes: int,
+                   wall: float, top: int) -> dict:
+    profiler.dump_stats(os.path.join(path, "profile.prof"))
+    stats = pstats.Stats(profiler)
+
+    with open(os.path.join(path, "cprofile_top.txt"), "w") as f:
+        for key in ("cumulative", "tottime"):
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats(key).print_stats(top)
+            f.write(f"=== sorted by {key} ===\n{out.getvalue()}\n")
+
+    allocations = snapshot.statistics("lineno")[:top]
+    with open(os.path.join(path, "tracemalloc_top.txt"), "w") as f:
+        f.write(f"Peak traced memory: {peak_bytes / 2**20:.1f} MiB\n\n")
+        for stat in allocations:
+            f.write(f"{stat}\n")
+
+    summary = {
+        'stage': stage,
+        'wall_seconds': round(wall, 3),
+        'peak_traced_mib': round(peak_bytes / 2**20, 2),
+        'top_functions': _top_functions(stats, top),
+        'top_allocations': [
+            {'site': str(stat.traceback), 'size_kib': round(stat.size / 1024, 1), 'count': stat.count}
+            for stat in allocations
+        ],
+    }
+    with open(os.path.join(path, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+def _print_summary(path: str, summary: dict) -> None:
+    print(f"\n=== Profile of '{summary['stage']}': {summary['wall_seconds']:.2f}s wall, "
+          f"peak traced memory {summary['peak_traced_mib']:.1f} MiB ===")
+    print(f"{'cumtime':>9} {'tottime':>9} {'calls':>9}  function")
+    for row in summary['top_functions']:
+        print(f"{row['cumtime']:>9.3f} {row['tottime']:>9.3f} {row['calls']:>9}  {row['function']}")
+    print("Top allocation sites:")
+    for row in summary['top_allocations'][:5]:
+        print(f"  {row['size_kib']:>10.1f} KiB in {row['count']:>7} blocks  {row['site']}")
+    print(f"Artifacts (view profile.prof with snakeviz or pstats): {path}")
+    print("Note: shards run in worker processes are not profiled; set PIPELINE_WORKERS=1 to include them.\n")
+
+@contextmanager
+def profile(stage: str, top: int = None, directory: str = None):
+    """
+    Runs the block under cProfile and tracemalloc, writes profile.prof,
+    cprofile_top.txt, tracemalloc_top.txt and summary.json to a timestamped
+    directory, and prints a top-N summary. Nested calls run unprofiled.
+    """
+    global _active
+    if _active:
+        yield
+        return
+    top = top or int(os.getenv(PROFILE_TOP_ENV, "25"))
+    path = _artifact_dir(stage, directory)
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(int(os.getenv(PROFILE_FRAMES_ENV, "1")))
+    profiler = cProfile.Profile()
+    _active = True
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        wall = time.perf_counter() - started
+        _active = False
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if started_tracing:
+            tracemalloc.stop()
+        try:
+            _print_summary(path, _write_reports(path, stage, profiler, snapshot, peak, wall, top))
+        except Exception as e:
+            print(f"!!! Could not write the profile of '{stage}' to {path}: {e!r} !!!")
+
+def profiled(stage: str):
+    """
+    Decorator for pipeline entry points: profiles the call when
+    profiling_enabled(), otherwise calls straight through.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not profiling_enabled():
+                return func(*args, **kwargs)
+            with profile(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,64 @@
+# niftron/core/services.py
+
+import threading
+import time
+from typing import Any, Callable, Dict
+
+_MISSING = object()
+
+
+class ServiceRegistry:
+    """
+    Lazily built, process-wide singletons (ML models, API clients, ...).
+
+    Modules register a factory at import time, which costs nothing; the
+    factory runs on the first get() of that service, once per process, even
+    when several threads ask at the same moment. A forked child inherits
+    whatever its parent had already built.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._load_seconds: Dict[str, float] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, factory: Callable[[], Any]) -> None:
+        with self._lock:
+            self._factories[name] = factory
+            self._locks.setdefault(name, threading.Lock())
+
+    def get(self, name: str) -> Any:
+        instance = self._instances.get(name, _MISSING)
+        if instance is not _MISSING:
+            return instance
+        if name not in self._factories:
+            raise KeyError(f"No service registered under '{name}'.")
+        with self._locks[name]:
+            instance = self._instances.get(name, _MISSING)
+            if instance is _MISSING:
+                started = time.perf_counter()
+                instance = self._factories[name]()
+                self._load_seconds[name] = time.perf_counter() - started
+                self._instances[name] = instance
+                print(f"Service '{name}' initialized in {self._load_seconds[name]:.2f}s.")
+        return instance
+
+    def reset(self, *names: str) -> None:
+        """Forgets the named built services (all if none are named) at once; the next get() rebuilds them."""
+        with self._lock:
+            if not names:
+                self._instances.clear()
+            for name in names:
+                self._instances.pop(name, None)
+
+    def status(self) -> Dict[str, dict]:
+        """Which services are built and how long each took to build."""
+        return {
+            name: {'loaded': name in self._instances, 'load_seconds': self._load_seconds.get(name)}
+            for name in self._factories
+        }
+
+
+services = ServiceRegistry()
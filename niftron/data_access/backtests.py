@@ -0,0 +1,120 @@
+# niftron/data_access/backtests.py
+
+import datetime
+import json
+from typing import Any, Dict, Optional
+
+import pandas as pd
+
+from niftron.core.bulk import copy_upsert
+from niftron.core.db import get_db_connection
+
+RETURN_COLUMNS = ['lem_return', 'she_return', 'benchmark_return']
+
+def get_features_watermark() -> Optional[datetime.date]:
+    """The latest date with computed features, or None if the table is empty."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT MAX(date) FROM features;")
+            return cur.fetchone()[0]
+
+def get_latest_backtest_run(model_hash: Optional[str], oos_start: datetime.date) -> Optional[Dict[str, Any]]:
+    """
+    The most recent stored run for a model and OOS start (with its last
+    stored date), or None. With model_hash None, the most recently stored
+    run of any model.
+    """
+    query = """
+        SELECT r.run_id, r.model_hash, r.data_watermark, r.running_state, r.created_at,
+               (SELECT MAX(b.date) FROM backtest_returns b WHERE b.run_id = r.run_id)
+        FROM backtest_runs r
+        WHERE {model_filter} r.oos_start = %s
+        ORDER BY {order}
+        LIMIT 1;
+    """
+    if model_hash is None:
+        query = query.format(model_filter="", order="r.created_at DESC, r.run_id DESC")
+        params = (oos_start,)
+    else:
+        query = query.format(model_filter="r.model_hash = %s AND", order="r.data_watermark DESC, r.run_id DESC")
+        params = (model_hash, oos_start)
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            row = cur.fetchone()
+    if row is None:
+        return None
+    return {
+        "run_id": row[0], "model_hash": row[1], "data_watermark": row[2], "running_state": row[3] or {},
+        "created_at": row[4], "last_date": row[5],
+    }
+
+def load_backtest_returns(run_id: int) -> pd.DataFrame:
+    """Daily returns of a stored run, indexed by date."""
+    query = f"""
+        SELECT date, {', '.join(RETURN_COLUMNS)}
+        FROM backtest_returns
+        WHERE run_id = %s
+        ORDER BY date ASC;
+    """
+    with get_db_connection() as conn:
+        df = pd.read_sql(query, conn, params=(run_id,), index_col='date', parse_dates=['date'])
+    df.index.name = None
+    return df
+
+def _return_rows(run_id: int, returns_df: pd.DataFrame) -> pd.DataFrame:
+    rows = returns_df[RETURN_COLUMNS].copy()
+    rows.insert(0, 'date', pd.DatetimeIndex(returns_df.index).date)
+    rows.insert(0, 'run_id', run_id)
+    return rows
+
+def save_backtest_run(model_hash: str, data_watermark: datetime.date, oos_start: datetime.date,
+                      returns_df: pd.DataFrame, running_state: dict = None) -> int:
+    """
+    Stores a run's daily returns (columns RETURN_COLUMNS, date index) in one
+    transaction and drops older runs of the same model and OOS start.
+
+    Returns:
+        int: The new run_id.
+    """
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO backtest_runs (model_hash, data_watermark, oos_start, running_state)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (model_hash, data_watermark, oos_start)
+                DO UPDATE SET running_state = EXCLUDED.running_state, created_at = NOW()
+                RETURNING run_id;
+            """, (model_hash, data_watermark, oos_start, json.dumps(running_state or {})))
+            run_id = cur.fetchone()[0]
+            cur.execute("DELETE FROM backtest_returns WHERE run_id = %s;", (run_id,))
+            cur.execute("""
+                DELETE FROM backtest_runs
+                WHERE model_hash = %s AND oos_start = %s AND run_id <> %s;
+            """, (model_hash, oos_start, run_id))
+        copy_upsert(conn, _return_rows(run_id, returns_df), 'backtest_returns', ['run_id', 'date'] + RETURN_COLUMNS)
+        conn.commit()
+    return run_id
+
+def append_backtest_returns(run_id: int, data_watermark: datetime.date,
+                            returns_df: pd.DataFrame, running_state: dict) -> int:
+    """
+    Appends new trading days to a stored run and advances its watermark and
+    running state in one transaction.
+
+    Returns:
+        int: The number of rows written.
+    """
+    with get_db_connection() as conn:
+        stored = copy_upsert(
+            conn, _return_rows(run_id, returns_df), 'backtest_returns', ['run_id', 'date'] + RETURN_COLUMNS,
+            conflict_columns=['run_id', 'date'], update_columns=RETURN_COLUMNS,
+        )
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE backtest_runs
+                SET data_watermark = %s, running_state = %s, created_at = NOW()
+                WHERE run_id = %s;
+            """, (data_watermark, json.dumps(running_state), run_id))
+        conn.commit()
+    return stored
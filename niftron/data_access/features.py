@@ -0,0 +1,94 @@
+# niftron/data_access/features.py
+
+import datetime
+import pandas as pd
+from typing import Iterable, Optional, Tuple
+from niftron.core.db import get_db_connection
+
+FEATURE_COLUMNS = ['sma_50', 'sma_200', 'rsi_14', 'macd_value', 'macd_signal']
+
+def get_latest_features(bars: int, stock_ids: Optional[Iterable[int]] = None) -> pd.DataFrame:
+    """
+    Fetches only the trailing `bars` feature rows of every (or the given) stock.
+
+    Each stock is probed with a LATERAL subquery that walks the
+    (stock_id, date DESC) index and stops after `bars` rows, so the cost
+    grows with the universe size rather than with the length of history.
+
+    Returns:
+        pd.DataFrame: stock_id, symbol, date and the feature columns, sorted by
+                      symbol and then date ascending (the layout of a full read).
+    """
+    query = f"""
+        SELECT s.stock_id, s.symbol, f.date, {', '.join('f.' + c for c in FEATURE_COLUMNS)}
+        FROM stocks s
+        CROSS JOIN LATERAL (
+            SELECT date, {', '.join(FEATURE_COLUMNS)}
+            FROM features
+            WHERE stock_id = s.stock_id
+            ORDER BY date DESC
+            LIMIT %(bars)s
+        ) f
+        {{where}}
+        ORDER BY s.symbol, f.date ASC;
+    """
+    params = {'bars': int(bars)}
+    where = ""
+    if stock_ids is not None:
+        where = "WHERE s.stock_id = ANY(%(stock_ids)s)"
+        params['stock_ids'] = [int(s) for s in stock_ids]
+    with get_db_connection() as conn:
+        return pd.read_sql(query.format(where=where), conn, params=params)
+
+def get_dataset_watermark(before=None) -> Tuple[Optional[datetime.date], int, int]:
+    """
+    (latest date, row count, latest change_id) of the feature rows that have
+    a matching price row - the rows load_and_prepare_data is built from -
+    optionally counting only dates before `before`. The change_id moves on
+    every price or feature upsert, including in-place revisions.
+    """
+    query = """
+        SELECT MAX(f.date), COUNT(*),
+               (SELECT COALESCE(MAX(change_id), 0) FROM data_changes)
+        FROM features f
+        JOIN stocks s ON s.stock_id = f.stock_id
+        JOIN daily_price_data p ON p.stock_id = f.stock_id AND p.date = f.date
+        {where};
+    """
+    params = ()
+    where = ""
+    if before is not None:
+        where = "WHERE f.date < %s"
+        params = (before,)
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query.format(where=where), params)
+            max_date, rows, change_id = cur.fetchone()
+    return max_date, rows, change_id
+
+def record_data_change(conn, table_name: str, changed_from: datetime.date) -> None:
+    """Logs an upsert into table_name starting at changed_from; committed with the caller's transaction."""
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO data_changes (table_name, changed_from) VALUES (%s, %s);",
+                    (table_name, changed_from))
+
+def get_changed_from(after_change_id: int) -> Optional[datetime.date]:
+    """The earliest date written by any upsert logged after after_change_id, or None."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT MIN(changed_from) FROM data_changes WHERE change_id > %s;", (after_change_id,))
+            return cur.fetchone()[0]
+
+def prune_data_changes(keep_days: int) -> int:
+    """Drops change log entries older than keep_days; the latest one always stays."""
+    query = """
+        DELETE FROM data_changes
+        WHERE changed_at < NOW() - make_interval(days => %s)
+          AND change_id < (SELECT MAX(change_id) FROM data_changes);
+    """
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, (keep_days,))
+            pruned = cur.rowcount
+        conn.commit()
+    return pruned
@@ -0,0 +1,127 @@
+# niftron/data_access/jobs.py
+
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from niftron.core.db import get_db_connection
+
+JOB_COLUMNS = ['job_id', 'kind', 'state', 'submitted_at', 'started_at',
+               'heartbeat_at', 'finished_at', 'worker', 'error']
+ACTIVE_STATES = ('queued', 'running')
+
+_SELECT_JOB = f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs"
+
+def _to_job(row) -> Optional[Dict[str, Any]]:
+    return dict(zip(JOB_COLUMNS, row)) if row else None
+
+def create_or_join_job(kind: str) -> Tuple[Dict[str, Any], bool]:
+    """
+    Queues a job of this kind unless one is already queued or running.
+
+    Returns:
+        (job, created): created is False when the active job was joined.
+    """
+    insert = """
+        INSERT INTO jobs (job_id, kind) VALUES (%s, %s)
+        ON CONFLICT (kind) WHERE state IN ('queued', 'running') DO NOTHING
+        RETURNING job_id;
+    """
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            # The active job can finish between the two statements; retry then.
+            for _ in range(3):
+                cur.execute(insert, (str(uuid.uuid4()), kind))
+                created = cur.fetchone() is not None
+                cur.execute(f"{_SELECT_JOB} WHERE kind = %s AND state IN %s;", (kind, ACTIVE_STATES))
+                job = _to_job(cur.fetchone())
+                if job is not None:
+                    conn.commit()
+                    return job, created
+        raise RuntimeError(f"Could not create or join a '{kind}' job.")
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"{_SELECT_JOB} WHERE job_id = %s;", (job_id,))
+            return _to_job(cur.fetchone())
+
+def claim_job(job_id: str, worker: str) -> bool:
+    """Moves one queued job to running; False if someone else already took it."""
+    query = """
+        UPDATE jobs SET state = 'running', worker = %s, started_at = NOW(), heartbeat_at = NOW()
+        WHERE job_id = %s AND state = 'queued';
+    """
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, (worker, job_id))
+            claimed = cur.rowcount == 1
+        conn.commit()
+    return claimed
+
+def claim_next_job(kinds: List[str], worker: str) -> Optional[Dict[str, Any]]:
+    """Claims the oldest queued job of the given kinds; safe with several workers."""
+    query = f"""
+        UPDATE jobs SET state = 'running', worker = %s, started_at = NOW(), heartbeat_at = NOW()
+        WHERE job_id = (
+            SELECT job_id FROM jobs
+            WHERE state = 'queued' AND kind = ANY(%s)
+            ORDER BY submitted_at
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING {', '.join(JOB_COLUMNS)};
+    """
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, (worker, list(kinds)))
+            job = _to_job(cur.fetchone())
+        conn.commit()
+    return job
+
+def heartbeat_job(job_id: str) -> None:
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("UPDATE jobs SET heartbeat_at = NOW() WHERE job_id = %s AND state = 'running';", (job_id,))
+        conn.commit()
+
+def finish_job(job_id: str, error: str = None) -> None:
+    """Marks a running job succeeded, or failed with the given error."""
+    query = """
+        UPDATE jobs SET state = %s, error = %s, finished_at = NOW()
+        WHERE job_id = %s AND state = 'running';
+    """
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, ('failed' if error else 'succeeded', error, job_id))
+        conn.commit()
+
+def get_queued_jobs(kinds: List[str]) -> List[Dict[str, Any]]:
+    """Jobs of the given kinds still waiting to be claimed, oldest first."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"{_SELECT_JOB} WHERE state = 'queued' AND kind = ANY(%s) ORDER BY submitted_at;",
+                        (list(kinds),))
+            return [_to_job(row) for row in cur.fetchall()]
+
+def fail_stale_jobs(stale_seconds: float, queue_timeout_seconds: float) -> int:
+    """
+    Fails running jobs whose heartbeat stopped (their worker died) and
+    queued jobs nobody claimed in time (no worker, or the API restarted
+    before its thread got to them), so neither blocks its kind forever.
+    """
+    # claim_job sets heartbeat_at, so a running job always has one; the
+    # fallbacks only keep a hand-edited row from being ignored forever.
+    query = """
+        UPDATE jobs SET state = 'failed', finished_at = NOW(),
+                        error = CASE WHEN state = 'running' THEN 'Worker stopped sending heartbeats.'
+                                     ELSE 'No worker claimed the job in time.' END
+        WHERE (state = 'running'
+               AND COALESCE(heartbeat_at, started_at, submitted_at) < NOW() - make_interval(secs => %s))
+           OR (state = 'queued' AND submitted_at < NOW() - make_interval(secs => %s));
+    """
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, (stale_seconds, queue_timeout_seconds))
+            failed = cur.rowcount
+        conn.commit()
+    return failed
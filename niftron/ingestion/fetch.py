@@ -0,0 +1,127 @@
+# niftron/ingestion/fetch.py
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator, List, NamedTuple, Optional
+
+import pandas as pd
+
+from niftron.core.config import settings
+from niftron.core.metrics import span
+from niftron.ingestion.sources import MarketDataSource
+
+
+class FetchJob(NamedTuple):
+    """One ticker to download and the window (period/start) to download."""
+    stock_id: int
+    symbol: str
+    ticker: str
+    window: dict
+
+
+class FetchResult(NamedTuple):
+    job: FetchJob
+    data: Optional[pd.DataFrame]
+    error: Optional[BaseException]
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. acquire() blocks until a token is available,
+    so at most `rate` requests per second leave the process on average,
+    with bursts of up to `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def call_with_retries(func, *args, retries: int = None, backoff: float = None, limiter: TokenBucket = None, **kwargs):
+    """
+    Calls func, retrying failures with exponential backoff plus jitter.
+    Every attempt (including retries) takes a token from the limiter.
+    """
+    retries = settings.INGESTION_MAX_RETRIES if retries is None else retries
+    backoff = settings.INGESTION_BACKOFF_SECONDS if backoff is None else backoff
+
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            if attempt == retries:
+                raise
+            delay = backoff * (2 ** attempt)
+            time.sleep(delay + random.uniform(0, delay / 2))
+
+
+def _window_key(window: dict):
+    return tuple(sorted(window.items()))
+
+def _make_batches(jobs: List[FetchJob], batch_size: int) -> List[List[FetchJob]]:
+    """Groups jobs that share a fetch window into batches of at most batch_size."""
+    by_window = {}
+    for job in jobs:
+        by_window.setdefault(_window_key(job.window), []).append(job)
+
+    batches = []
+    for grouped in by_window.values():
+        for i in range(0, len(grouped), batch_size):
+            batches.append(grouped[i:i + batch_size])
+    return batches
+
+def _fetch_batch(source: MarketDataSource, batch: List[FetchJob], limiter: TokenBucket) -> List[FetchResult]:
+    tickers = [job.ticker for job in batch]
+    try:
+        # Single-ticker requests carry the symbol, so a slow stock shows up by name.
+        fields = {'symbol': batch[0].symbol} if len(batch) == 1 else {'tickers': len(batch)}
+        with span('ingestion.fetch', source=source.name, **fields) as timer:
+            frames = call_with_retries(source.fetch_batch, tickers, limiter=limiter, **batch[0].window)
+            timer.rows = sum(len(frame) for frame in frames.values() if frame is not None)
+    except Exception as e:
+        return [FetchResult(job, None, e) for job in batch]
+    return [FetchResult(job, frames.get(job.ticker), None) for job in batch]
+
+def fetch_all(source: MarketDataSource, jobs: List[FetchJob], max_workers: int = None,
+              rate: float = None, burst: int = None, batch_size: int = None) -> Iterator[FetchResult]:
+    """
+    Downloads all jobs on a bounded thread pool and yields results as they
+    complete. The caller consumes the iterator on its own thread, which keeps
+    every database write on a single connection.
+    """
+    max_workers = max_workers or settings.INGESTION_MAX_WORKERS
+    limiter = TokenBucket(rate or settings.INGESTION_RATE_PER_SEC, burst or settings.INGESTION_BURST)
+    batch_size = batch_size or settings.INGESTION_BATCH_SIZE
+    if not source.supports_batch:
+        batch_size = 1
+
+    batches = _make_batches(jobs, batch_size)
+    print(f"Fetching {len(jobs)} tickers from '{source.name}' in {len(batches)} requests "
+          f"({max_workers} workers, {limiter.rate}/s).")
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fetch") as pool:
+        futures = [pool.submit(_fetch_batch, source, batch, limiter) for batch in batches]
+        for future in as_completed(futures):
+            for result in future.result():
+                yield result
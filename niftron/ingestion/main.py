@@ -1,12 +1,22 @@
 # src/niftron/ingestion/main.py
 
-import yfinance as yf
+import datetime
 import pandas as pd
 import traceback
-from psycopg2.extras import execute_batch
 
+from niftron.core.bulk import copy_upsert, date_column
 from niftron.core.db import get_db_connection
 from niftron.core.config import settings
+from niftron.core.metrics import span
+from niftron.core.profiling import profiled
+from niftron.data_access.features import record_data_change
+from niftron.ingestion.fetch import FetchJob, fetch_all
+from niftron.ingestion.sources import get_market_data_source
+
+PRICE_COLUMNS = [
+    'stock_id', 'date', 'open_price', 'high_price', 'low_price',
+    'close_price', 'adjusted_close_price', 'volume'
+]
 
 def get_stocks_from_db():
     # ... (This function is unchanged)
@@ -19,77 +29,146 @@ def get_stocks_from_db():
     print(f"Found {len(stocks)} stocks to process.")
     return stocks
 
-def populate_price_data():
-    # ... (This function has the final fix)
-    stocks_to_process = get_stocks_from_db()
-    
+def get_price_watermarks():
+    """
+    Returns {stock_id: latest stored date} for every stock in a single query.
+    Stocks without any price rows map to None.
+    """
+    # One LATERAL probe per stock walks the (stock_id, date DESC) index
+    # instead of aggregating the whole price table.
+    query = """
+        SELECT s.stock_id, latest.date
+        FROM stocks s
+        LEFT JOIN LATERAL (
+            SELECT p.date
+            FROM daily_price_data p
+            WHERE p.stock_id = s.stock_id
+            ORDER BY p.date DESC
+            LIMIT 1
+        ) latest ON TRUE;
+    """
     with get_db_connection() as conn:
         with conn.cursor() as cur:
-            for stock_id, symbol in stocks_to_process:
-                try:
-                    ticker = f"{symbol}{settings.MARKET_SUFFIX}"
-                    print(f"--- Processing {ticker} ---")
-
-                    data = yf.download(ticker, period="5y", interval="1d", auto_adjust=False, progress=False)
-
-                    if data.empty:
-                        print(f"No data found for {ticker}. Skipping.")
-                        continue
-                    
-                    if isinstance(data.columns, pd.MultiIndex):
-                        data.columns = data.columns.droplevel(1)
-                    
-                    print(f"Fetched {len(data)} rows for {ticker}. Columns flattened.")
-
-                    data.dropna(subset=['Open', 'High', 'Low', 'Close', 'Volume'], inplace=True)
-                    data = data[data['Volume'] > 0]
-
-                    print(f"Cleaned data, {len(data)} rows remaining.")
-
-                    insert_data = []
-                    for index, row in data.iterrows():
-                        trade_date = index.date()
-                        
-                        # --- THE FINAL FIX ---
-                        # Explicitly convert NumPy types to standard Python types.
-                        # float() and int() will handle np.float64 and np.int64 correctly.
-                        insert_data.append((
-                            stock_id, 
-                            trade_date,
-                            float(row['Open']),
-                            float(row['High']),
-                            float(row['Low']),
-                            float(row['Close']),
-                            float(row['Adj Close']),
-                            int(row['Volume'])
-                        ))
-                        # --- END OF FIX ---
-                    
-                    if insert_data:
-                        insert_query = """
-                            INSERT INTO daily_price_data (
-                                stock_id, date, open_price, high_price, low_price, 
-                                close_price, adjusted_close_price, volume
-                            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                            ON CONFLICT (stock_id, date) DO NOTHING;
-                        """
-                        # We will switch back to executemany as it's more robust with parameter substitution
-                        cur.executemany(insert_query, insert_data)
-                        conn.commit()
-                        print(f"Successfully processed and stored {len(insert_data)} records for {ticker}.")
-
-                except Exception:
-                    print(f"!!! An unexpected error occurred while processing {symbol} !!!")
-                    traceback.print_exc()
-                    conn.rollback()
-    
+            cur.execute(query)
+            return dict(cur.fetchall())
+
+def plan_fetch_window(last_date, today=None, mode=None):
+    """
+    Decides what to download for one stock.
+
+    Returns:
+        dict: Fetch window keywords, either {'period': ...} for a full
+              backfill or {'start': ...} for an incremental fetch.
+    """
+    mode = mode or settings.INGESTION_MODE
+    today = today or datetime.date.today()
+
+    if mode == "full" or last_date is None:
+        return {'period': settings.INGESTION_BACKFILL_PERIOD}
+    if (today - last_date).days > settings.INGESTION_MAX_GAP_DAYS:
+        # Too far behind to trust a short window; rebuild the whole history.
+        return {'period': settings.INGESTION_BACKFILL_PERIOD}
+
+    start = last_date - datetime.timedelta(days=settings.INGESTION_OVERLAP_DAYS)
+    return {'start': start.isoformat()}
+
+def clean_price_data(data: pd.DataFrame) -> pd.DataFrame:
+    """Drops incomplete bars and bars without any traded volume."""
+    data = data.dropna(subset=['Open', 'High', 'Low', 'Close', 'Volume'])
+    return data[data['Volume'] > 0]
+
+def store_price_data(conn, stock_id, data: pd.DataFrame) -> int:
+    """Upserts one stock's cleaned bars and returns the number of rows written."""
+    if data.empty:
+        return 0
+
+    frame = pd.DataFrame({
+        'stock_id': stock_id,
+        'date': date_column(data.index),
+        'open_price': data['Open'].to_numpy(),
+        'high_price': data['High'].to_numpy(),
+        'low_price': data['Low'].to_numpy(),
+        'close_price': data['Close'].to_numpy(),
+        'adjusted_close_price': data['Adj Close'].to_numpy(),
+        # Batch downloads can hand back float volumes; BIGINT needs integers.
+        'volume': data['Volume'].to_numpy().astype('int64'),
+    })
+
+    # Bars inside the overlap window may have been revised
+    # upstream, so overwrite instead of ignoring conflicts.
+    stored = copy_upsert(
+        conn, frame, 'daily_price_data', PRICE_COLUMNS,
+        conflict_columns=['stock_id', 'date'],
+        update_columns=PRICE_COLUMNS[2:],
+    )
+    record_data_change(conn, 'daily_price_data', frame['date'].min().date())
+    conn.commit()
+    return stored
+
+def populate_price_data(mode=None, source=None):
+    """
+    Fetches bars for every stock concurrently and stores them.
+
+    Downloads run on a rate-limited thread pool (see niftron.ingestion.fetch);
+    results are written here, one stock at a time, on a single connection.
+    """
+    stocks_to_process = get_stocks_from_db()
+    watermarks = get_price_watermarks()
+    today = datetime.date.today()
+    source = source or get_market_data_source()
+    print(f"Ingestion mode: {mode or settings.INGESTION_MODE}")
+
+    jobs = [
+        FetchJob(stock_id, symbol, f"{symbol}{settings.MARKET_SUFFIX}",
+                 plan_fetch_window(watermarks.get(stock_id), today, mode))
+        for stock_id, symbol in stocks_to_process
+    ]
+
+    failed = []
+    with get_db_connection() as conn:
+        for result in fetch_all(source, jobs):
+            ticker = result.job.ticker
+            if result.error is not None:
+                print(f"!!! Could not fetch {ticker}: {result.error!r} !!!")
+                failed.append(result.job.symbol)
+                continue
+            try:
+                data = result.data
+                if data is None or data.empty:
+                    print(f"No data found for {ticker}. Skipping.")
+                    continue
+
+                with span('ingestion.clean', symbol=result.job.symbol) as timer:
+                    data = clean_price_data(data)
+                    timer.rows = len(data)
+                with span('ingestion.db_write', symbol=result.job.symbol) as timer:
+                    stored = store_price_data(conn, result.job.stock_id, data)
+                    timer.rows = stored
+                print(f"Stored {stored} records for {ticker} ({result.job.window}).")
+
+            except Exception:
+                print(f"!!! An unexpected error occurred while processing {result.job.symbol} !!!")
+                traceback.print_exc()
+                conn.rollback()
+                failed.append(result.job.symbol)
+
+    if failed:
+        print(f"Failed symbols ({len(failed)}): {', '.join(failed)}")
     print("\n--- Data ingestion complete! ---")
 
-def run():
-    """Entry point for Airflow to trigger the ingestion process."""
+@profiled('ingestion')
+def run(mode=None):
+    """
+    Entry point for Airflow to trigger the ingestion process.
+
+    Args:
+        mode (str, optional): "incremental" or "full". Defaults to settings.INGESTION_MODE.
+    """
     print("Starting Niftron Data Ingestion...")
-    populate_price_data()
+    with span('ingestion', mode=mode or settings.INGESTION_MODE):
+        populate_price_data(mode)
     print("Niftron Data Ingestion Finished.")
 
 if __name__ == "__main__":
-    run()
\ No newline at end of file
+    import sys
+    run("full" if "--full" in sys.argv else None)
@@ -0,0 +1,135 @@
+# niftron/ingestion/sources.py
+
+import os
+from abc import ABC, abstractmethod
+from typing import Dict, List
+
+import pandas as pd
+
+from niftron.core.config import settings
+
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+
+
+class MarketDataSource(ABC):
+    """
+    Interface for anything that can return daily OHLCV bars for a ticker.
+
+    Every fetch takes the same window keywords that plan_fetch_window produces:
+    either period="5y" or start="YYYY-MM-DD". Frames are indexed by trade date
+    and carry the PRICE_COLUMNS columns.
+    """
+    name = "base"
+    # Sources that can download several tickers in one request set this to
+    # True and override fetch_batch.
+    supports_batch = False
+
+    @abstractmethod
+    def fetch(self, ticker: str, **window) -> pd.DataFrame:
+        """Returns the bars for a single ticker (empty frame if none)."""
+
+    def fetch_batch(self, tickers: List[str], **window) -> Dict[str, pd.DataFrame]:
+        """Returns {ticker: bars}. The default implementation fetches one by one."""
+        return {ticker: self.fetch(ticker, **window) for ticker in tickers}
+
+
+class YFinanceSource(MarketDataSource):
+    """Downloads bars from Yahoo Finance through yfinance."""
+    name = "yfinance"
+    supports_batch = True
+
+    def __init__(self):
+        import yfinance as yf
+        self._yf = yf
+
+    def fetch(self, ticker: str, **window) -> pd.DataFrame:
+        data = self._yf.download(ticker, interval="1d", auto_adjust=False, progress=False, **window)
+        if isinstance(data.columns, pd.MultiIndex):
+            data.columns = data.columns.droplevel(1)
+        return data
+
+    def fetch_batch(self, tickers: List[str], **window) -> Dict[str, pd.DataFrame]:
+        if len(tickers) == 1:
+            return {tickers[0]: self.fetch(tickers[0], **window)}
+
+        # threads=False: concurrency is managed by our own pool and rate limiter.
+        data = self._yf.download(
+            tickers, interval="1d", auto_adjust=False, progress=False,
+            group_by='ticker', threads=False, **window
+        )
+        results = {}
+        for ticker in tickers:
+            if data.empty or ticker not in data.columns.get_level_values(0):
+                results[ticker] = pd.DataFrame(columns=PRICE_COLUMNS)
+                continue
+            # Tickers that failed inside a batch come back as all-NaN columns.
+            results[ticker] = data[ticker].dropna(how='all')
+        return results
+
+
+class LocalDirectorySource(MarketDataSource):
+    """
+    Reads bars from a directory of <ticker>.csv or <ticker>.parquet files.
+    Useful offline and in tests. Files may be named with or without the
+    market suffix (RELIANCE.NS.csv or RELIANCE.csv) and must have a 'Date'
+    column or a date index plus the PRICE_COLUMNS columns.
+    """
+    name = "local"
+
+    def __init__(self, directory: str = None):
+        self.directory = directory or settings.MARKET_DATA_DIR
+        if not self.directory or not os.path.isdir(self.directory):
+            raise ValueError(f"Market data directory does not exist: {self.directory}")
+
+    def _find_file(self, ticker: str):
+        stems = [ticker]
+        if settings.MARKET_SUFFIX and ticker.endswith(settings.MARKET_SUFFIX):
+            stems.append(ticker[:-len(settings.MARKET_SUFFIX)])
+        for stem in stems:
+            for ext in ('.parquet', '.csv'):
+                path = os.path.join(self.directory, stem + ext)
+                if os.path.exists(path):
+                    return path
+        return None
+
+    def fetch(self, ticker: str, **window) -> pd.DataFrame:
+        path = self._find_file(ticker)
+        if path is None:
+            return pd.DataFrame(columns=PRICE_COLUMNS)
+
+        if path.endswith('.parquet'):
+            data = pd.read_parquet(path)
+        else:
+            data = pd.read_csv(path)
+        if 'Date' in data.columns:
+            data = data.set_index('Date')
+        data.index = pd.to_datetime(data.index)
+        data = data.sort_index()
+
+        if window.get('start'):
+            data = data[data.index >= pd.Timestamp(window['start'])]
+        elif window.get('period') and window['period'] != 'max':
+            data = data[data.index >= pd.Timestamp.today().normalize() - _period_to_offset(window['period'])]
+        return data
+
+
+def _period_to_offset(period: str) -> pd.DateOffset:
+    """Translates yfinance period strings ('5y', '6mo', '30d') into offsets."""
+    units = {'y': 'years', 'mo': 'months', 'wk': 'weeks', 'd': 'days'}
+    for suffix, unit in units.items():
+        if period.endswith(suffix) and period[:-len(suffix)].isdigit():
+            return pd.DateOffset(**{unit: int(period[:-len(suffix)])})
+    raise ValueError(f"Unsupported period: {period}")
+
+
+SOURCES = {
+    YFinanceSource.name: YFinanceSource,
+    LocalDirectorySource.name: LocalDirectorySource,
+}
+
+def get_market_data_source(name: str = None) -> MarketDataSource:
+    """Builds the configured market data source (settings.MARKET_DATA_SOURCE)."""
+    name = name or settings.MARKET_DATA_SOURCE
+    if name not in SOURCES:
+        raise ValueError(f"Unknown market data source '{name}'. Choose from: {', '.join(SOURCES)}")
+    return SOURCES[name]()
@@ -1,53 +1,79 @@
 # src/niftron/ml_model/data_prep.py
 
 import pandas as pd
+from functools import partial
 from niftron.core.db import get_db_connection
+from niftron.core.metrics import span
+from niftron.core.parallel import run_sharded
+from niftron.ml_model import dataset_cache
 from niftron.analysis.strategies import trend_strategy, momentum_strategy, macd_strategy
 
-def _generate_signals_for_stock(df: pd.DataFrame) -> pd.DataFrame:
-    """Applies all base strategy signal calculations to a single stock's feature dataframe."""
-    trend_signals = trend_strategy.generate_signals(df)
-    momentum_signals = momentum_strategy.generate_signals(df)
-    macd_signals = macd_strategy.generate_signals(df)
-    
-    # The signal names match the paper's feature names
-    combined = pd.concat([trend_signals, momentum_signals, macd_signals], axis=1)
-    combined.rename(columns={
-        'trend_signal': 'trend_signal',
-        'momentum_score': 'momentum_score',
-        'macd_score': 'macd_score'
-    }, inplace=True)
-    return combined
-
-# In src/niftron/ml_model/data_prep.py in the generate_target_variable function
-
-def generate_target_variable(df: pd.DataFrame, horizon: int = 10, threshold: float = 0.02) -> pd.DataFrame:
-    df = df.copy()
-    
-    # 10-day forward return for the target
-    future_price_10d = df['close_price'].shift(-horizon)
-    df['future_return'] = (future_price_10d / df['close_price']) - 1
-    
-    # Target label
-    df['target'] = (df['future_return'] > threshold).astype(int)
-
-    # --- ADD THIS ---
-    # 1-day forward return for backtesting simulation
-    future_price_1d = df['close_price'].shift(-1)
-    df['daily_return'] = (future_price_1d / df['close_price']) - 1
-    # --- END ADD ---
-
-    return df
-
-def load_and_prepare_data() -> pd.DataFrame:
+SIGNAL_COLUMNS = ['trend_signal', 'momentum_score', 'macd_score']
+
+def generate_signals(df: pd.DataFrame, group_by=None) -> pd.DataFrame:
     """
-    Loads all features and price data from the database, merges them,
-    generates signals and the target variable for each stock.
-    
+    Applies all base strategy signal calculations (the LEM's features) to a
+    stock's feature rows, or to many stocks stacked and grouped by `group_by`.
+    """
+    return pd.concat([
+        trend_strategy.generate_signals(df, group_by=group_by),
+        momentum_strategy.generate_signals(df, group_by=group_by),
+        macd_strategy.generate_signals(df, group_by=group_by),
+    ], axis=1)
+
+def target_columns(horizon: int, threshold: float):
+    """Names of the (future return, target) columns of generate_target_variants."""
+    return f'future_return_{horizon}d', f'target_{horizon}d_{threshold:g}'
+
+def generate_target_variants(df: pd.DataFrame, horizons, thresholds, group_by=None) -> pd.DataFrame:
+    """
+    Forward returns and binary targets for every combination of horizon and
+    threshold in one pass over the close prices, plus the 1-day forward return
+    used by the backtest simulation.
+
+    Args:
+        df (pd.DataFrame): Rows with a 'close_price' column, sorted by date
+                           within each stock.
+        group_by (str, optional): Column identifying each stock when several
+                                  stocks are stacked in one frame; shifts then
+                                  never cross stocks.
+
     Returns:
-        pd.DataFrame: A single, cleaned DataFrame ready for model training.
+        pd.DataFrame: 'future_return_{h}d' and 'target_{h}d_{threshold}' columns
+                      (see target_columns) and 'daily_return'. The last h rows of
+                      each stock have a NaN future return and a target of 0.
+    """
+    close = df['close_price']
+    shift = close.groupby(df[group_by], sort=False).shift if group_by is not None else close.shift
+
+    columns = {}
+    for horizon in horizons:
+        future_return = shift(-horizon) / close - 1
+        return_column = target_columns(horizon, 0)[0]
+        columns[return_column] = future_return
+        for threshold in thresholds:
+            columns[target_columns(horizon, threshold)[1]] = (future_return > threshold).astype(int)
+    columns['daily_return'] = shift(-1) / close - 1
+    return pd.DataFrame(columns, index=df.index)
+
+def generate_target_variable(df: pd.DataFrame, horizon: int = 10, threshold: float = 0.02,
+                             group_by=None) -> pd.DataFrame:
+    """
+    Adds the forward return over `horizon` days ('future_return'), whether it
+    beats `threshold` ('target') and the 1-day forward return for the backtest
+    simulation ('daily_return') to a copy of df.
+    """
+    return_column, target_column = target_columns(horizon, threshold)
+    targets = generate_target_variants(df, [horizon], [threshold], group_by=group_by)
+    targets = targets.rename(columns={return_column: 'future_return', target_column: 'target'})
+    return pd.concat([df, targets], axis=1)
+
+def _prepare_symbols(symbols, start_date=None, horizon=10, threshold=0.02) -> pd.DataFrame:
+    """
+    Loads features and prices for one shard of symbols (from start_date on,
+    if given), then generates the signals and the target variable for all of
+    its stocks at once. Runs inside a worker.
     """
-    print("Loading all features and price data from the database...")
     query = """
     SELECT
         s.symbol,
@@ -61,37 +87,116 @@ def load_and_prepare_data() -> pd.DataFrame:
     FROM features f
     JOIN stocks s ON s.stock_id = f.stock_id
     JOIN daily_price_data p ON p.stock_id = f.stock_id AND p.date = f.date
+    WHERE s.symbol = ANY(%s) {date_filter}
     ORDER BY s.symbol, f.date ASC;
     """
+    params = [list(symbols)]
+    date_filter = ""
+    if start_date is not None:
+        date_filter = "AND f.date >= %s"
+        params.append(start_date)
+    with get_db_connection() as conn:
+        full_df = pd.read_sql(query.format(date_filter=date_filter), conn, params=params,
+                              index_col='date', parse_dates=['date'])
+    if full_df.empty:
+        return pd.DataFrame()
+
+    # Python symbol order (see prepare_dataset); dates stay ascending within each stock.
+    full_df = full_df.sort_values('symbol', kind='stable')
+    signals = generate_signals(full_df, group_by='symbol')
+    targets = generate_target_variable(full_df[['symbol', 'close_price']], horizon, threshold, group_by='symbol')
+    return pd.concat([
+        signals,
+        targets[['close_price', 'future_return', 'target', 'daily_return']],
+        full_df['symbol'],
+    ], axis=1)
+
+def prepare_dataset(workers=None, start_date=None, horizon: int = 10, threshold: float = 0.02) -> pd.DataFrame:
+    """
+    Loads features and prices from the database and generates the signals and
+    the target variable for every stock, keeping the rows with NaN values.
+
+    Symbols are split into shards that load and prepare their own data on a
+    process pool (settings.PIPELINE_WORKERS); shards are concatenated in
+    symbol order, so the result is identical to a single serial pass.
+    """
+    print("Loading all features and price data from the database...")
     with get_db_connection() as conn:
-        full_df = pd.read_sql(query, conn, index_col='date', parse_dates=['date'])
-
-    print(f"Loaded {len(full_df)} total records.")
-    
-    all_stocks_data = []
-    # Group by stock symbol and apply calculations independently
-    for symbol, group in full_df.groupby('symbol'):
-        print(f"Processing data for {symbol}...")
-        
-        # 1. Generate the base signals (our features for the LEM)
-        signals_df = _generate_signals_for_stock(group)
-        
-        # 2. Generate the target variable using close prices
-        target_df = generate_target_variable(group[['close_price']])
-        
-        # 3. Combine signals and target
-        combined_group = pd.concat([signals_df, target_df], axis=1)
-        combined_group['symbol'] = symbol
-        
-        all_stocks_data.append(combined_group)
-        
+        with conn.cursor() as cur:
+            cur.execute("SELECT symbol FROM stocks;")
+            # Sort in Python: database collations can order symbols like
+            # 'M&M' differently from pandas' groupby.
+            symbols = sorted(row[0] for row in cur.fetchall())
+
+    sharded = run_sharded(partial(_prepare_symbols, start_date=start_date, horizon=horizon, threshold=threshold),
+                          symbols, workers=workers, label="data prep shards")
+    if sharded.errors:
+        raise RuntimeError(f"{len(sharded.errors)} data preparation shard(s) failed.")
+
     # Combine all processed stock data back into one DataFrame
-    final_df = pd.concat(all_stocks_data)
-    
-    # Drop rows with NaN values, which occur at the start/end of the series
-    # due to rolling windows and future-looking target.
-    final_df.dropna(inplace=True)
-    
+    shards = [shard for shard in sharded.results if not shard.empty]
+    final_df = pd.concat(shards) if shards else pd.DataFrame()
+    print(f"Loaded and processed {len(final_df)} total records.")
+    return final_df
+
+def load_and_prepare_data(workers=None, start_date=None, horizon: int = 10, threshold: float = 0.02,
+                          use_cache: bool = True) -> pd.DataFrame:
+    """
+    Loads all features and price data from the database, merges them,
+    generates signals and the target variable for each stock.
+
+    The prepared dataset is cached as Parquet keyed by the data watermark,
+    horizon and threshold (see dataset_cache), so repeated calls skip the
+    database and only newly arrived dates are prepared again.
+
+    With start_date, only rows from that date on are returned. Without the
+    cache, only those rows are loaded and crossover signals need the previous
+    row, so the first loaded day of each stock should be treated as warm-up
+    and discarded by the caller.
+
+    Returns:
+        pd.DataFrame: A single, cleaned DataFrame ready for model training.
+    """
+    with span('data_prep') as timer:
+        if use_cache and dataset_cache.cache_enabled():
+            build = partial(prepare_dataset, workers, horizon=horizon, threshold=threshold)
+            final_df = dataset_cache.load_prepared(build, horizon, threshold)
+            if start_date is not None and not final_df.empty:
+                final_df = final_df[final_df.index >= pd.to_datetime(start_date)]
+        else:
+            final_df = prepare_dataset(workers, start_date, horizon, threshold)
+
+        # Drop rows with NaN values, which occur at the start/end of the series
+        # due to rolling windows and future-looking target.
+        final_df = final_df.dropna()
+        timer.rows = len(final_df)
+
     print(f"Data preparation complete. Final dataset has {len(final_df)} rows.")
-    
-    return final_df
\ No newline at end of file
+
+    return final_df
+
+def load_target_variants(horizons, thresholds, workers=None, use_cache: bool = True) -> pd.DataFrame:
+    """
+    The prepared dataset with a future return and target for every
+    combination of horizons and thresholds (see generate_target_variants),
+    for experimenting with target definitions without reloading per variant.
+
+    The targets are derived from the close prices of the cached default
+    dataset, so only the first call touches the database. Rows without
+    signals are dropped; drop each experiment's NaN 'future_return_{h}d' rows
+    before using its target.
+    """
+    with span('data_prep.target_variants') as timer:
+        if use_cache and dataset_cache.cache_enabled():
+            build = partial(prepare_dataset, workers)
+            base = dataset_cache.load_prepared(build, 10, 0.02)
+        else:
+            base = prepare_dataset(workers)
+        if base.empty:
+            return base
+        variants = generate_target_variants(base, horizons, thresholds, group_by='symbol')
+        final_df = pd.concat([base[SIGNAL_COLUMNS + ['close_price', 'symbol']], variants], axis=1)
+        final_df = final_df.dropna(subset=SIGNAL_COLUMNS)
+        timer.rows = len(final_df)
+    print(f"Prepared {len(horizons) * len(thresholds)} target variants for {len(final_df)} rows.")
+    return final_df
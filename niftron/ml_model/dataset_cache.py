@@ -0,0 +1,157 @@
+# niftron/ml_model/dataset_cache.py
+
+import datetime
+import json
+import os
+from typing import Callable, Optional
+
+import pandas as pd
+
+from niftron.analysis.strategies import trend_strategy, momentum_strategy, macd_strategy
+from niftron.core.config import settings
+from niftron.data_access.features import get_changed_from, get_dataset_watermark
+
+# pyarrow is optional: without it every call prepares the dataset from the database.
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# Bump when the layout of the prepared frame changes; older files are rebuilt.
+CACHE_VERSION = 3
+METADATA_KEY = b'niftron_dataset'
+
+# The signals of a day only look this many bars back.
+SIGNAL_LOOKBACK = max(strategy.LOOKBACK for strategy in (trend_strategy, momentum_strategy, macd_strategy))
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+_warned_unavailable = False
+
+
+def cache_enabled() -> bool:
+    global _warned_unavailable
+    if settings.DATASET_CACHE_MODE == 'off':
+        return False
+    if pq is None:
+        if not _warned_unavailable:
+            print("pyarrow is not installed; the training dataset cache is disabled.")
+            _warned_unavailable = True
+        return False
+    return True
+
+def cache_path(horizon: int, threshold: float) -> str:
+    directory = settings.DATASET_CACHE_DIR or os.path.join(project_root, '.dataset_cache')
+    return os.path.join(directory, f"prepared-h{horizon}-t{threshold:g}.parquet")
+
+def read_metadata(path: str) -> Optional[dict]:
+    """The metadata stored in a cache file's schema, or None if it is missing or unreadable."""
+    try:
+        metadata = pq.read_schema(path).metadata or {}
+        return json.loads(metadata[METADATA_KEY])
+    except (OSError, KeyError, ValueError, pa.ArrowException):
+        return None
+
+def _write(path: str, df: pd.DataFrame, metadata: dict) -> None:
+    """
+    Writes the frame as Parquet with integer columns downcast (their dtypes
+    are restored on read) and the metadata in the schema, so data and
+    watermark are replaced together by one atomic rename.
+    """
+    compact = df.copy()
+    for column in compact.select_dtypes('integer').columns:
+        compact[column] = pd.to_numeric(compact[column], downcast='integer')
+    metadata = {**metadata, 'dtypes': {column: str(dtype) for column, dtype in df.dtypes.items()},
+                'index_dtype': str(df.index.dtype)}
+    table = pa.Table.from_pandas(compact)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                           METADATA_KEY: json.dumps(metadata, default=str)})
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+
+def _read(path: str, metadata: dict) -> pd.DataFrame:
+    df = pq.read_table(path, memory_map=True).to_pandas()
+    df = df.astype(metadata['dtypes'])
+    df.index = df.index.astype(metadata['index_dtype'])
+    return df
+
+def _is_current(metadata: dict, watermark) -> bool:
+    max_date, rows, change_id = watermark
+    return (metadata['max_date'] == (str(max_date) if max_date else None) and metadata['rows'] == rows
+            and metadata['change_id'] == change_id)
+
+def _refresh_window(cached: pd.DataFrame, horizon: int):
+    """
+    Dates bounding the rows that new data can change. Each stock's last
+    `horizon` rows lack a complete forward return, so every row from the
+    earliest of those on (replace_from) is recomputed, from a load that starts
+    SIGNAL_LOOKBACK bars earlier per stock so their signals see the previous bars.
+    """
+    tail = cached.groupby('symbol', sort=False).tail(max(horizon, 1))
+    replace_from = tail.index.min()
+    before = cached[cached.index < replace_from]
+    warmup = before.groupby('symbol', sort=False).tail(SIGNAL_LOOKBACK)
+    load_from = warmup.index.min() if not warmup.empty else replace_from
+    return replace_from, load_from
+
+def load_prepared(build: Callable[[Optional[datetime.date]], pd.DataFrame],
+                  horizon: int, threshold: float) -> pd.DataFrame:
+    """
+    The prepared dataset (before NaN rows are dropped) for horizon/threshold,
+    from the Parquet cache when its watermark matches the database.
+
+    build(start_date) prepares the rows from start_date on (all rows for
+    None). When only new dates have arrived since the cache was written
+    (DATASET_CACHE_MODE=incremental), only the trailing rows that can change
+    are rebuilt and the rest of the cache is kept; anything else - rows added,
+    removed or revised before that window, a new CACHE_VERSION, or a cache
+    older than DATASET_CACHE_FULL_REBUILD_DAYS - triggers a full rebuild.
+    """
+    path = cache_path(horizon, threshold)
+    watermark = get_dataset_watermark()
+    metadata = read_metadata(path)
+    if metadata and metadata.get('version') != CACHE_VERSION:
+        metadata = None
+
+    if metadata and _is_current(metadata, watermark):
+        print(f"Loaded the prepared dataset from cache ({metadata['rows']} rows, watermark {metadata['max_date']}).")
+        return _read(path, metadata)
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    full_built_at = now
+    df = None
+    if (metadata and settings.DATASET_CACHE_MODE == 'incremental' and metadata['rows']
+            and now - datetime.datetime.fromisoformat(metadata['full_built_at'])
+            < datetime.timedelta(days=settings.DATASET_CACHE_FULL_REBUILD_DAYS)):
+        cached = _read(path, metadata)
+        replace_from, load_from = _refresh_window(cached, horizon)
+        kept = cached[cached.index < replace_from]
+        # Only safe if nothing before the window was added, removed or revised since.
+        changed_from = get_changed_from(metadata['change_id'])
+        if ((changed_from is None or changed_from >= replace_from.date())
+                and get_dataset_watermark(before=replace_from.date())[1] == len(kept)):
+            print(f"Extending the cached dataset: rebuilding rows from {replace_from.date()} on...")
+            fresh = build(load_from.date())
+            fresh = fresh[fresh.index >= replace_from] if not fresh.empty else fresh
+            df = pd.concat([kept, fresh]).sort_values('symbol', kind='stable')
+            full_built_at = datetime.datetime.fromisoformat(metadata['full_built_at'])
+            print(f"Kept {len(kept)} cached rows and rebuilt {len(fresh)}.")
+
+    if df is None:
+        print("Building the prepared dataset from the database...")
+        df = build(None)
+
+    try:
+        _write(path, df, {
+            'version': CACHE_VERSION, 'horizon': horizon, 'threshold': threshold,
+            'max_date': str(watermark[0]) if watermark[0] else None, 'rows': watermark[1],
+            'change_id': watermark[2],
+            'built_at': now.isoformat(), 'full_built_at': full_built_at.isoformat(),
+        })
+        print(f"Cached the prepared dataset at {path}.")
+    except OSError as e:
+        print(f"!!! Could not write the dataset cache {path}: {e!r} !!!")
+    return df
@@ -0,0 +1,190 @@
+# niftron/ml_model/lut.py
+
+import argparse
+import os
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+LUT_VERSION = 1
+# Refuse to compile models whose split grid would not fit comfortably in memory.
+MAX_CELLS = 5_000_000
+
+
+def _gradient_boosting_splits(model, n_features: int):
+    """Split thresholds of every tree; sklearn's trees compare float32 inputs."""
+    thresholds = [[] for _ in range(n_features)]
+    for tree in model.estimators_.ravel():
+        is_split = tree.tree_.feature >= 0
+        for feature, threshold in zip(tree.tree_.feature[is_split], tree.tree_.threshold[is_split]):
+            thresholds[feature].append(threshold)
+    return thresholds, np.float32
+
+def _hist_gradient_boosting_splits(model, n_features: int):
+    """Split thresholds of every predictor; histogram boosting compares float64 inputs."""
+    thresholds = [[] for _ in range(n_features)]
+    for predictors in model._predictors:
+        for predictor in predictors:
+            nodes = predictor.nodes[predictor.nodes['is_leaf'] == 0]
+            for feature, threshold in zip(nodes['feature_idx'], nodes['num_threshold']):
+                thresholds[feature].append(threshold)
+    return thresholds, np.float64
+
+# Model class name -> function returning (thresholds per feature, input dtype).
+SPLIT_EXTRACTORS = {
+    'GradientBoostingClassifier': _gradient_boosting_splits,
+    'HistGradientBoostingClassifier': _hist_gradient_boosting_splits,
+}
+
+
+def _representatives(thresholds: np.ndarray, dtype) -> np.ndarray:
+    """
+    One input value per bin: bin i holds the values x with
+    thresholds[i-1] < x <= thresholds[i] once x is cast to dtype, and the
+    last bin everything above the largest threshold.
+    """
+    if len(thresholds) == 0:
+        return np.zeros(1, dtype=dtype)
+    values = thresholds.astype(dtype)
+    # The largest dtype value not above each threshold...
+    values = np.where(values.astype(np.float64) > thresholds, np.nextafter(values, dtype(-np.inf)), values)
+    # ...and one just above the largest threshold.
+    last = values[-1:]
+    while last[0] <= thresholds[-1]:
+        last = np.nextafter(last, dtype(np.inf))
+    return np.concatenate([values, last])
+
+
+class LookupTableScorer:
+    """
+    A tree ensemble compiled into a dense table of positive-class
+    probabilities over the bins that its split thresholds cut each feature
+    into. Every input in a bin takes the same path through every tree, so a
+    searchsorted per feature plus one gather reproduces predict_proba
+    bit for bit, with nothing but NumPy.
+    """
+
+    def __init__(self, feature_names: List[str], thresholds: List[np.ndarray], table: np.ndarray,
+                 input_dtype, model_hash: Optional[str] = None):
+        self.feature_names = list(feature_names)
+        self.thresholds = [np.asarray(t, dtype=np.float64) for t in thresholds]
+        self.table = np.asarray(table, dtype=np.float64)
+        self.input_dtype = np.dtype(input_dtype)
+        self.model_hash = model_hash
+        self.classes_ = np.array([0, 1])
+
+    def bins(self, X) -> tuple:
+        if hasattr(X, 'columns'):
+            X = X[self.feature_names].to_numpy()
+        X = np.asarray(X, dtype=np.float64)
+        if np.isnan(X).any():
+            raise ValueError("Input X contains NaN.")
+        # Cast like the trees do, then compare against the float64 thresholds.
+        X = X.astype(self.input_dtype).astype(np.float64)
+        return tuple(np.searchsorted(t, X[:, i], side='left') for i, t in enumerate(self.thresholds))
+
+    def positive_proba(self, X) -> np.ndarray:
+        return self.table[self.bins(X)]
+
+    def predict_proba(self, X) -> np.ndarray:
+        """Same contract as the model's: columns [P(target=0), P(target=1)]."""
+        positive = self.positive_proba(X)
+        return np.column_stack([1 - positive, positive])
+
+    def save(self, path: str) -> None:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f, version=LUT_VERSION, feature_names=np.array(self.feature_names), table=self.table,
+                input_dtype=self.input_dtype.name, model_hash=self.model_hash or '',
+                **{f'thresholds_{i}': t for i, t in enumerate(self.thresholds)},
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LookupTableScorer":
+        with np.load(path) as data:
+            if int(data['version']) != LUT_VERSION:
+                raise ValueError(f"{path} has lookup table version {int(data['version'])}, expected {LUT_VERSION}.")
+            feature_names = [str(name) for name in data['feature_names']]
+            return cls(feature_names, [data[f'thresholds_{i}'] for i in range(len(feature_names))],
+                       data['table'], str(data['input_dtype']), str(data['model_hash']) or None)
+
+
+def compile_lookup_table(model, feature_names: List[str], model_hash: str = None) -> LookupTableScorer:
+    """Builds the table by scoring one representative input per bin with the model itself."""
+    extractor = SPLIT_EXTRACTORS.get(type(model).__name__)
+    if extractor is None:
+        raise TypeError(f"Cannot compile a {type(model).__name__}; supported: {', '.join(SPLIT_EXTRACTORS)}")
+    if len(model.classes_) != 2:
+        raise TypeError("Only binary classifiers can be compiled.")
+
+    raw_thresholds, input_dtype = extractor(model, len(feature_names))
+    thresholds = [np.unique(np.asarray(t, dtype=np.float64)) for t in raw_thresholds]
+    shape = tuple(len(t) + 1 for t in thresholds)
+    if np.prod(shape) > MAX_CELLS:
+        raise ValueError(f"The lookup table would have {np.prod(shape)} cells (shape {shape}).")
+
+    axes = [_representatives(t, input_dtype).astype(np.float64) for t in thresholds]
+    grid = np.stack([axis.ravel() for axis in np.meshgrid(*axes, indexing='ij')], axis=1)
+    probabilities = model.predict_proba(pd.DataFrame(grid, columns=feature_names))[:, 1]
+    return LookupTableScorer(feature_names, thresholds, probabilities.reshape(shape), input_dtype, model_hash)
+
+def verify_lookup_table(scorer: LookupTableScorer, model, X=None, n_random: int = 100_000, seed: int = 0) -> int:
+    """
+    Checks that the scorer matches model.predict_proba exactly on X, on every
+    threshold and its neighbouring values, and on random inputs spanning the
+    thresholds. Raises RuntimeError on any difference; returns the rows checked.
+    """
+    rng = np.random.default_rng(seed)
+    columns = []
+    for t in scorer.thresholds:
+        low, high = (t[0] - 1, t[-1] + 1) if len(t) else (-1.0, 1.0)
+        edges = np.concatenate([t, np.nextafter(t, -np.inf), np.nextafter(t, np.inf),
+                                t.astype(np.float32).astype(np.float64), [low, high]])
+        columns.append(np.concatenate([rng.choice(edges, n_random), rng.uniform(low, high, n_random)]))
+    probes = pd.DataFrame(np.column_stack(columns), columns=scorer.feature_names)
+    if X is not None:
+        probes = pd.concat([probes, pd.DataFrame(X)[scorer.feature_names].astype(np.float64)], ignore_index=True)
+
+    expected = model.predict_proba(probes)
+    actual = scorer.predict_proba(probes)
+    mismatches = int((expected != actual).any(axis=1).sum())
+    if mismatches:
+        raise RuntimeError(f"The lookup table differs from predict_proba on {mismatches} of {len(probes)} rows.")
+    return len(probes)
+
+def export_lookup_table(model_path: str = None, path: str = None, X=None) -> LookupTableScorer:
+    """
+    Compiles, verifies and saves the lookup table of a saved model (by
+    default the active one) next to the model file.
+    """
+    import joblib
+    from niftron.ml_model.predict import LEM_FEATURES, active_version, lut_path_for, model_file_hash
+    model_path = model_path or active_version().model_path
+    path = path or lut_path_for(model_path)
+    model = joblib.load(model_path)
+    scorer = compile_lookup_table(model, LEM_FEATURES, model_file_hash(model_path))
+    checked = verify_lookup_table(scorer, model, X)
+    scorer.save(path)
+    print(f"Saved the lookup table {scorer.table.shape} to {path}; identical to predict_proba on {checked} rows.")
+    return scorer
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compiles the saved LEM into a NumPy lookup table.")
+    parser.add_argument('--model', default=None, help="Model file (default: the current LEM version).")
+    parser.add_argument('--output', default=None, help="Table file (default: next to the model).")
+    parser.add_argument('--verify-dataset', action='store_true',
+                        help="Also verify on every row of the prepared dataset (needs the database).")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    X = None
+    if args.verify_dataset:
+        from niftron.ml_model.data_prep import load_and_prepare_data
+        from niftron.ml_model.predict import LEM_FEATURES
+        X = load_and_prepare_data()[LEM_FEATURES]
+    export_lookup_table(args.model, args.output, X)
@@ -1,43 +1,142 @@
 # src/niftron/ml_model/predict.py (FINAL VERSION)
 
+import hashlib
 import os
-import joblib
-import pandas as pd
-from sklearn.ensemble import GradientBoostingClassifier
+import threading
+from typing import TYPE_CHECKING, Optional, Tuple
 
+from niftron.core.services import services
+
+if TYPE_CHECKING:
+    # Importing sklearn costs about a second, pandas and joblib most of the
+    # rest; only type checkers need them at import time.
+    import pandas as pd
+    from sklearn.ensemble import GradientBoostingClassifier
+    from niftron.ml_model.registry import ModelVersion
+
+# The model shipped in the package, used until one is registered (see registry.py).
 # This line constructs a path that is RELATIVE to the current file (predict.py).
-# This is the most reliable method.
-MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lem_model.joblib')
+LEGACY_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lem_model.joblib')
+
+LEM_FEATURES = ['trend_signal', 'momentum_score', 'macd_score']
 
-# Initialize model variable in the global scope
-model: GradientBoostingClassifier = None
+# (path, mtime, size) -> sha256, so the model file is only hashed when it changes.
+_model_hashes = {}
 
-def load_model():
-    """Loads the model from disk into the global 'model' variable."""
-    global model
-    if model is not None:
-        return
+def model_file_hash(path: str) -> str:
+    """SHA-256 of the model file; backtest runs and lookup tables are keyed by it."""
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if key not in _model_hashes:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        _model_hashes.clear()
+        _model_hashes[key] = digest.hexdigest()
+    return _model_hashes[key]
 
-    # Add a check to see if the file actually exists before trying to load
-    if not os.path.exists(MODEL_PATH):
-        print(f"FATAL Error: Model file does not exist at the expected path: {MODEL_PATH}")
-        print("Please run the training script (`python -m src.niftron.ml_model.train`) to create the model file.")
-        model = None
-        return
+def lut_path_for(model_path: str) -> str:
+    """Where the compiled lookup table of a model file lives (see niftron.ml_model.lut)."""
+    return os.path.splitext(model_path)[0] + '.lut.npz'
 
+def _resolve_lem_version():
+    """The model version to load: the registry's current one (or the packaged model)."""
+    from niftron.ml_model.registry import current_version
+    version = current_version()
+    if version is None:
+        print(f"FATAL Error: No LEM model is registered and none exists at {LEGACY_MODEL_PATH}")
+        print("Please run the training script (`python -m niftron.ml_model.train`) to create the model file.")
+    return version
+
+def _load_lem_model():
+    """Loads the active version's model; None (with a message) if it is missing or unreadable."""
+    version = active_version()
+    if version is None:
+        return None
+
+    import joblib
     try:
-        model = joblib.load(MODEL_PATH)
-        print(f"LEM model loaded successfully from {MODEL_PATH}")
+        model = joblib.load(version.model_path)
+        print(f"LEM model {version.version} loaded successfully from {version.model_path}")
+        return model
     except Exception as e:
-        print(f"Error loading model from {MODEL_PATH}: {e}")
-        model = None
+        print(f"Error loading model from {version.model_path}: {e}")
+        return None
 
-def generate_lem_score(model: GradientBoostingClassifier, features_df: pd.DataFrame) -> pd.DataFrame:
+def _load_lem_scorer():
+    """
+    The compiled lookup table of the active model when one exists for its
+    exact hash, which scores without sklearn; otherwise the model itself.
+    """
+    version = active_version()
+    path = lut_path_for(version.model_path) if version else None
+    if path and os.path.exists(path):
+        from niftron.ml_model.lut import LookupTableScorer
+        try:
+            scorer = LookupTableScorer.load(path)
+            if scorer.model_hash == version.content_hash:
+                print(f"LEM lookup table loaded from {path}")
+                return scorer
+            print(f"Ignoring {path}: it was compiled from a different model file.")
+        except Exception as e:
+            print(f"Error loading the lookup table from {path}: {e}")
+    return load_model()
+
+services.register('lem_version', _resolve_lem_version)
+services.register('lem_model', _load_lem_model)
+services.register('lem_scorer', _load_lem_scorer)
+
+_reload_lock = threading.Lock()
+
+def active_version() -> Optional["ModelVersion"]:
+    """The model version this process scores with, resolved on first use."""
+    return services.get('lem_version')
+
+def current_model_hash() -> str:
+    """Content hash of the active model; stored backtests and caches derived from it are keyed by it."""
+    version = active_version()
+    if version is None:
+        raise FileNotFoundError("No LEM model is available; run `python -m niftron.ml_model.train`.")
+    return version.content_hash
+
+def load_model() -> "GradientBoostingClassifier":
+    """The LEM model, loaded from disk on first use and shared by the whole process."""
+    return services.get('lem_model')
+
+def load_scorer():
+    """
+    What to score the LEM with: its lookup table if compiled, else the model.
+    Both have predict_proba and give identical results.
+    """
+    return services.get('lem_scorer')
+
+def reload_model() -> Tuple[Optional["ModelVersion"], Optional["ModelVersion"], bool]:
+    """
+    Re-reads the registry's CURRENT pointer. If it names another model than
+    the active one, the loaded model and scorer are dropped together and the
+    next use loads the new version - no restart needed.
+
+    Returns:
+        tuple: (previous version, current version, whether it changed)
+    """
+    from niftron.ml_model.registry import current_version
+    with _reload_lock:
+        previous = active_version()
+        latest = current_version()
+        changed = (previous and previous.content_hash) != (latest and latest.content_hash)
+        if changed:
+            services.reset('lem_version', 'lem_model', 'lem_scorer')
+            print(f"LEM model changed: {previous.version if previous else None} -> {latest.version if latest else None}.")
+    return previous, latest, changed
+
+def generate_lem_score(model: "GradientBoostingClassifier", features_df: "pd.DataFrame") -> "pd.DataFrame":
     """
     Generates prediction scores using the provided LEM model.
 
     Args:
-        model (GradientBoostingClassifier): The pre-trained model object.
+        model (GradientBoostingClassifier): The pre-trained model object, or
+                                            its LookupTableScorer (see load_scorer).
         features_df (pd.DataFrame): DataFrame containing the input features
                                     ('trend_signal', 'momentum_score', 'macd_score').
 
@@ -46,16 +145,13 @@ def generate_lem_score(model: GradientBoostingClassifier, features_df: pd.DataFr
                       The score is the probability of the positive class (target=1),
                       scaled to 0-100.
     """
+    import pandas as pd
     if model is None:
         raise ValueError("A valid model object must be provided.")
 
-    feature_columns = ['trend_signal', 'momentum_score', 'macd_score']
-    X = features_df[feature_columns]
+    X = features_df[LEM_FEATURES]
 
     probabilities = model.predict_proba(X)[:, 1]
     lem_scores = probabilities * 100
-    
-    return pd.DataFrame({'lem_score': lem_scores}, index=features_df.index)
 
-# Load the model automatically when the module is first imported
-load_model()
\ No newline at end of file
+    return pd.DataFrame({'lem_score': lem_scores}, index=features_df.index)
@@ -0,0 +1,162 @@
+# niftron/ml_model/registry.py
+
+import argparse
+import datetime
+import json
+import os
+import shutil
+from typing import List, NamedTuple, Optional
+
+from niftron.core.config import settings
+from niftron.ml_model.predict import LEGACY_MODEL_PATH, lut_path_for, model_file_hash
+
+MODEL_FILE = 'model.joblib'
+METADATA_FILE = 'metadata.json'
+# Holds the name of the version in use; replaced atomically, so readers
+# always see either the old or the new version.
+CURRENT_FILE = 'CURRENT'
+LEGACY_VERSION = 'legacy'
+
+
+class ModelVersion(NamedTuple):
+    version: str
+    model_path: str
+    # SHA-256 of the model file; stored backtests and lookup tables are keyed by it.
+    content_hash: str
+    # Training window, parameters, CV score, ... (see train.py).
+    metadata: dict
+
+
+def registry_dir() -> str:
+    return settings.MODEL_REGISTRY_DIR or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'registry')
+
+def _version_dir(version: str) -> str:
+    return os.path.join(registry_dir(), version)
+
+def _atomic_write(path: str, text: str) -> None:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def get_version(version: str) -> Optional[ModelVersion]:
+    """A registered version, or None if it does not exist."""
+    if version == LEGACY_VERSION:
+        if not os.path.exists(LEGACY_MODEL_PATH):
+            return None
+        return ModelVersion(LEGACY_VERSION, LEGACY_MODEL_PATH, model_file_hash(LEGACY_MODEL_PATH), {})
+    path = os.path.join(_version_dir(version), METADATA_FILE)
+    try:
+        with open(path) as f:
+            metadata = json.load(f)
+    except OSError:
+        return None
+    return ModelVersion(version, os.path.join(_version_dir(version), MODEL_FILE), metadata['content_hash'], metadata)
+
+def list_versions() -> List[ModelVersion]:
+    """Every registered version, oldest first."""
+    if not os.path.isdir(registry_dir()):
+        return []
+    versions = (get_version(name) for name in sorted(os.listdir(registry_dir())))
+    return [version for version in versions if version is not None]
+
+def current_version_name() -> Optional[str]:
+    try:
+        with open(os.path.join(registry_dir(), CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def current_version() -> Optional[ModelVersion]:
+    """
+    The version the CURRENT pointer names; the model shipped in the package
+    (LEGACY_MODEL_PATH) while nothing has been registered. None if neither exists.
+    """
+    name = current_version_name()
+    if name is None:
+        return get_version(LEGACY_VERSION)
+    version = get_version(name)
+    if version is None:
+        print(f"WARNING: The current model version '{name}' is missing from {registry_dir()}.")
+    return version
+
+def pointer_stamp() -> Optional[tuple]:
+    """Changes whenever the CURRENT pointer is moved; cheap enough to poll."""
+    for path in (os.path.join(registry_dir(), CURRENT_FILE), LEGACY_MODEL_PATH):
+        try:
+            stat = os.stat(path)
+            return (path, stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            continue
+    return None
+
+def set_current(version: str) -> ModelVersion:
+    """Points CURRENT at a registered version (deploys or rolls back a model)."""
+    model_version = get_version(version)
+    if model_version is None or version == LEGACY_VERSION:
+        raise ValueError(f"No registered model version '{version}' in {registry_dir()}.")
+    _atomic_write(os.path.join(registry_dir(), CURRENT_FILE), version + '\n')
+    print(f"Current model version is now {version}.")
+    return model_version
+
+def register_model(model, metadata: dict, X_verify=None, make_current: bool = True) -> ModelVersion:
+    """
+    Saves a trained model as a new immutable version: the model file, its
+    compiled lookup table (verified against X_verify) and metadata.json with
+    the content hash. The version directory appears in one rename, and with
+    make_current the CURRENT pointer is moved to it afterwards.
+    """
+    import joblib
+    from niftron.ml_model.lut import export_lookup_table
+
+    os.makedirs(registry_dir(), exist_ok=True)
+    staging = os.path.join(registry_dir(), f".staging-{os.getpid()}")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    try:
+        model_path = os.path.join(staging, MODEL_FILE)
+        joblib.dump(model, model_path)
+        content_hash = model_file_hash(model_path)
+        try:
+            export_lookup_table(model_path, lut_path_for(model_path), X=X_verify)
+        except (TypeError, ValueError, RuntimeError) as e:
+            print(f"WARNING: Could not compile the lookup table, the model will be used directly: {e}")
+
+        created_at = datetime.datetime.now(datetime.timezone.utc)
+        version = f"{created_at:%Y%m%dT%H%M%SZ}-{content_hash[:12]}"
+        metadata = {**metadata, 'version': version, 'content_hash': content_hash,
+                    'created_at': created_at.isoformat()}
+        with open(os.path.join(staging, METADATA_FILE), 'w') as f:
+            json.dump(metadata, f, indent=2, default=str)
+        os.replace(staging, _version_dir(version))
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    print(f"Registered model version {version} in {registry_dir()}.")
+    return set_current(version) if make_current else get_version(version)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Lists the registered LEM versions or changes the current one.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help="List versions; the current one is marked with *.")
+    set_parser = subparsers.add_parser('set-current', help="Deploy or roll back to a version.")
+    set_parser.add_argument('version')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.command == 'set-current':
+        set_current(args.version)
+    else:
+        current = current_version_name()
+        for model_version in list_versions():
+            metadata = model_version.metadata
+            print(f"{'*' if model_version.version == current else ' '} {model_version.version}  "
+                  f"{metadata.get('estimator', '')}/{metadata.get('search', '')}  "
+                  f"CV F1 {metadata.get('cv_score', float('nan')):.4f}  "
+                  f"trained on {metadata.get('train_start')}..{metadata.get('train_end')}")
+        if current is None:
+            print(f"  (nothing registered; using the packaged model {LEGACY_MODEL_PATH})")
@@ -3,22 +3,186 @@
 from dotenv import load_dotenv
 load_dotenv()
 
+import argparse
 import os
-import joblib
+import time
+from contextlib import nullcontext
+from typing import NamedTuple, Optional
+
 import pandas as pd
-from sklearn.ensemble import GradientBoostingClassifier
-from sklearn.model_selection import GridSearchCV, TimeSeriesSplit
+import sklearn
+from scipy.stats import loguniform, randint, uniform
+from sklearn.base import clone
+from sklearn.ensemble import GradientBoostingClassifier, HistGradientBoostingClassifier
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.model_selection import (
+    GridSearchCV, HalvingRandomSearchCV, ParameterSampler, TimeSeriesSplit, cross_validate
+)
 from niftron.ml_model.data_prep import load_and_prepare_data
+from niftron.ml_model.registry import register_model
+from niftron.core.profiling import profile, profiled
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+FEATURE_COLUMNS = ['trend_signal', 'momentum_score', 'macd_score']
+
+# Per estimator: the model, the exhaustive grid (the paper's for 'gb') and
+# the distributions sampled by the halving and random searches.
+ESTIMATORS = {
+    'gb': {
+        'model': lambda: GradientBoostingClassifier(random_state=42),
+        'grid': {
+            'n_estimators': [100, 200, 300],
+            'learning_rate': [0.01, 0.1, 0.2],
+            'max_depth': [3, 5, 7],
+            'subsample': [0.7, 0.8, 1.0]
+        },
+        'distributions': {
+            'n_estimators': randint(50, 400),
+            'learning_rate': loguniform(0.01, 0.3),
+            'max_depth': randint(2, 8),
+            'subsample': uniform(0.6, 0.4),
+        },
+    },
+    # Histogram-binned boosting stops adding trees once a held-out 10% of
+    # each training fold stops improving, so max_iter is only a ceiling.
+    'hgb': {
+        'model': lambda: HistGradientBoostingClassifier(
+            max_iter=500, early_stopping=True, validation_fraction=0.1, n_iter_no_change=10, random_state=42
+        ),
+        'grid': {
+            'learning_rate': [0.01, 0.1, 0.2],
+            'max_depth': [3, 5, 7],
+            'max_leaf_nodes': [15, 31, 63],
+            'l2_regularization': [0.0, 1.0],
+        },
+        'distributions': {
+            'learning_rate': loguniform(0.01, 0.3),
+            'max_depth': randint(2, 8),
+            'max_leaf_nodes': randint(8, 64),
+            'min_samples_leaf': randint(10, 200),
+            'l2_regularization': loguniform(1e-4, 10),
+        },
+    },
+}
+
+RESULT_COLUMNS = ['mean_fit_time', 'std_fit_time', 'mean_score_time', 'mean_test_score', 'std_test_score']
+
+
+class SearchResult(NamedTuple):
+    # Fitted on the whole training set with the best parameters.
+    best_estimator: object
+    best_params: dict
+    best_score: float
+    # One row per evaluated candidate: its parameters, fit/score times and CV scores.
+    cv_results: pd.DataFrame
+
+
+def _plain(params: dict) -> dict:
+    """Parameters with numpy scalars turned into Python numbers, for printing and set_params."""
+    return {name: value.item() if hasattr(value, 'item') else value for name, value in params.items()}
+
+def _results_table(cv_results: dict) -> pd.DataFrame:
+    table = pd.DataFrame(cv_results)
+    params = [c for c in table if c.startswith('param_')]
+    if 'iter' in table:
+        # Successive halving: the candidates that reached the most rows come first.
+        table = table[['iter', 'n_resources'] + params + RESULT_COLUMNS + ['rank_test_score']]
+        table = table.sort_values(['iter', 'rank_test_score'], ascending=[False, True], kind='stable')
+    else:
+        table = table[params + RESULT_COLUMNS + ['rank_test_score']]
+        table = table.sort_values('rank_test_score', kind='stable')
+    return table.reset_index(drop=True)
+
+def grid_search(estimator, spec, X, y, cv, **_) -> SearchResult:
+    """The exhaustive search, reproducing the paper's model for 'gb'."""
+    search = GridSearchCV(estimator=estimator, param_grid=spec['grid'], cv=cv, scoring='f1', n_jobs=-1, verbose=2)
+    search.fit(X, y)
+    return SearchResult(search.best_estimator_, _plain(search.best_params_), search.best_score_,
+                        _results_table(search.cv_results_))
+
+def halving_search(estimator, spec, X, y, cv, n_candidates=None, **_) -> SearchResult:
+    """
+    Successive halving: every candidate is scored on a small sample of each
+    training fold, and only the best third moves on to three times as many rows.
+    """
+    search = HalvingRandomSearchCV(
+        estimator=estimator, param_distributions=spec['distributions'], n_candidates=n_candidates or 'exhaust',
+        factor=3, resource='n_samples', cv=cv, scoring='f1', n_jobs=-1, random_state=42, verbose=1,
+    )
+    search.fit(X, y)
+    return SearchResult(search.best_estimator_, _plain(search.best_params_), search.best_score_,
+                        _results_table(search.cv_results_))
 
-def train_lem_model():
+def random_search(estimator, spec, X, y, cv, n_candidates=None, budget_seconds=None, **_) -> SearchResult:
     """
-    Main function to train and save the Learned Ensemble Model (LEM).
+    Randomized search that stops sampling candidates once budget_seconds of
+    wall-clock time have been spent, then fits the best one on all of X.
     """
+    deadline = time.perf_counter() + budget_seconds if budget_seconds else None
+    rows = []
+    for params in ParameterSampler(spec['distributions'], n_iter=n_candidates or 1000, random_state=42):
+        if deadline is not None and time.perf_counter() >= deadline:
+            print(f"Time budget of {budget_seconds:.0f}s used up after {len(rows)} candidates.")
+            break
+        scores = cross_validate(clone(estimator).set_params(**params), X, y, cv=cv, scoring='f1', n_jobs=-1)
+        rows.append({
+            **{f'param_{name}': value for name, value in params.items()},
+            'mean_fit_time': scores['fit_time'].mean(), 'std_fit_time': scores['fit_time'].std(),
+            'mean_score_time': scores['score_time'].mean(),
+            'mean_test_score': scores['test_score'].mean(), 'std_test_score': scores['test_score'].std(),
+        })
+        print(f"[{len(rows)}] F1 {rows[-1]['mean_test_score']:.4f} in {scores['fit_time'].sum():.1f}s: {_plain(params)}")
+    if not rows:
+        raise RuntimeError("No candidate was evaluated within the time budget.")
+
+    table = pd.DataFrame(rows)
+    table['rank_test_score'] = table['mean_test_score'].rank(ascending=False, method='min').astype(int)
+    table = table.sort_values('rank_test_score', kind='stable').reset_index(drop=True)
+    best_params = _plain({column[len('param_'):]: table.at[0, column] for column in table if column.startswith('param_')})
+    best_estimator = clone(estimator).set_params(**best_params).fit(X, y)
+    return SearchResult(best_estimator, best_params, float(table.at[0, 'mean_test_score']), table)
+
+SEARCH_MODES = {
+    'grid': grid_search,
+    'halving': halving_search,
+    'random': random_search,
+}
+
+@profiled('train')
+def train_lem_model(search: str = 'grid', estimator: str = 'gb', budget_seconds: Optional[float] = None,
+                    n_candidates: Optional[int] = None, results_path: Optional[str] = None):
+    """
+    Main function to train the Learned Ensemble Model (LEM) and register it
+    as the current model version.
+
+    Args:
+        search (str): 'grid' (exhaustive, the paper's setup), 'halving'
+                      (successive halving) or 'random' (randomized search,
+                      bounded by budget_seconds).
+        estimator (str): 'gb' (GradientBoostingClassifier) or 'hgb'
+                         (HistGradientBoostingClassifier with early stopping).
+        budget_seconds (float, optional): Wall-clock limit of the 'random' search.
+        n_candidates (int, optional): Parameter sets sampled by 'halving'/'random'.
+        results_path (str, optional): CSV for the per-candidate fit-time and
+                                      score table. Defaults to the untracked
+                                      artifacts/ directory; pass a path under
+                                      paper_figures/ to publish it.
+    """
+    if search not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode '{search}'. Available: {', '.join(SEARCH_MODES)}")
+    if estimator not in ESTIMATORS:
+        raise ValueError(f"Unknown estimator '{estimator}'. Available: {', '.join(ESTIMATORS)}")
+    # Successive halving sizes its rounds up front and cannot stop at a deadline.
+    if budget_seconds is not None and search != 'random':
+        raise ValueError(f"budget_seconds only applies to the 'random' search, not '{search}'.")
+    if n_candidates is not None and search == 'grid':
+        raise ValueError("n_candidates does not apply to the 'grid' search.")
+
     full_dataset = load_and_prepare_data()
 
-    feature_columns = ['trend_signal', 'momentum_score', 'macd_score']
     target_column = 'target'
-    X = full_dataset[feature_columns]
+    X = full_dataset[FEATURE_COLUMNS]
     y = full_dataset[target_column]
 
     train_end_date = pd.to_datetime('2022-12-31')
@@ -28,47 +192,73 @@ def train_lem_model():
     print("\nData Splitting Complete:")
     print(f"Training set size: {len(X_train)} samples (from {X_train.index.min().date()} to {X_train.index.max().date()})")
 
-    model = GradientBoostingClassifier(random_state=42)
-    param_grid = {
-        'n_estimators': [100, 200, 300],
-        'learning_rate': [0.01, 0.1, 0.2],
-        'max_depth': [3, 5, 7],
-        'subsample': [0.7, 0.8, 1.0]
-    }
-
+    spec = ESTIMATORS[estimator]
     tscv = TimeSeriesSplit(n_splits=5)
 
-    print("\nStarting Hyperparameter Tuning with GridSearchCV...")
-    grid_search = GridSearchCV(
-        estimator=model,
-        param_grid=param_grid,
-        cv=tscv,
-        scoring='f1',
-        n_jobs=-1,
-        verbose=2
-    )
-    grid_search.fit(X_train, y_train)
+    print(f"\nStarting Hyperparameter Tuning ({search} search, {estimator})...")
+    started = time.perf_counter()
+    result = SEARCH_MODES[search](spec['model'](), spec, X_train, y_train, tscv,
+                                  n_candidates=n_candidates, budget_seconds=budget_seconds)
+
+    print(f"\nHyperparameter Tuning Complete in {time.perf_counter() - started:.1f}s "
+          f"({len(result.cv_results)} candidate evaluations).")
+    print(f"Best F1-score found: {result.best_score:.4f}")
+    print(f"Best parameters found: {result.best_params}")
+    print(result.cv_results.head(10).to_string(index=False))
 
-    print("\nHyperparameter Tuning Complete.")
-    print(f"Best F1-score found: {grid_search.best_score_:.4f}")
-    print(f"Best parameters found: {grid_search.best_params_}")
+    results_path = results_path or os.path.join(project_root, 'artifacts', f'lem_search_{search}_{estimator}.csv')
+    os.makedirs(os.path.dirname(results_path) or '.', exist_ok=True)
+    result.cv_results.to_csv(results_path, index=False)
+    print(f"Saved the fit-time/score table to: {results_path}")
 
-    print("\nTraining the final model on the entire training dataset...")
-    final_model = GradientBoostingClassifier(**grid_search.best_params_, random_state=42)
-    final_model.fit(X_train, y_train)
+    # The search already refit the best parameters on the whole training set.
+    final_model = result.best_estimator
     print("Final model training complete.")
 
-    # --- CORRECTED SAVE PATH (NO 'src' FOLDER) ---
-    # This builds the correct path relative to the project root
-    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
-    model_dir = os.path.join(project_root, 'niftron', 'ml_model')
-    os.makedirs(model_dir, exist_ok=True)
-    save_path = os.path.join(model_dir, 'lem_model.joblib')
-    
-    joblib.dump(final_model, save_path)
-    print(f"\nSaving the final model to: {save_path}")
+    # Saved as a new registry version, with its lookup table verified bit for
+    # bit on the training rows; the CURRENT pointer then moves to it and the
+    # API picks it up without a restart.
+    version = register_model(final_model, {
+        'estimator': estimator,
+        'model_class': type(final_model).__name__,
+        'search': search,
+        'params': result.best_params,
+        'cv_score': result.best_score,
+        'cv_scoring': 'f1',
+        'cv_splits': tscv.get_n_splits(),
+        'features': FEATURE_COLUMNS,
+        'train_start': X_train.index.min().date().isoformat(),
+        'train_end': X_train.index.max().date().isoformat(),
+        'train_rows': len(X_train),
+        'search_results': results_path,
+        'sklearn_version': sklearn.__version__,
+    }, X_verify=X_train)
+    print(f"\nSaved the final model as version {version.version}: {version.model_path}")
     print("Model saved successfully.")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Tunes, trains and saves the LEM.")
+    parser.add_argument('--search', choices=list(SEARCH_MODES), default='grid',
+                        help="'grid' reproduces the paper; 'halving' and 'random' are much faster.")
+    parser.add_argument('--estimator', choices=list(ESTIMATORS), default='gb')
+    parser.add_argument('--budget-seconds', type=float, default=None,
+                        help="Wall-clock limit for sampling candidates (only with --search random).")
+    parser.add_argument('--n-candidates', type=int, default=None,
+                        help="Parameter sets sampled (only with --search halving or random).")
+    parser.add_argument('--results', default=None,
+                        help="CSV for the fit-time/score table "
+                             "(default: artifacts/lem_search_<search>_<estimator>.csv).")
+    parser.add_argument('--profile', action='store_true', help="Profile the run (same as NIFTRON_PROFILE=1).")
+    args = parser.parse_args()
+    if args.budget_seconds is not None and args.search != 'random':
+        parser.error("--budget-seconds only applies to --search random.")
+    if args.n_candidates is not None and args.search == 'grid':
+        parser.error("--n-candidates does not apply to --search grid.")
+    return args
+
 
 if __name__ == '__main__':
-    train_lem_model()
\ No newline at end of file
+    args = parse_args()
+    with profile('train') if args.profile else nullcontext():
+        train_lem_model(search=args.search, estimator=args.estimator, budget_seconds=args.budget_seconds,
+                        n_candidates=args.n_candidates, results_path=args.results)
@@ -0,0 +1,380 @@
+# niftron/processing/indicators.py
+
+import numpy as np
+import pandas as pd
+
+SMA_WINDOWS = (50, 200)
+RSI_WINDOW = 14
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+# Stocks with fewer bars than the longest window are skipped, as before.
+MIN_HISTORY = max(SMA_WINDOWS)
+
+INDICATOR_COLUMNS = {
+    'SMA_50': 'sma_50',
+    'SMA_200': 'sma_200',
+    'RSI_14': 'rsi_14',
+    'MACD_12_26_9': 'macd_value',
+    'MACDs_12_26_9': 'macd_signal',
+}
+
+# Running-sum accumulators kept per rolling window (see rolling_mean_step).
+ROLLING_FIELDS = ('sum', 'comp_add', 'comp_remove', 'nobs', 'neg_ct', 'same_run', 'prev')
+ROLLING_WINDOWS = {'sma_50': 50, 'sma_200': 200, 'gain': RSI_WINDOW, 'loss': RSI_WINDOW}
+EWM_SPANS = {'ema_12': MACD_FAST, 'ema_26': MACD_SLOW, 'macd_signal': MACD_SIGNAL}
+
+
+def calculate_indicators(df):
+    """Calculates SMA, RSI, and MACD using pandas."""
+    df['SMA_50'] = df['close_price'].rolling(window=50).mean()
+    df['SMA_200'] = df['close_price'].rolling(window=200).mean()
+
+    delta = df['close_price'].diff()
+    gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
+    rs = gain / loss
+    df['RSI_14'] = 100 - (100 / (1 + rs))
+
+    exp12 = df['close_price'].ewm(span=12, adjust=False).mean()
+    exp26 = df['close_price'].ewm(span=26, adjust=False).mean()
+    df['MACD_12_26_9'] = exp12 - exp26
+    df['MACDs_12_26_9'] = df['MACD_12_26_9'].ewm(span=9, adjust=False).mean()
+
+    return df
+
+# --- Vectorized cross-sectional engine ---
+#
+# Prices are laid out as a (bar x stock) matrix: column j holds stock j's
+# closes in date order, right-aligned so every stock's latest bar sits in the
+# last row and shorter histories are padded with leading NaN. Aligning on
+# each stock's own bar number rather than on calendar date keeps every
+# rolling window identical to the per-stock path, even for stocks with
+# missing days or a late listing. A matching matrix of dates maps cells back.
+#
+# Every recursion below also returns its state after the last row, so the
+# same code can later resume from persisted state on just the new bars.
+
+def build_bar_matrix(prices: pd.DataFrame):
+    """
+    Pivots long price rows into bar x stock matrices.
+
+    Args:
+        prices (pd.DataFrame): Columns 'stock_id', 'date', 'close_price',
+                               sorted by stock_id and date.
+
+    Returns:
+        tuple: (closes, dates, stock_ids, lengths) where closes is a float64
+               (bars x stocks) array, dates the matching datetime64 array,
+               stock_ids the column labels and lengths the bars per stock.
+    """
+    stock_ids, col = np.unique(prices['stock_id'].to_numpy(), return_inverse=True)
+    lengths = np.bincount(col, minlength=len(stock_ids))
+    n_bars = int(lengths.max()) if len(lengths) else 0
+    position = prices.groupby('stock_id', sort=False).cumcount().to_numpy()
+    bar = n_bars - lengths[col] + position
+
+    closes = np.full((n_bars, len(stock_ids)), np.nan)
+    closes[bar, col] = prices['close_price'].to_numpy(dtype='float64')
+    dates = np.full((n_bars, len(stock_ids)), np.datetime64('NaT'), dtype='datetime64[ns]')
+    dates[bar, col] = pd.to_datetime(prices['date']).to_numpy()
+    return closes, dates, stock_ids, lengths
+
+def rolling_mean_step(x: np.ndarray, window: int, state: dict = None, history: np.ndarray = None):
+    """
+    Trailing rolling mean along axis 0 (NaN until the window fills), matching
+    pandas' rolling(window).mean() on each column.
+
+    Args:
+        x (np.ndarray): (bars x stocks) values.
+        window (int): Window length.
+        state (dict, optional): Accumulators returned by a previous call.
+        history (np.ndarray, optional): The last `window` values seen by that
+              call, oldest first; required together with `state`.
+
+    Returns:
+        tuple: (means, state) with means shaped like x.
+    """
+    # A running sum that adds the newest bar and removes the one leaving the
+    # window, with the same Kahan compensation and special cases as pandas.
+    # A plain cumsum difference drifts by ~1e-11, which is enough to flip
+    # the NUMERIC(10, 2) rounding of a fraction of stored values.
+    n_bars, n_stocks = x.shape
+    if state is None:
+        state = {field: np.zeros(n_stocks) for field in ROLLING_FIELDS}
+        state['prev'] = x[0].copy() if n_bars else np.full(n_stocks, np.nan)
+        history = np.empty((0, n_stocks))
+    else:
+        state = {field: values.copy() for field, values in state.items()}
+
+    values = np.vstack([history, x])
+    offset = len(history)
+    out = np.full_like(x, np.nan)
+
+    sum_x, comp_add, comp_remove = state['sum'], state['comp_add'], state['comp_remove']
+    nobs, neg_ct, same_run, prev = state['nobs'], state['neg_ct'], state['same_run'], state['prev']
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for t in range(offset, len(values)):
+            if t >= window:
+                val = values[t - window]
+                obs = val == val
+                y = -val - comp_remove
+                total = sum_x + y
+                comp_remove = np.where(obs, total - sum_x - y, comp_remove)
+                sum_x = np.where(obs, total, sum_x)
+                nobs = nobs - obs
+                neg_ct = neg_ct - (obs & np.signbit(val))
+
+            val = values[t]
+            obs = val == val
+            y = val - comp_add
+            total = sum_x + y
+            comp_add = np.where(obs, total - sum_x - y, comp_add)
+            sum_x = np.where(obs, total, sum_x)
+            nobs = nobs + obs
+            neg_ct = neg_ct + (obs & np.signbit(val))
+            same_run = np.where(obs, np.where(val == prev, same_run + 1, 1), same_run)
+            prev = np.where(obs, val, prev)
+
+            mean = sum_x / nobs
+            mean = np.where(same_run >= nobs, prev, mean)
+            mean = np.where((neg_ct == 0) & (mean < 0), 0.0, mean)
+            mean = np.where((neg_ct == nobs) & (mean > 0), 0.0, mean)
+            out[t - offset] = np.where(nobs >= window, mean, np.nan)
+
+    state = {
+        'sum': sum_x, 'comp_add': comp_add, 'comp_remove': comp_remove,
+        'nobs': nobs, 'neg_ct': neg_ct, 'same_run': same_run, 'prev': prev,
+    }
+    return out, state
+
+def rolling_mean(x: np.ndarray, window: int) -> np.ndarray:
+    """Stateless convenience wrapper around rolling_mean_step."""
+    return rolling_mean_step(x, window)[0]
+
+def ewm_mean(x: np.ndarray, span: int, weighted: np.ndarray = None) -> np.ndarray:
+    """
+    Recursive exponential moving average along axis 0, matching
+    pandas' ewm(span=span, adjust=False).mean() on each column.
+
+    Args:
+        x (np.ndarray): (bars x stocks) values.
+        span (int): EWM span.
+        weighted (np.ndarray, optional): The previous average per column, to
+              resume a recursion; its final value is simply the last row.
+    """
+    # Same alpha and update formula as the pandas implementation, so the
+    # recursion produces the same floating point values.
+    com = (span - 1) / 2.0
+    alpha = 1.0 / (1.0 + com)
+    old_wt = 1.0 - alpha
+
+    out = np.empty_like(x)
+    if weighted is None:
+        weighted = np.full(x.shape[1], np.nan)
+    for t in range(len(x)):
+        cur = x[t]
+        updated = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+        weighted = np.where(weighted != cur, updated, weighted)
+        # The first observation of a column (leading NaN padding) seeds it.
+        weighted = np.where(np.isnan(weighted), cur, weighted)
+        out[t] = weighted
+    return out
+
+def _gains_losses(closes: np.ndarray, previous_close: np.ndarray = None):
+    delta = np.full_like(closes, np.nan)
+    delta[1:] = np.diff(closes, axis=0)
+    if previous_close is not None:
+        delta[0] = closes[0] - previous_close
+    # NaN deltas count as zero gain/loss, like Series.where(cond, 0), but
+    # padding rows before a stock's first bar stay missing.
+    padding = np.isnan(closes)
+    gain = np.where(padding, np.nan, np.where(delta > 0, delta, 0.0))
+    loss = np.where(padding, np.nan, np.where(delta < 0, -delta, 0.0))
+    return gain, loss
+
+def _rsi(gain_mean: np.ndarray, loss_mean: np.ndarray) -> np.ndarray:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = gain_mean / loss_mean
+        return 100 - (100 / (1 + rs))
+
+def rsi(x: np.ndarray, window: int = RSI_WINDOW) -> np.ndarray:
+    """Simple-moving-average RSI along axis 0, as in calculate_indicators."""
+    gain, loss = _gains_losses(x)
+    return _rsi(rolling_mean(gain, window), rolling_mean(loss, window))
+
+def compute_indicator_matrices(closes: np.ndarray, state: dict = None):
+    """
+    Computes every indicator for every stock in one pass.
+
+    Args:
+        closes (np.ndarray): (bars x stocks) closes.
+        state (dict, optional): Engine state from a previous call (see
+              advance_indicator_state). When given, `closes` must only hold
+              the bars that came after it, with no padding.
+
+    Returns:
+        tuple: ({indicator name: (bars x stocks) array}, state after the last row).
+    """
+    if state is None:
+        close_history = np.empty((0, closes.shape[1]))
+        gain_history = loss_history = close_history
+        previous_close = None
+        rolling = {name: (None, None) for name in ROLLING_WINDOWS}
+        ewm = {name: None for name in EWM_SPANS}
+    else:
+        close_history = state['closes']
+        gain_history, loss_history = state['gains'], state['losses']
+        previous_close = close_history[-1]
+        rolling = {
+            'sma_50': (state['sma_50'], close_history[-50:]),
+            'sma_200': (state['sma_200'], close_history[-200:]),
+            'gain': (state['gain'], gain_history),
+            'loss': (state['loss'], loss_history),
+        }
+        ewm = {name: state[name] for name in EWM_SPANS}
+
+    sma_50, sma_50_state = rolling_mean_step(closes, 50, *rolling['sma_50'])
+    sma_200, sma_200_state = rolling_mean_step(closes, 200, *rolling['sma_200'])
+
+    gain, loss = _gains_losses(closes, previous_close)
+    gain_mean, gain_state = rolling_mean_step(gain, RSI_WINDOW, *rolling['gain'])
+    loss_mean, loss_state = rolling_mean_step(loss, RSI_WINDOW, *rolling['loss'])
+
+    fast = ewm_mean(closes, MACD_FAST, ewm['ema_12'])
+    slow = ewm_mean(closes, MACD_SLOW, ewm['ema_26'])
+    macd = fast - slow
+    signal = ewm_mean(macd, MACD_SIGNAL, ewm['macd_signal'])
+
+    indicators = {
+        'SMA_50': sma_50,
+        'SMA_200': sma_200,
+        'RSI_14': _rsi(gain_mean, loss_mean),
+        'MACD_12_26_9': macd,
+        'MACDs_12_26_9': signal,
+    }
+    new_state = {
+        'closes': np.vstack([close_history, closes])[-MIN_HISTORY:],
+        'gains': np.vstack([gain_history, gain])[-RSI_WINDOW:],
+        'losses': np.vstack([loss_history, loss])[-RSI_WINDOW:],
+        'sma_50': sma_50_state,
+        'sma_200': sma_200_state,
+        'gain': gain_state,
+        'loss': loss_state,
+        'ema_12': fast[-1] if len(fast) else ewm['ema_12'],
+        'ema_26': slow[-1] if len(slow) else ewm['ema_26'],
+        'macd_signal': signal[-1] if len(signal) else ewm['macd_signal'],
+    }
+    return indicators, new_state
+
+def _empty_feature_rows() -> pd.DataFrame:
+    return pd.DataFrame(columns=['stock_id', 'date'] + list(INDICATOR_COLUMNS.values()))
+
+def _feature_rows(indicators: dict, dates: np.ndarray, stock_ids: np.ndarray, valid: np.ndarray) -> pd.DataFrame:
+    """Gathers the valid cells of the indicator matrices into long feature rows."""
+    columns = ['stock_id', 'date'] + list(INDICATOR_COLUMNS.values())
+    for values in indicators.values():
+        valid = valid & ~np.isnan(values)
+
+    # Transpose so the boolean gather comes out stock-major, date-minor.
+    mask = valid.T
+    frame = {
+        'stock_id': np.broadcast_to(stock_ids[:, None], mask.shape)[mask],
+        'date': dates.T[mask],
+    }
+    for name, column in INDICATOR_COLUMNS.items():
+        frame[column] = indicators[name].T[mask]
+    return pd.DataFrame(frame, columns=columns)
+
+def compute_features(prices: pd.DataFrame, return_state: bool = False):
+    """
+    Vectorized equivalent of running calculate_indicators + dropna on every
+    stock separately.
+
+    Args:
+        prices (pd.DataFrame): Columns 'stock_id', 'date', 'close_price',
+                               sorted by stock_id and date.
+        return_state (bool): Also return the engine state after each stock's
+                             latest bar, for stocks with at least MIN_HISTORY bars.
+
+    Returns:
+        pd.DataFrame: Feature rows with columns stock_id, date, sma_50,
+                      sma_200, rsi_14, macd_value, macd_signal, ordered by
+                      stock_id and date. With return_state, a (features, state) tuple.
+    """
+    if prices.empty:
+        features = _empty_feature_rows()
+        return (features, None) if return_state else features
+
+    closes, dates, stock_ids, lengths = build_bar_matrix(prices)
+    indicators, state = compute_indicator_matrices(closes)
+
+    bars = np.arange(closes.shape[0])[:, None]
+    eligible = lengths >= MIN_HISTORY
+    valid = (bars >= closes.shape[0] - lengths[None, :]) & eligible[None, :]
+    features = _feature_rows(indicators, dates, stock_ids, valid)
+    if not return_state:
+        return features
+
+    state['stock_id'] = stock_ids
+    state['last_date'] = dates[-1]
+    return features, select_state(state, np.flatnonzero(eligible))
+
+def advance_features(state: dict, new_prices: pd.DataFrame):
+    """
+    Advances persisted engine state by only the bars that arrived after it.
+
+    Args:
+        state (dict): Stacked engine state (see compute_features(return_state=True)).
+        new_prices (pd.DataFrame): Columns 'stock_id', 'date', 'close_price'
+              for bars after each stock's state['last_date'], sorted by stock and date.
+
+    Returns:
+        tuple: (feature rows for the new bars, updated state for the advanced stocks).
+    """
+    columns = {stock_id: j for j, stock_id in enumerate(state['stock_id'])}
+    counts = new_prices.groupby('stock_id', sort=True).size()
+
+    features, states = [], []
+    # Stocks with the same number of new bars advance together as one dense
+    # matrix (normally every stock has exactly one new bar).
+    for n_new, group in counts.groupby(counts):
+        group_ids = group.index.to_numpy()
+        group_prices = new_prices[new_prices['stock_id'].isin(group_ids)]
+        closes, dates, stock_ids, _ = build_bar_matrix(group_prices)
+        sub_state = select_state(state, [columns[stock_id] for stock_id in stock_ids])
+
+        indicators, advanced = compute_indicator_matrices(closes, sub_state)
+        advanced['stock_id'] = stock_ids
+        advanced['last_date'] = dates[-1]
+        features.append(_feature_rows(indicators, dates, stock_ids, np.ones(closes.shape, dtype=bool)))
+        states.append(advanced)
+
+    if not states:
+        return _empty_feature_rows(), None
+    features = pd.concat(features, ignore_index=True).sort_values(['stock_id', 'date'], ignore_index=True)
+    return features, concat_states(states)
+
+def select_state(state: dict, columns) -> dict:
+    """Returns the engine state restricted to the given stock columns."""
+    columns = np.asarray(columns, dtype='int64')
+    selected = {}
+    for key, value in state.items():
+        if isinstance(value, dict):
+            selected[key] = {field: arr[columns] for field, arr in value.items()}
+        elif value.ndim == 2:
+            selected[key] = value[:, columns]
+        else:
+            selected[key] = value[columns]
+    return selected
+
+def concat_states(states: list) -> dict:
+    """Joins several engine states side by side (stock columns appended)."""
+    merged = {}
+    for key, value in states[0].items():
+        if isinstance(value, dict):
+            merged[key] = {field: np.concatenate([s[key][field] for s in states]) for field in value}
+        elif value.ndim == 2:
+            merged[key] = np.hstack([s[key] for s in states])
+        else:
+            merged[key] = np.concatenate([s[key] for s in states])
+    return merged
@@ -1,11 +1,28 @@
 # src/niftron/processing/main.py
 
-import pandas as pd
+import datetime
 import traceback
-# We will use executemany, not execute_batch
-from psycopg2.extras import execute_values
+from functools import partial
+
+import numpy as np
+import pandas as pd
 
+from niftron.core.bulk import copy_upsert
+from niftron.core.config import settings
 from niftron.core.db import get_db_connection
+from niftron.core.metrics import span
+from niftron.core.profiling import profiled
+from niftron.core.parallel import run_sharded
+from niftron.data_access.features import prune_data_changes, record_data_change
+# calculate_indicators stays importable from here as the per-stock reference.
+from niftron.processing.indicators import (
+    MIN_HISTORY, advance_features, calculate_indicators, compute_features, select_state
+)
+from niftron.processing.state import (
+    due_for_full_recompute, load_feature_state, load_new_close_prices, store_feature_state
+)
+
+FEATURE_COLUMNS = ['stock_id', 'date', 'sma_50', 'sma_200', 'rsi_14', 'macd_value', 'macd_signal']
 
 def get_stocks_to_process():
     """Fetches all stock IDs from the database."""
@@ -18,102 +35,185 @@ def get_stocks_to_process():
     print(f"Found {len(stocks)} stocks to process.")
     return stocks
 
-def calculate_indicators(df):
-    """Calculates SMA, RSI, and MACD using pandas."""
-    df['SMA_50'] = df['close_price'].rolling(window=50).mean()
-    df['SMA_200'] = df['close_price'].rolling(window=200).mean()
-
-    delta = df['close_price'].diff()
-    gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-    rs = gain / loss
-    df['RSI_14'] = 100 - (100 / (1 + rs))
-
-    exp12 = df['close_price'].ewm(span=12, adjust=False).mean()
-    exp26 = df['close_price'].ewm(span=26, adjust=False).mean()
-    df['MACD_12_26_9'] = exp12 - exp26
-    df['MACDs_12_26_9'] = df['MACD_12_26_9'].ewm(span=9, adjust=False).mean()
-    
-    return df
-
-def calculate_and_store_features():
+def load_close_prices(conn, stock_ids=None) -> pd.DataFrame:
+    """Loads close prices for all (or the given) stocks in a single query, ordered by stock and date."""
+    query = """
+        SELECT stock_id, date, close_price
+        FROM daily_price_data
+        {where}
+        ORDER BY stock_id, date ASC;
     """
-    Calculates technical indicators for each stock and stores them in the 'features' table.
+    if stock_ids is None:
+        return pd.read_sql(query.format(where=""), conn)
+    return pd.read_sql(query.format(where="WHERE stock_id = ANY(%s)"), conn, params=(list(stock_ids),))
+
+def store_features(conn, feature_rows: pd.DataFrame, commit: bool = True) -> int:
+    """Upserts feature rows (FEATURE_COLUMNS) with a COPY-based bulk merge."""
+    stored = copy_upsert(
+        conn, feature_rows, 'features', FEATURE_COLUMNS,
+        conflict_columns=['stock_id', 'date'],
+        update_columns=FEATURE_COLUMNS[2:],
+    )
+    if stored:
+        record_data_change(conn, 'features', pd.Timestamp(feature_rows['date'].min()).date())
+    if commit:
+        conn.commit()
+    return stored
+
+def _report_short_histories(prices: pd.DataFrame, symbols: dict):
+    history = prices.groupby('stock_id').size()
+    for stock_id, rows in history[history < MIN_HISTORY].items():
+        print(f"Not enough data for {symbols.get(stock_id, stock_id)} (found {rows} rows). Skipping.")
+
+def _process_stocks(conn, symbols: dict, mode: str, today: datetime.date, summary: dict) -> None:
+    """Calculates and stores the features of the given {stock_id: symbol} on conn, updating summary."""
+    state = load_feature_state(conn, list(symbols)) if mode == "incremental" else None
+    incremental_ids = []
+    if state is not None:
+        due = due_for_full_recompute(state, settings.FEATURES_FULL_RECOMPUTE_DAYS, today)
+        state = select_state(state, np.flatnonzero(~due))
+        incremental_ids = state['stock_id'].tolist()
+    advancing = set(incremental_ids)
+    full_ids = [stock_id for stock_id in symbols if stock_id not in advancing]
+
+    # --- Incremental: advance persisted state through the new bars only ---
+    if incremental_ids:
+        with span('processing.load_prices', mode='incremental', stocks=len(incremental_ids)) as timer:
+            new_prices = load_new_close_prices(conn, incremental_ids)
+            timer.rows = len(new_prices)
+        with span('processing.indicators', mode='incremental', stocks=len(incremental_ids)) as timer:
+            features, advanced = advance_features(state, new_prices)
+            timer.rows = len(features)
+        if advanced is not None:
+            recompute_dates = dict(zip(state['stock_id'], state['full_recompute_at']))
+            advanced['full_recompute_at'] = np.array(
+                [recompute_dates[stock_id] for stock_id in advanced['stock_id']], dtype='datetime64[ns]'
+            )
+            with span('processing.db_write', mode='incremental', stocks=len(incremental_ids)) as timer:
+                timer.rows = store_features(conn, features, commit=False)
+                store_feature_state(conn, advanced)
+                conn.commit()
+            summary['rows'] += timer.rows
+        summary['incremental'] += len(incremental_ids)
+
+    # --- Full recompute for new, stale or all stocks ---
+    if full_ids:
+        with span('processing.load_prices', mode='full', stocks=len(full_ids)) as timer:
+            prices = load_close_prices(conn, full_ids)
+            timer.rows = len(prices)
+        with span('processing.indicators', mode='full', stocks=len(full_ids)) as timer:
+            features, full_state = compute_features(prices, return_state=True)
+            timer.rows = len(features)
+        _report_short_histories(prices, symbols)
+
+        if not features.empty:
+            with span('processing.db_write', mode='full', stocks=len(full_ids)) as timer:
+                timer.rows = store_features(conn, features, commit=False)
+                if full_state is not None and len(full_state['stock_id']):
+                    full_state['full_recompute_at'] = np.full(
+                        len(full_state['stock_id']), np.datetime64(today, 'ns')
+                    )
+                    store_feature_state(conn, full_state)
+                conn.commit()
+            summary['rows'] += timer.rows
+        summary['full'] += len(full_ids)
+
+def process_feature_shard(stocks, mode: str, today: datetime.date) -> dict:
     """
-    stocks = get_stocks_to_process()
-    
+    Calculates and stores features for one shard of [(stock_id, symbol), ...]
+    on its own database connection. Runs inside a worker process.
+
+    The shard is computed in one vectorized pass. If that fails, its stocks
+    are retried one at a time so a single stock with bad data is skipped
+    (and reported) instead of failing the rest of the shard.
+
+    Returns:
+        dict: Compact counts for the shard ('incremental', 'full', 'rows')
+              and the symbols that failed ('failed').
+    """
+    symbols = dict(stocks)
+    summary = {'incremental': 0, 'full': 0, 'rows': 0, 'failed': []}
+
     with get_db_connection() as conn:
-        for stock_id, symbol in stocks:
+        try:
+            _process_stocks(conn, symbols, mode, today, summary)
+            return summary
+        except Exception:
+            conn.rollback()
+            print(f"!!! Feature shard of {len(symbols)} stocks failed; retrying them one at a time !!!")
+            traceback.print_exc()
+
+        # Stocks committed before the failure are picked up again harmlessly:
+        # their persisted state already covers the bars they stored.
+        summary = {'incremental': 0, 'full': 0, 'rows': 0, 'failed': []}
+        for stock_id, symbol in symbols.items():
             try:
-                print(f"--- Processing features for {symbol} (ID: {stock_id}) ---")
-
-                query = """
-                    SELECT date, close_price
-                    FROM daily_price_data
-                    WHERE stock_id = %s
-                    ORDER BY date ASC;
-                """
-                df = pd.read_sql(query, conn, params=(stock_id,), index_col='date')
-                
-                if df.empty or len(df) < 200:
-                    print(f"Not enough data for {symbol} (found {len(df)} rows). Skipping.")
-                    continue
-
-                df = calculate_indicators(df)
-                df.dropna(inplace=True)
-
-                if df.empty:
-                    print(f"Could not calculate features for {symbol}. Skipping.")
-                    continue
-
-                print(f"Calculated {len(df)} rows of features for {symbol}.")
-                
-                insert_data = []
-                for index_date, row in df.iterrows():
-                    # --- THE FIX IS HERE ---
-                    # Convert all NumPy numeric types to standard Python floats
-                    insert_data.append((
-                        stock_id,
-                        index_date,
-                        float(row['SMA_50']),
-                        float(row['SMA_200']),
-                        float(row['RSI_14']),
-                        float(row['MACD_12_26_9']),
-                        float(row['MACDs_12_26_9'])
-                    ))
-                    # --- END OF FIX ---
-
-                if insert_data:
-                    insert_query = """
-                        INSERT INTO features (
-                            stock_id, date, sma_50, sma_200, rsi_14,
-                            macd_value, macd_signal
-                        ) VALUES %s
-                        ON CONFLICT (stock_id, date) DO UPDATE SET
-                            sma_50 = EXCLUDED.sma_50,
-                            sma_200 = EXCLUDED.sma_200,
-                            rsi_14 = EXCLUDED.rsi_14,
-                            macd_value = EXCLUDED.macd_value,
-                            macd_signal = EXCLUDED.macd_signal;
-                    """
-                    with conn.cursor() as cur:
-                        # Use execute_values for efficient bulk insert/update
-                        execute_values(cur, insert_query, insert_data)
-                    conn.commit()
-                    print(f"Successfully stored {len(insert_data)} feature records for {symbol}.")
-            
+                _process_stocks(conn, {stock_id: symbol}, mode, today, summary)
             except Exception:
                 print(f"!!! An error occurred while processing features for {symbol} !!!")
                 traceback.print_exc()
                 conn.rollback()
+                summary['failed'].append(symbol)
+
+    return summary
+
+def calculate_and_store_features(mode=None, workers=None):
+    """
+    Calculates technical indicators and stores them in the 'features' table.
+
+    In "incremental" mode, stocks with persisted indicator state only advance
+    through the bars that arrived since their last run. Stocks without state,
+    or whose last full recompute is older than FEATURES_FULL_RECOMPUTE_DAYS,
+    are recomputed from their whole history in one vectorized pass, which
+    also corrects any drift from revised historical prices. "full" mode
+    recomputes every stock.
 
+    The stock universe is split into shards that run on a process pool
+    (settings.PIPELINE_WORKERS), each with its own connection.
+
+    Args:
+        mode (str, optional): "incremental" or "full". Defaults to settings.FEATURES_MODE.
+        workers (int, optional): Worker processes. Defaults to settings.PIPELINE_WORKERS.
+    """
+    mode = mode or settings.FEATURES_MODE
+    stocks = get_stocks_to_process()
+    today = datetime.date.today()
+    print(f"Feature mode: {mode}")
+
+    sharded = run_sharded(
+        partial(process_feature_shard, mode=mode, today=today),
+        stocks, workers=workers, label="feature shards"
+    )
+    totals = {key: sum(result[key] for result in sharded.results) for key in ('incremental', 'full', 'rows')}
+    print(f"Advanced {totals['incremental']} stocks, recomputed {totals['full']}, "
+          f"stored {totals['rows']} feature records in {sharded.seconds:.1f}s.")
+    skipped = [symbol for result in sharded.results for symbol in result['failed']]
+    if skipped:
+        print(f"!!! Skipped {len(skipped)} stocks whose features could not be calculated: {', '.join(skipped)} !!!")
+
+    if sharded.errors:
+        failed = [symbol for error in sharded.errors for _, symbol in error.items]
+        print(f"!!! Feature calculation failed for {len(failed)} stocks: {', '.join(failed)} !!!")
+        raise RuntimeError(f"{len(sharded.errors)} feature shard(s) failed.")
+
+    # The dataset cache only looks at changes since it was last written,
+    # and rebuilds fully after DATASET_CACHE_FULL_REBUILD_DAYS anyway.
+    prune_data_changes(max(30, settings.DATASET_CACHE_FULL_REBUILD_DAYS * 2))
     print("\n--- Feature engineering complete! ---")
 
-def run():
-    """Entry point for Airflow to trigger the feature engineering process."""
+@profiled('processing')
+def run(mode=None):
+    """
+    Entry point for Airflow to trigger the feature engineering process.
+
+    Args:
+        mode (str, optional): "incremental" or "full". Defaults to settings.FEATURES_MODE.
+    """
     print("Starting Niftron Feature Engineering...")
-    calculate_and_store_features()
+    with span('processing', mode=mode or settings.FEATURES_MODE):
+        calculate_and_store_features(mode)
     print("Niftron Feature Engineering Finished.")
 
 if __name__ == "__main__":
-    run()
\ No newline at end of file
+    import sys
+    run("full" if "--full" in sys.argv else None)
\ No newline at end of file
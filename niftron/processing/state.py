@@ -0,0 +1,104 @@
+# niftron/processing/state.py
+
+import datetime
+import json
+
+import numpy as np
+import pandas as pd
+
+from niftron.core.bulk import copy_upsert
+from niftron.processing.indicators import EWM_SPANS, MIN_HISTORY, ROLLING_FIELDS, ROLLING_WINDOWS, RSI_WINDOW
+
+STATE_COLUMNS = [
+    'stock_id', 'last_date', 'closes', 'gains', 'losses',
+    'rolling_state', 'ema_12', 'ema_26', 'macd_signal', 'full_recompute_at'
+]
+
+
+def load_feature_state(conn, stock_ids=None) -> dict:
+    """
+    Loads the persisted indicator state of every (or the given) stock as one
+    stacked engine state (see niftron.processing.indicators), or None if
+    nothing is stored.
+    """
+    query = f"SELECT {', '.join(STATE_COLUMNS)} FROM feature_state"
+    params = None
+    if stock_ids is not None:
+        query += " WHERE stock_id = ANY(%s)"
+        params = ([int(s) for s in stock_ids],)
+    with conn.cursor() as cur:
+        cur.execute(query + " ORDER BY stock_id;", params)
+        rows = cur.fetchall()
+    if not rows:
+        return None
+
+    columns = dict(zip(STATE_COLUMNS, zip(*rows)))
+    state = {
+        'stock_id': np.array(columns['stock_id'], dtype='int64'),
+        'last_date': pd.to_datetime(list(columns['last_date'])).to_numpy(),
+        'full_recompute_at': pd.to_datetime(list(columns['full_recompute_at'])).to_numpy(),
+        # Buffers are stored oldest first per stock; the engine wants (bars x stocks).
+        'closes': np.array(columns['closes'], dtype='float64').T,
+        'gains': np.array(columns['gains'], dtype='float64').T,
+        'losses': np.array(columns['losses'], dtype='float64').T,
+    }
+    for name in EWM_SPANS:
+        state[name] = np.array(columns[name], dtype='float64')
+    for window in ROLLING_WINDOWS:
+        state[window] = {
+            field: np.array([rolling[window][field] for rolling in columns['rolling_state']], dtype='float64')
+            for field in ROLLING_FIELDS
+        }
+    return state
+
+def _array_literal(values: np.ndarray) -> str:
+    # repr() round-trips every float64 exactly through Postgres' float8 input.
+    return '{' + ','.join(repr(v) for v in values.tolist()) + '}'
+
+def store_feature_state(conn, state: dict) -> int:
+    """Upserts the stacked engine state, one row per stock. The caller commits."""
+    n_stocks = len(state['stock_id'])
+    if n_stocks == 0:
+        return 0
+    if state['closes'].shape[0] != MIN_HISTORY or state['gains'].shape[0] != RSI_WINDOW:
+        raise ValueError("Only stocks with a full indicator history can be persisted.")
+
+    rolling_state = [
+        json.dumps({
+            window: {field: float(state[window][field][j]) for field in ROLLING_FIELDS}
+            for window in ROLLING_WINDOWS
+        })
+        for j in range(n_stocks)
+    ]
+    rows = pd.DataFrame({
+        'stock_id': state['stock_id'],
+        'last_date': pd.DatetimeIndex(state['last_date']).normalize(),
+        'closes': [_array_literal(state['closes'][:, j]) for j in range(n_stocks)],
+        'gains': [_array_literal(state['gains'][:, j]) for j in range(n_stocks)],
+        'losses': [_array_literal(state['losses'][:, j]) for j in range(n_stocks)],
+        'rolling_state': rolling_state,
+        'ema_12': [repr(v) for v in state['ema_12'].tolist()],
+        'ema_26': [repr(v) for v in state['ema_26'].tolist()],
+        'macd_signal': [repr(v) for v in state['macd_signal'].tolist()],
+        'full_recompute_at': pd.DatetimeIndex(state['full_recompute_at']).normalize(),
+    })
+    return copy_upsert(
+        conn, rows, 'feature_state', STATE_COLUMNS,
+        conflict_columns=['stock_id'], update_columns=STATE_COLUMNS[1:],
+    )
+
+def load_new_close_prices(conn, stock_ids) -> pd.DataFrame:
+    """Loads the closes that arrived after each stock's persisted state, in one query."""
+    query = """
+        SELECT p.stock_id, p.date, p.close_price
+        FROM daily_price_data p
+        JOIN feature_state s ON s.stock_id = p.stock_id
+        WHERE p.date > s.last_date AND p.stock_id = ANY(%s)
+        ORDER BY p.stock_id, p.date ASC;
+    """
+    return pd.read_sql(query, conn, params=([int(s) for s in stock_ids],))
+
+def due_for_full_recompute(state: dict, max_age_days: int, today: datetime.date = None) -> np.ndarray:
+    """Boolean mask of stocks whose last full recompute is older than max_age_days."""
+    today = pd.Timestamp(today or datetime.date.today())
+    return state['full_recompute_at'] < (today - pd.Timedelta(days=max_age_days)).to_datetime64()
@@ -0,0 +1,107 @@
+# scripts/bench_startup.py
+
+import argparse
+import csv
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from dotenv import load_dotenv
+
+# --- Pathing ---
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+load_dotenv(os.path.join(project_root, '.env'))
+
+DEFAULT_TARGETS = [
+    'niftron.api.main',
+    'niftron.analysis.main',
+    'niftron.chatbot',
+    'dags/niftron_pipeline.py',
+]
+
+
+def _import_statement(target: str) -> str:
+    # A .py path is executed the way Airflow's DAG parser loads a DAG file.
+    if target.endswith('.py'):
+        return f"import runpy; runpy.run_path({os.path.join(project_root, target)!r})"
+    return f"import {target}"
+
+def measure(target: str) -> tuple:
+    """
+    Imports target in a fresh interpreter with -X importtime.
+
+    Returns:
+        (wall_seconds, {module: (self_us, cumulative_us, depth)})
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [project_root, os.environ.get('PYTHONPATH')])))
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', _import_statement(target)],
+                          cwd=project_root, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if proc.returncode != 0:
+        error = [line for line in proc.stderr.splitlines() if not line.startswith('import time:')]
+        raise RuntimeError(f"Importing {target} failed: {error[-1] if error else proc.returncode}")
+
+    modules = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return wall, modules
+
+def bench(target: str, repeat: int) -> tuple:
+    """Median wall time and median per-module timings over `repeat` cold imports."""
+    walls, samples = [], defaultdict(list)
+    for _ in range(repeat):
+        wall, modules = measure(target)
+        walls.append(wall)
+        for name, timing in modules.items():
+            samples[name].append(timing)
+    rows = []
+    for name, timings in samples.items():
+        rows.append({
+            'target': target,
+            'module': name,
+            'self_ms': statistics.median(t[0] for t in timings) / 1000,
+            'cumulative_ms': statistics.median(t[1] for t in timings) / 1000,
+            'depth': timings[0][2],
+        })
+    rows.sort(key=lambda row: row['cumulative_ms'], reverse=True)
+    return statistics.median(walls), rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures cold import (startup) time per module.")
+    parser.add_argument('targets', nargs='*', default=DEFAULT_TARGETS,
+                        help="Modules or .py files (relative to the repo) to import.")
+    parser.add_argument('--repeat', type=int, default=3, help="Cold imports per target; medians are reported.")
+    parser.add_argument('--top', type=int, default=15, help="Slowest modules to print per target.")
+    parser.add_argument('--output', help="Optional CSV with every module's timings.")
+    args = parser.parse_args()
+
+    all_rows = []
+    for target in args.targets:
+        try:
+            wall, rows = bench(target, args.repeat)
+        except RuntimeError as e:
+            print(f"!!! {e} !!!")
+            continue
+        all_rows.extend(rows)
+        print(f"\n=== {target}: {wall * 1000:.0f} ms wall, {len(rows)} modules imported ===")
+        print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+        for row in rows[:args.top]:
+            print(f"{row['cumulative_ms']:>14.1f} {row['self_ms']:>9.1f}  {'  ' * row['depth']}{row['module']}")
+
+    if args.output and all_rows:
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['target', 'module', 'self_ms', 'cumulative_ms', 'depth'])
+            writer.writeheader()
+            writer.writerows(all_rows)
+        print(f"\nSaved per-module timings to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,6 @@
 import sys
 import os
 import pandas as pd
-import joblib
 import matplotlib.pyplot as plt
 import seaborn as sns
 import json
@@ -13,33 +12,11 @@ project_root_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'
 sys.path.insert(0, project_root_path)
 
 from niftron.ml_model.data_prep import load_and_prepare_data
-from niftron.ml_model.predict import generate_lem_score
+from niftron.ml_model.predict import generate_lem_score, load_model
+from niftron.analysis.simulation import benchmark_returns, calculate_she_score, simulate
+from niftron.analysis.charts import drawdown_curves, equity_curves
 from scripts.sync_frontend_assets import sync_assets
 
-# --- Simulation Helper Functions ---
-
-def calculate_she_score(signals_df: pd.DataFrame) -> pd.DataFrame:
-    """Calculates the Simple Heuristic Ensemble score."""
-    weights = {'trend': 0.4, 'momentum': 0.3, 'macd': 0.3}
-    norm_trend = (signals_df['trend_signal'] + 1) * 50
-    score = (norm_trend * weights['trend'] + signals_df['momentum_score'] * weights['momentum'] + signals_df['macd_score'] * weights['macd'])
-    return pd.DataFrame({'she_score': score}, index=signals_df.index)
-
-def run_simulation_loop(oos_data: pd.DataFrame, score_column: str, portfolio_size: int = 5) -> pd.Series:
-    """Simulates a daily rebalancing strategy."""
-    daily_returns = {}
-    unique_dates = sorted(oos_data.index.get_level_values('date').unique())
-
-    for date in unique_dates:
-        day_data = oos_data.loc[date]
-        if not isinstance(day_data, pd.DataFrame) or len(day_data) < portfolio_size:
-            daily_returns[date] = 0
-            continue
-        top_stocks = day_data.nlargest(portfolio_size, score_column)
-        day_return = top_stocks['daily_return'].mean()
-        daily_returns[date] = day_return
-    return pd.Series(daily_returns).fillna(0)
-
 # --- Plotting and Data Generation Functions ---
 
 def save_chart_data_to_json(returns_df: pd.DataFrame, filename: str):
@@ -58,7 +35,7 @@ def save_chart_data_to_json(returns_df: pd.DataFrame, filename: str):
 def plot_equity_curve(returns_df: pd.DataFrame, filename: str):
     """Calculates and plots the cumulative returns (equity curve)."""
     print(f"Generating Equity Curve plot: {filename}")
-    cumulative_returns = (1 + returns_df).cumprod()
+    cumulative_returns = equity_curves(returns_df)
     
     plt.style.use('seaborn-v0_8-darkgrid')
     fig, ax = plt.subplots(figsize=(12, 7))
@@ -75,13 +52,11 @@ def plot_equity_curve(returns_df: pd.DataFrame, filename: str):
 def plot_drawdown_curves(returns_df: pd.DataFrame, filename: str):
     """Calculates and plots the drawdown for each strategy."""
     print(f"Generating Drawdown Curves plot: {filename}")
-    cumulative_returns = (1 + returns_df).cumprod()
-    peak = cumulative_returns.expanding(min_periods=1).max()
-    drawdown = (cumulative_returns / peak) - 1
+    drawdown_pct = drawdown_curves(returns_df)
     
     plt.style.use('seaborn-v0_8-darkgrid')
     fig, ax = plt.subplots(figsize=(12, 7))
-    (drawdown * 100).plot(ax=ax)
+    drawdown_pct.plot(ax=ax)
     ax.set_title('Strategy Drawdown from Peak Equity', fontsize=16)
     ax.set_ylabel('Drawdown (%)')
     ax.set_xlabel('Date')
@@ -126,11 +101,10 @@ def main():
     print(f"Generated assets will be temporarily saved in: {output_dir}")
 
     # 1. Load Model
-    model_path = os.path.join(project_root_path, 'niftron', 'ml_model', 'lem_model.joblib')
-    try:
-        lem_model = joblib.load(model_path)
-    except FileNotFoundError:
-        print(f"ERROR: Model file not found at {model_path}. Please run the training script first.")
+    # The registry's current version (or the packaged model).
+    lem_model = load_model()
+    if lem_model is None:
+        print("ERROR: No LEM model is available. Please run the training script first.")
         return
 
     # 2. Load and Prepare Data
@@ -143,14 +117,12 @@ def main():
     lem_scores = generate_lem_score(lem_model, oos_data)
     oos_data = pd.concat([oos_data, she_scores, lem_scores], axis=1)
 
-    lem_returns = run_simulation_loop(oos_data, 'lem_score')
-    she_returns = run_simulation_loop(oos_data, 'she_score')
-    benchmark_returns = oos_data.groupby('date')['daily_return'].mean().fillna(0)
+    daily_returns = simulate(oos_data, ['lem_score', 'she_score'])
     
     returns_df = pd.DataFrame({
-        'Learned Ensemble (LEM)': lem_returns,
-        'Simple Heuristic (SHE)': she_returns,
-        'NIFTY 50 Benchmark': benchmark_returns
+        'Learned Ensemble (LEM)': daily_returns['lem_score'],
+        'Simple Heuristic (SHE)': daily_returns['she_score'],
+        'NIFTY 50 Benchmark': benchmark_returns(oos_data)
     })
     
     # 4. Generate and Save All Artifacts
@@ -0,0 +1,120 @@
+# scripts/profile_synthetic.py
+
+import argparse
+import os
+import sys
+import time
+from contextlib import nullcontext
+
+import numpy as np
+import pandas as pd
+
+# --- Pathing ---
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+# Only modules that never touch core.config/core.db are imported, so this
+# runs without DATABASE_URL, Postgres, yfinance or Gemini.
+from niftron.analysis.performance import calculate_performance_metrics
+from niftron.analysis.simulation import benchmark_returns, calculate_she_score, simulate
+from niftron.analysis.strategies import macd_strategy, momentum_strategy, trend_strategy
+from niftron.core.profiling import profile, profiling_enabled
+from niftron.processing.indicators import compute_features
+
+FEATURE_COLUMNS = ['trend_signal', 'momentum_score', 'macd_score']
+STAGES = ['indicators', 'signals', 'train', 'inference', 'simulation']
+
+
+def make_prices(n_stocks: int, n_days: int, seed: int) -> pd.DataFrame:
+    """Geometric random-walk closes for n_stocks over n_days business days."""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2018-01-01', periods=n_days)
+    drift = rng.normal(0.0003, 0.0002, n_stocks)
+    vol = rng.uniform(0.01, 0.03, n_stocks)
+    log_returns = rng.normal(drift, vol, (n_days, n_stocks))
+    closes = 100 * np.exp(np.cumsum(log_returns, axis=0))
+    return pd.DataFrame({
+        'stock_id': np.repeat(np.arange(1, n_stocks + 1), n_days),
+        'date': np.tile(dates.values, n_stocks),
+        'close_price': closes.T.ravel().round(2),
+    })
+
+def add_signals_and_targets(features: pd.DataFrame, prices: pd.DataFrame,
+                            horizon: int = 10, threshold: float = 0.02) -> pd.DataFrame:
+    """The data_prep output shape: signals, target and daily_return per stock and day."""
+    df = features.merge(prices, on=['stock_id', 'date'])
+    df['symbol'] = 'SYN' + df['stock_id'].astype(str).str.zfill(4)
+    signals = pd.concat([
+        trend_strategy.generate_signals(df, group_by='symbol'),
+        momentum_strategy.generate_signals(df, group_by='symbol'),
+        macd_strategy.generate_signals(df, group_by='symbol'),
+    ], axis=1)
+    close = df.groupby('symbol')['close_price']
+    df = pd.concat([df[['symbol', 'date', 'close_price']], signals], axis=1)
+    df['future_return'] = close.shift(-horizon) / df['close_price'] - 1
+    df['target'] = (df['future_return'] > threshold).astype(int)
+    df['daily_return'] = close.shift(-1) / df['close_price'] - 1
+    df = df.dropna()
+    return df.set_index(pd.DatetimeIndex(pd.to_datetime(df.pop('date')), name='date'))
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Runs the CPU-heavy pipeline stages on a synthetic dataset, optionally profiled."
+    )
+    parser.add_argument('--stocks', type=int, default=200)
+    parser.add_argument('--days', type=int, default=1500)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES,
+                        help="Stages to profile (earlier stages still run to produce their inputs).")
+    parser.add_argument('--profile', action='store_true',
+                        help="Profile each selected stage (same as NIFTRON_PROFILE=1).")
+    args = parser.parse_args()
+    enabled = profiling_enabled()
+
+    def stage(name):
+        if enabled and name in args.stages:
+            return profile(f"synthetic_{name}")
+        return nullcontext()
+
+    timings = {}
+    def timed(name, func):
+        started = time.perf_counter()
+        with stage(name):
+            result = func()
+        timings[name] = time.perf_counter() - started
+        return result
+
+    prices = make_prices(args.stocks, args.days, args.seed)
+    print(f"Synthetic dataset: {args.stocks} stocks x {args.days} days = {len(prices)} bars.")
+
+    features = timed('indicators', lambda: compute_features(prices))
+    dataset = timed('signals', lambda: add_signals_and_targets(features, prices))
+
+    split = dataset.index.unique().sort_values()[int(dataset.index.nunique() * 0.7)]
+    train, oos = dataset[dataset.index < split], dataset[dataset.index >= split].copy()
+
+    def fit():
+        from sklearn.ensemble import GradientBoostingClassifier
+        return GradientBoostingClassifier(n_estimators=100, max_depth=3, random_state=42).fit(
+            train[FEATURE_COLUMNS], train['target'])
+    model = timed('train', fit)
+
+    def infer():
+        oos['lem_score'] = model.predict_proba(oos[FEATURE_COLUMNS])[:, 1] * 100
+        oos['she_score'] = calculate_she_score(oos)['she_score']
+    timed('inference', infer)
+
+    def backtest():
+        daily = simulate(oos, ['lem_score', 'she_score'])
+        benchmark = benchmark_returns(oos)
+        return {column: calculate_performance_metrics(daily[column], benchmark) for column in daily}
+    metrics = timed('simulation', backtest)
+
+    print("\n--- Stage wall times ---")
+    for name, seconds in timings.items():
+        print(f"{name:>12}: {seconds:8.3f}s")
+    for name, values in metrics.items():
+        print(f"{name}: CAGR {values['CAGR (%)']:.2f}%, Sharpe {values['Sharpe Ratio']:.2f}")
+
+if __name__ == "__main__":
+    main()
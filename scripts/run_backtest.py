@@ -3,7 +3,6 @@
 import sys
 import os
 import pandas as pd
-import joblib
 import scipy.stats as stats
 from dotenv import load_dotenv
 
@@ -14,40 +13,13 @@ load_dotenv(os.path.join(project_root, '.env'))
 
 # --- Imports ---
 from niftron.ml_model.data_prep import load_and_prepare_data
-from niftron.ml_model.predict import generate_lem_score
+from niftron.ml_model.predict import generate_lem_score, load_model
 # Import our new performance metrics calculator
 from niftron.analysis.performance import calculate_performance_metrics
+from niftron.analysis.simulation import benchmark_returns, calculate_she_score, simulate
+from niftron.core.profiling import profiled
 
-def calculate_she_score(signals_df: pd.DataFrame) -> pd.DataFrame:
-    """Calculates the Simple Heuristic Ensemble score."""
-    weights = {'trend': 0.4, 'momentum': 0.3, 'macd': 0.3}
-    norm_trend = (signals_df['trend_signal'] + 1) * 50
-    score = (norm_trend * weights['trend'] + signals_df['momentum_score'] * weights['momentum'] + signals_df['macd_score'] * weights['macd'])
-    return pd.DataFrame({'she_score': score}, index=signals_df.index)
-
-def run_simulation_loop(oos_data: pd.DataFrame, score_column: str, portfolio_size: int = 5, rebalance_period: int = 1) -> pd.Series:
-    """
-    Simulates a daily rebalancing strategy.
-    """
-    daily_returns = {}
-    unique_dates = sorted(oos_data.index.get_level_values('date').unique())
-
-    for date in unique_dates:
-        # We make a new decision every day (rebalance_period = 1)
-        day_data = oos_data.loc[date]
-        
-        if not isinstance(day_data, pd.DataFrame) or len(day_data) < portfolio_size:
-            daily_returns[date] = 0
-            continue
-            
-        top_stocks = day_data.nlargest(portfolio_size, score_column)
-        
-        # The portfolio's return for today is the average of the 'daily_return' of the stocks we chose
-        day_return = top_stocks['daily_return'].mean()
-        daily_returns[date] = day_return
-
-    return pd.Series(daily_returns).fillna(0)
-
+@profiled('backtest')
 def run_backtest():
     """
     Main function to run the backtesting simulation and print results for all strategies.
@@ -55,12 +27,10 @@ def run_backtest():
     print("--- Starting Backtest Simulation ---")
 
     # --- Setup and Data Loading ---
-    model_path = os.path.join(project_root, 'niftron', 'ml_model', 'lem_model.joblib')
-    try:
-        lem_model = joblib.load(model_path)
-        print("LEM model loaded successfully.")
-    except FileNotFoundError:
-        print(f"FATAL ERROR: Model file not found at {model_path}. Run training script.")
+    # The registry's current version (or the packaged model).
+    lem_model = load_model()
+    if lem_model is None:
+        print("FATAL ERROR: No LEM model is available. Run training script.")
         return
 
     full_dataset = load_and_prepare_data()
@@ -78,17 +48,16 @@ def run_backtest():
 
     # --- Run Simulations for ALL Strategies ---
     print("\nRunning simulations...")
-    # Ensembled Strategies
-    she_daily_returns = run_simulation_loop(oos_data, 'she_score')
-    lem_daily_returns = run_simulation_loop(oos_data, 'lem_score')
-    
-    # Base Strategies
-    trend_daily_returns = run_simulation_loop(oos_data, 'trend_signal')
-    momentum_daily_returns = run_simulation_loop(oos_data, 'momentum_score')
-    macd_daily_returns = run_simulation_loop(oos_data, 'macd_score')
+    # Ensembled and base strategies in one pass over the date x stock matrices
+    daily_returns = simulate(oos_data, ['she_score', 'lem_score', 'trend_signal', 'momentum_score', 'macd_score'])
+    she_daily_returns = daily_returns['she_score']
+    lem_daily_returns = daily_returns['lem_score']
+    trend_daily_returns = daily_returns['trend_signal']
+    momentum_daily_returns = daily_returns['momentum_score']
+    macd_daily_returns = daily_returns['macd_score']
     
     # Benchmark
-    benchmark_daily_returns = oos_data.groupby('date')['daily_return'].mean().fillna(0)
+    benchmark_daily_returns = benchmark_returns(oos_data)
     print("Simulations complete.")
 
     # --- Display Performance Results ---
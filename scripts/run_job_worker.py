@@ -0,0 +1,28 @@
+# scripts/run_job_worker.py
+
+import argparse
+import os
+import sys
+
+from dotenv import load_dotenv
+
+# --- Pathing ---
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+load_dotenv(os.path.join(project_root, '.env'))
+
+from niftron.core.jobs import JOB_HANDLERS, run_worker
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Runs background jobs queued by the API (JOB_EXECUTOR=queue)."
+    )
+    parser.add_argument('--kinds', nargs='+', choices=sorted(JOB_HANDLERS), help="Job kinds to run (default: all).")
+    parser.add_argument('--poll-seconds', type=float, default=5.0, help="Sleep between polls of an empty queue.")
+    parser.add_argument('--once', action='store_true', help="Exit once the queue is empty.")
+    args = parser.parse_args()
+    run_worker(args.kinds, poll_seconds=args.poll_seconds, once=args.once)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# scripts/run_sweep.py
+
+import argparse
+import os
+import sys
+
+from dotenv import load_dotenv
+
+# --- Pathing ---
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+load_dotenv(os.path.join(project_root, '.env'))
+
+# --- Imports ---
+from niftron.ml_model.data_prep import load_and_prepare_data
+from niftron.ml_model.predict import generate_lem_score, load_model
+from niftron.analysis.sweep import build_grid, run_sweep
+
+
+def _weights(value: str):
+    weights = tuple(float(w) for w in value.split(','))
+    if len(weights) != 3:
+        raise argparse.ArgumentTypeError("SHE weights are 'trend,momentum,macd', e.g. 0.4,0.3,0.3")
+    return weights
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Backtests every combination of the given parameters.")
+    parser.add_argument('--scores', nargs='+', default=['she', 'lem'],
+                        choices=['she', 'lem', 'trend', 'momentum', 'macd'])
+    parser.add_argument('--portfolio-sizes', nargs='+', type=int, default=[5])
+    parser.add_argument('--rebalance-periods', nargs='+', type=int, default=[1])
+    parser.add_argument('--oos-starts', nargs='+', default=['2023-01-01'])
+    parser.add_argument('--she-weights', nargs='+', type=_weights, default=None,
+                        help="One or more 'trend,momentum,macd' triples.")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', default=os.path.join(project_root, 'artifacts', 'sweep_results.csv'),
+                        help="Results CSV (default: artifacts/sweep_results.csv). "
+                             "Pass a path under paper_figures/ to publish it.")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    print("--- Starting Parameter Sweep ---")
+
+    # The registry's current version (or the packaged model).
+    lem_model = load_model()
+    if lem_model is None:
+        print("FATAL ERROR: No LEM model is available. Run training script.")
+        return
+
+    # Loaded and scored once; every variant reuses the same matrices.
+    dataset = load_and_prepare_data()
+    dataset['lem_score'] = generate_lem_score(lem_model, dataset)['lem_score']
+
+    grid = build_grid(args.portfolio_sizes, args.rebalance_periods, args.oos_starts,
+                      args.she_weights, args.scores)
+    print(f"Evaluating {len(grid)} variants...")
+    results = run_sweep(dataset, grid, workers=args.workers)
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    results.to_csv(args.output, index=False)
+    print(f"Results saved to: {args.output}")
+    print(results.sort_values('Sharpe Ratio', ascending=False).head(10).round(2).to_string(index=False))
+    print("\n--- Parameter Sweep Finished ---")
+
+if __name__ == '__main__':
+    main()